@@ -5,15 +5,18 @@ This provides HTTP endpoints for the Java backend to send user feedback
 and receive adaptive parameter updates.
 """
 
-from flask import Flask, request, jsonify
-from model_core import (
+from flask import Flask, Response, request, jsonify, stream_with_context
+from feedback_api import (
     process_user_feedback_api,
     get_current_parameters, 
     get_feedback_statistics,
-    export_feedback_log,
+    get_persistence_stats,
+    stream_feedback_log,
     reset_parameters_to_default
 )
 import json
+import signal
+import sys
 
 app = Flask(__name__)
 
@@ -144,12 +147,13 @@ def export_log():
     """Export feedback log"""
     try:
         format_type = request.args.get('format', 'json')
-        log_data = export_feedback_log(format_type)
+        # Streamed entry by entry, so the response never holds the whole history
+        log_data = stream_with_context(stream_feedback_log(format_type))
         
         if format_type.lower() == 'csv':
-            return log_data, 200, {'Content-Type': 'text/csv'}
+            return Response(log_data, 200, {'Content-Type': 'text/csv'})
         else:
-            return log_data, 200, {'Content-Type': 'application/json'}
+            return Response(log_data, 200, {'Content-Type': 'application/json'})
             
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -286,7 +290,8 @@ def health_check():
             "service": "FlareNet Adaptive Feedback System",
             "version": "1.0.0",
             "current_threshold": params.get("percent_threshold", 50),
-            "parameters_loaded": len(params) > 0
+            "parameters_loaded": len(params) > 0,
+            "params_persistence": get_persistence_stats()
         }), 200
     except Exception as e:
         return jsonify({
@@ -370,5 +375,8 @@ if __name__ == '__main__':
     print("  GET  /api/docs - API documentation")
     print()
     
+    # Exit normally on SIGTERM so the atexit flush of pending parameters runs
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    
     # Run the Flask app
     app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
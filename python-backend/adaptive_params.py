@@ -1,7 +1,99 @@
+import atexit
+import copy
 import json
 import os
+import threading
+import time
 from typing import Dict, List, Tuple
 from datetime import datetime
+from file_utils import file_lock, write_json_atomic
+
+# Saves within this many seconds are coalesced into one file write (0 = write every save)
+FLUSH_INTERVAL = float(os.environ.get("FLARENET_PARAMS_FLUSH_INTERVAL", 0.5))
+# A failed flush is retried after at least this many seconds, even if nothing else saves
+FLUSH_RETRY_INTERVAL = float(os.environ.get("FLARENET_PARAMS_FLUSH_RETRY", 2.0))
+
+# Convert percent into k value in range [1.1, 2.1]
+def percent_to_k(percent):
+    # Clamp input between 0 and 100
+    percent = max(0, min(percent, 100))
+    # Map 0% → 1.1 (very sensitive), 100% → 2.1 (least sensitive)
+    return 1.1 + (percent / 100.0) * (2.1 - 1.1)
+
+def _first_level(predicate, levels: int = 256) -> int:
+    """Smallest 8-bit level satisfying a monotone predicate (levels if none)"""
+    return next((v for v in range(levels) if predicate(v)), levels)
+
+def _last_level(predicate, levels: int = 256) -> int:
+    """Largest 8-bit level satisfying a monotone predicate (-1 if none)"""
+    return next((v for v in reversed(range(levels)) if predicate(v)), -1)
+
+class ParamSnapshot:
+    """Immutable, versioned copy of one committed parameter set.
+
+    Besides the raw parameter dict it carries values derived once per version
+    so the classification hot path does no lookups or float conversions:
+        k            - percent_to_k(percent_threshold)
+        warm_cutoffs - warm-mask limits in OpenCV 8-bit units:
+                       warm if (H <= hue_max or H >= hue_min) and S >= sat_min and V >= val_min
+        color_bands  - inclusive integer hue ranges for red/orange/yellow plus
+                       the shared sat_min/val_min gate
+    The integer limits are found by evaluating the original float comparisons
+    at every 8-bit level, so they select exactly the same pixels.
+    Treat params and the sub-dicts as read-only; use as_dict() for a mutable copy.
+    """
+
+    __slots__ = ("version", "params", "percent_threshold", "min_area_factor", "k",
+                 "hsv_params", "color_params", "geom_params", "severity_params", "conf_params",
+                 "warm_cutoffs", "color_bands")
+
+    def __init__(self, version: int, params: Dict):
+        params = copy.deepcopy(params)
+        hsv = params.get("hsv_warm_thresholds", {})
+        color = params.get("color_classification", {})
+
+        values = {
+            "version": version,
+            "params": params,
+            "percent_threshold": params["percent_threshold"],
+            "min_area_factor": params["min_area_factor"],
+            "k": percent_to_k(params["percent_threshold"]),
+            "hsv_params": hsv,
+            "color_params": color,
+            "geom_params": params.get("geometric_rules", {}),
+            "severity_params": params.get("severity_rules", {}),
+            "conf_params": params.get("confidence_factors", {}),
+            "warm_cutoffs": {
+                "hue_max": _last_level(lambda h: h/180.0 <= hsv["hue_low"]),
+                "hue_min": _first_level(lambda h: h/180.0 >= hsv["hue_high"]),
+                "sat_min": _first_level(lambda v: v/255.0 >= hsv["saturation_min"]),
+                "val_min": _first_level(lambda v: v/255.0 >= hsv["value_min"]),
+            },
+            "color_bands": {
+                "red": [(0, _last_level(lambda h: h <= color["red_hue_max"])),
+                        (_first_level(lambda h: h >= color["red_hue_min"]), 255)],
+                "orange": [(_first_level(lambda h: h > color["orange_hue_min"]),
+                            _last_level(lambda h: h <= color["orange_hue_max"]))],
+                "yellow": [(_first_level(lambda h: h > color["yellow_hue_min"]),
+                            _last_level(lambda h: h <= color["yellow_hue_max"]))],
+                "sat_min": _first_level(lambda v: v >= color["color_sat_min"]),
+                "val_min": _first_level(lambda v: v >= color["color_val_min"]),
+            },
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ParamSnapshot is immutable")
+
+    def __reduce__(self):
+        # Rebuild from the raw params so snapshots can be sent to worker processes
+        return (ParamSnapshot, (self.version, self.params))
+
+    def as_dict(self) -> Dict:
+        """Mutable deep copy of the raw parameters"""
+        return copy.deepcopy(self.params)
+
 # Defines all defaults and adaptive parameter handling logic
 class AdaptiveParams:
     def __init__(self):
@@ -63,7 +155,27 @@ class AdaptiveParams:
             }
         }
         
+        # Serialises writers; readers use snapshot() and never see a half-applied update
+        self._lock = threading.RLock()
         self.current_params = self.load_params()
+        # Bumped every time the in-memory parameters are committed; caches key on it
+        self.version = 0
+        self._snapshot = ParamSnapshot(self.version, self.current_params)
+        # (mtime, size) of the file as last loaded/saved by this process
+        self._loaded_stamp = self._file_stamp()
+        self._last_reload_check = time.monotonic()
+        
+        # Write-behind persistence: save_params() publishes at once and schedules one flush
+        self.flush_interval = FLUSH_INTERVAL
+        self._dirty = False
+        self._flush_timer = None
+        self._io_lock = threading.Lock()
+        self._save_stats = {"save_requests": 0, "flushes": 0, "flush_errors": 0,
+                            "flush_ms_total": 0.0, "flush_ms_max": 0.0, "flush_ms_last": None}
+        atexit.register(self.flush)
+        if hasattr(os, "register_at_fork"):
+            # A pending timer thread does not survive fork; the child schedules its own
+            os.register_at_fork(after_in_child=self._reset_after_fork)
     # Persists to feedback_data/adaptive_parameters.json and merges on load.
     def load_params(self) -> Dict:
         """Load adaptive parameters or return defaults"""
@@ -72,20 +184,120 @@ class AdaptiveParams:
                 with open(self.params_file, 'r') as f:
                     saved_params = json.load(f)
                     # Merge with defaults to handle new parameters
-                    merged = self._deep_merge(self.default_params.copy(), saved_params)
+                    merged = self._deep_merge(copy.deepcopy(self.default_params), saved_params)
                     return merged
             except Exception as e:
                 print(f"Warning: Could not load adaptive parameters: {e}")
                 
-        return self.default_params.copy()
+        return copy.deepcopy(self.default_params)
     
-    def save_params(self):
-        """Save current parameters to file"""
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.params_file)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+    
+    def reload_if_changed(self, min_interval: float = 1.0) -> bool:
+        """Pick up parameters saved by another process (e.g. a sibling worker).
+
+        Checks the file at most once per min_interval seconds. A file that
+        cannot be parsed (mid-write) is ignored until the next check rather
+        than falling back to defaults.
+        """
+        now = time.monotonic()
+        if now - self._last_reload_check < min_interval:
+            return False
+        self._last_reload_check = now
+        stamp = self._file_stamp()
+        if stamp is None or stamp == self._loaded_stamp or self._dirty:
+            # Unflushed local changes are newer than the file; they are written first
+            return False
         try:
-            with open(self.params_file, 'w') as f:
-                json.dump(self.current_params, f, indent=2)
-        except Exception as e:
-            print(f"Warning: Could not save adaptive parameters: {e}")
+            with open(self.params_file, 'r') as f:
+                saved_params = json.load(f)
+        except Exception:
+            return False
+        with self._lock:
+            self.current_params = self._deep_merge(copy.deepcopy(self.default_params), saved_params)
+            self._loaded_stamp = stamp
+            self._publish()
+        print(f"🔄 Reloaded adaptive parameters changed by another process (version {self.version})")
+        return True
+    
+    def snapshot(self) -> ParamSnapshot:
+        """Latest committed parameter snapshot (grab once per classification call)"""
+        return self._snapshot
+    
+    def _publish(self):
+        """Publish current_params as the next immutable snapshot version"""
+        with self._lock:
+            self.version += 1
+            self._snapshot = ParamSnapshot(self.version, self.current_params)
+    
+    def save_params(self):
+        """Publish current parameters and schedule a (coalesced) write to file"""
+        with self._lock:
+            self._publish()
+            self._dirty = True
+            self._save_stats["save_requests"] += 1
+            if self.flush_interval > 0:
+                # Later saves before the timer fires ride along with this write
+                self._schedule_flush(self.flush_interval)
+                return
+        self.flush()
+    
+    def _schedule_flush(self, delay: float):
+        """Arm the flush timer unless one is already pending (caller holds _lock)"""
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(delay, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+    
+    def flush(self):
+        """Write pending parameters now: locked, to a temp file, renamed over the old one"""
+        with self._io_lock:
+            with self._lock:
+                if self._flush_timer is not None:
+                    self._flush_timer.cancel()
+                    self._flush_timer = None
+                if not self._dirty:
+                    return
+                params = copy.deepcopy(self.current_params)
+                self._dirty = False
+            started = time.perf_counter()
+            try:
+                with file_lock(self.params_file + ".lock"):
+                    write_json_atomic(self.params_file, params)
+                    self._loaded_stamp = self._file_stamp()
+            except Exception as e:
+                self._save_stats["flush_errors"] += 1
+                print(f"Warning: Could not save adaptive parameters: {e}")
+                with self._lock:
+                    # Retried on the next save or flush, or by the timer if neither comes
+                    self._dirty = True
+                    self._schedule_flush(max(self.flush_interval, FLUSH_RETRY_INTERVAL))
+                return
+            elapsed = (time.perf_counter() - started) * 1000
+            stats = self._save_stats
+            stats["flushes"] += 1
+            stats["flush_ms_total"] += elapsed
+            stats["flush_ms_max"] = max(stats["flush_ms_max"], elapsed)
+            stats["flush_ms_last"] = elapsed
+    
+    def _reset_after_fork(self):
+        self._lock = threading.RLock()
+        self._io_lock = threading.Lock()
+        self._flush_timer = None
+    
+    def persistence_stats(self) -> Dict:
+        """Save/flush counters and write latency for /metrics"""
+        stats = dict(self._save_stats)
+        flushes = stats["flushes"]
+        stats["flush_ms_mean"] = stats["flush_ms_total"] / flushes if flushes else None
+        stats["pending"] = self._dirty
+        stats["flush_interval"] = self.flush_interval
+        return stats
     
     def _deep_merge(self, base_dict: Dict, update_dict: Dict) -> Dict:
         """Deep merge two dictionaries"""
@@ -104,28 +316,31 @@ class AdaptiveParams:
     
     def update_param(self, category: str, param: str, value):
         """Update specific parameter"""
-        if category not in self.current_params:
-            self.current_params[category] = {}
-        self.current_params[category][param] = value
-        self.save_params()
+        with self._lock:
+            if category not in self.current_params:
+                self.current_params[category] = {}
+            self.current_params[category][param] = value
+            self.save_params()
     
-    def adapt_from_feedback(self, feedback_analysis: Dict):
-        """Adapt parameters based on user feedback analysis"""
+    def adapt_from_feedback(self, feedback_analysis: Dict, save: bool = True):
+        """Adapt parameters based on user feedback analysis (save=False: caller saves once for a batch)"""
         feedback_type = feedback_analysis["type"]
         changes = feedback_analysis["changes"]
         
-        if feedback_type == "false_positive":
-            self._reduce_sensitivity(changes)
-        elif feedback_type == "false_negative":
-            self._increase_sensitivity(changes)
-        elif feedback_type == "bbox_resize":
-            self._adapt_geometric_rules(changes)
-        elif feedback_type == "severity_change":
-            self._adapt_severity_rules(changes)
-        elif feedback_type == "category_change":
-            self._adapt_classification_rules(changes)
-        
-        self.save_params()
+        with self._lock:
+            if feedback_type == "false_positive":
+                self._reduce_sensitivity(changes)
+            elif feedback_type == "false_negative":
+                self._increase_sensitivity(changes)
+            elif feedback_type == "bbox_resize":
+                self._adapt_geometric_rules(changes)
+            elif feedback_type == "severity_change":
+                self._adapt_severity_rules(changes)
+            elif feedback_type == "category_change":
+                self._adapt_classification_rules(changes)
+            
+            if save:
+                self.save_params()
     
     def _reduce_sensitivity(self, changes: Dict):
         """Reduce detection sensitivity for false positives"""
@@ -207,8 +422,9 @@ class AdaptiveParams:
     
     def reset_to_defaults(self):
         """Reset all parameters to default values"""
-        self.current_params = self.default_params.copy()
-        self.save_params()
+        with self._lock:
+            self.current_params = copy.deepcopy(self.default_params)
+            self.save_params()
         print(" All parameters reset to default values")
         return self.current_params
 
@@ -1,85 +1,51 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
-from fastapi.encoders import jsonable_encoder
-import torch, os, uuid, json
-import numpy as np
-from PIL import Image
-import cv2
-from typing import List, Dict, Any, Optional
+import io, os, tempfile
 
-# import your model & classifier from model_core
-from model_core import (
-    model, device, classify_anomalies_adaptive, 
-    process_user_feedback_api, get_current_parameters
+# Feedback/parameter functions are torch-free; the model is only imported with the inference routes
+from feedback_api import (
+    process_user_feedback_api, get_current_parameters, enqueue_user_feedback, get_feedback_ticket,
+    get_queue_stats, start_feedback_worker, stop_feedback_worker,
+    InvalidFeedback, parse_anomalies, detections_from_anomalies
 )
+from adaptive_params import adaptive_params
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-app = FastAPI()
-
-@app.post("/analyze")
-async def analyze(file: UploadFile = File(...)):
-    uid = str(uuid.uuid4())
-    temp_path = os.path.join(BASE_DIR, f"{uid}_{file.filename}")
-
-    # save uploaded file temporarily
-    with open(temp_path, "wb") as f:
-        f.write(await file.read())
-
-    # run inference
-    img = Image.open(temp_path).convert("RGB")
-    img_tensor = torch.tensor(np.array(img)).permute(2,0,1).unsqueeze(0).float()/255.0
-    img_tensor = img_tensor.to(device)
-
-    with torch.no_grad():
-        output = model(img_tensor)
-        if hasattr(output, 'anomaly_map'):
-            anomaly_map = output.anomaly_map.squeeze().cpu().numpy()
-        elif isinstance(output, (tuple, list)) and len(output) > 1:
-            anomaly_map = output[1].squeeze().cpu().numpy()
-        else:
-            anomaly_map = None
+# -------------------------
+# Worker role
+# "all" (default) serves inference and feedback; "feedback" serves only the
+# feedback/parameter endpoints and never imports torch or loads the model.
+# -------------------------
+ROLE = os.environ.get("FLARENET_ROLE", "all").lower()
+SERVES_INFERENCE = ROLE != "feedback"
 
-    # post-process
-    orig_np = np.array(img)
-    if anomaly_map is not None:
-        norm_map = (255 * (anomaly_map - anomaly_map.min()) / (np.ptp(anomaly_map) + 1e-8)).astype(np.uint8)
-        mask_img = Image.fromarray(norm_map).resize(img.size, resample=Image.BILINEAR)
-        bin_mask = np.array(mask_img) > 128
-    else:
-        bin_mask = np.zeros_like(orig_np[:,:,0], dtype=bool)
+# Feedback endpoints queue the event and answer 202 with a ticket (0 = process before replying)
+ASYNC_FEEDBACK = os.environ.get("FLARENET_FEEDBACK_ASYNC", "1").lower() in ("1", "true", "yes")
 
-    filtered_img = np.zeros_like(orig_np)
-    filtered_img[bin_mask] = orig_np[bin_mask]
+app = FastAPI()
 
-    # classify anomalies
-    _, box_list, label_list, conf_list, severities = classify_anomalies_adaptive(filtered_img, anomaly_map=anomaly_map)
+if SERVES_INFERENCE:
+    from inference_api import router as inference_router, inference_metrics
+    app.include_router(inference_router)
 
-    # format JSON
-    annotation = {
-        "status": "Normal" if not box_list else "Anomalies",
-        "anomalies": []
-    }
-    for (x, y, wb, hb), label, conf, sev in zip(box_list, label_list, conf_list, severities):
-        lname = label.lower()
-        category = (
-            "loose_joint" if "loose" in lname else
-            "wire_overload" if "wire" in lname else
-            "point_overload" if "point" in lname else
-            "anomaly"
-        )
-        annotation["anomalies"].append({
-            "label": label,
-            "category": category,
-            "severity": sev,
-            "confidence": float(conf),
-            "bbox": {"x": int(x), "y": int(y), "width": int(wb), "height": int(hb)}
-        })
+@app.on_event("startup")
+def _start_feedback_worker():
+    # Also drains events queued before a restart
+    start_feedback_worker()
 
-    # cleanup temp file
-    os.remove(temp_path)
+@app.on_event("shutdown")
+def _flush_parameters():
+    stop_feedback_worker()
+    # Workers leave via os._exit, so atexit alone would drop a pending write
+    adaptive_params.flush()
 
-    # return result
-    return JSONResponse(content=jsonable_encoder(annotation))
+def _accepted(ticket: str, **extra) -> JSONResponse:
+    return JSONResponse(status_code=202, content={
+        "status": "accepted",
+        "ticket": ticket,
+        "statusUrl": f"/feedback/status/{ticket}",
+        **extra
+    })
 
 @app.post("/feedback")
 async def process_feedback(feedback_data: dict):
@@ -92,39 +58,15 @@ async def process_feedback(feedback_data: dict):
         image_id = feedback_data.get("image_id", "unknown")
         user_id = feedback_data.get("user_id", "user")
         
-        # Extract original detections from analysis_result format
-        original_analysis = feedback_data.get("original_detections", {})
-        original_detections = []
-        
-        if "anomalies" in original_analysis:
-            for i, anomaly in enumerate(original_analysis["anomalies"]):
-                original_detections.append({
-                    "id": f"orig_{i}",
-                    "category": anomaly.get("category", "unknown"),
-                    "severity": anomaly.get("severity", "Unknown"),
-                    "confidence": anomaly.get("confidence", 0.5),
-                    "bbox": anomaly.get("bbox", {})
-                })
-        
-        # Extract user corrections from user_annotations format
-        user_annotations = feedback_data.get("user_corrections", {})
-        user_corrections = []
+        # Convert analysis_result / user_annotations format (deleted annotations are dropped)
+        original_detections, user_corrections, _ = detections_from_anomalies(
+            parse_anomalies(feedback_data.get("original_detections", {}), "original_detections"),
+            parse_anomalies(feedback_data.get("user_corrections", {}), "user_corrections")
+        )
         
-        if "anomalies" in user_annotations:
-            for i, anomaly in enumerate(user_annotations["anomalies"]):
-                # Skip if deleted by user
-                if anomaly.get("isDeleted", False):
-                    continue
-                    
-                user_corrections.append({
-                    "id": f"corr_{i}",
-                    "category": anomaly.get("category", "unknown"),
-                    "severity": anomaly.get("severity", "Unknown"), 
-                    "confidence": anomaly.get("confidence", 0.5),
-                    "bbox": anomaly.get("bbox", {}),
-                    "isUserAdded": anomaly.get("isUserAdded", False),
-                    "edited": anomaly.get("edited", False)
-                })
+        if ASYNC_FEEDBACK:
+            # Analysis and adaptation happen in the background queue worker
+            return _accepted(enqueue_user_feedback(image_id, user_id, original_detections, user_corrections))
         
         # Process feedback which analyzes feedback and adapts parameters.
         result = process_user_feedback_api(image_id, user_id, original_detections, user_corrections)
@@ -138,6 +80,8 @@ async def process_feedback(feedback_data: dict):
             "current_parameters": get_current_parameters()
         })
         
+    except InvalidFeedback as e:
+        return JSONResponse(status_code=400, content={"status": "error", "message": str(e)})
     except Exception as e:
         return JSONResponse(
             status_code=500,
@@ -164,63 +108,38 @@ async def adaptive_feedback(request_data: dict):
         print(f" Processing feedback for image {thermal_image_id} by user {user_id}")
         
         # Parse JSON strings from database if needed
-        if isinstance(original_analysis_json, str):
-            original_analysis = json.loads(original_analysis_json) if original_analysis_json else {}
-        else:
-            original_analysis = original_analysis_json
-            
-        if isinstance(user_annotations_json, str):
-            user_annotations = json.loads(user_annotations_json) if user_annotations_json else {}
-        else:
-            user_annotations = user_annotations_json
-        
-        print(f" Original detections: {len(original_analysis.get('anomalies', []))}")
-        print(f" User annotations: {len(user_annotations.get('anomalies', []))}")
+        original_anomalies = parse_anomalies(original_analysis_json, "originalAnalysisJson")
+        user_anomalies = parse_anomalies(user_annotations_json, "userAnnotationsJson")
         
-        # Extract original detections from analysis_result format
-        original_detections = []
-        if original_analysis and "anomalies" in original_analysis:
-            for i, anomaly in enumerate(original_analysis["anomalies"]):
-                original_detections.append({
-                    "id": f"orig_{i}",
-                    "category": anomaly.get("category", "unknown"),
-                    "severity": anomaly.get("severity", "Unknown"),
-                    "confidence": anomaly.get("confidence", 0.5),
-                    "bbox": anomaly.get("bbox", {})
-                })
+        print(f" Original detections: {len(original_anomalies)}")
+        print(f" User annotations: {len(user_anomalies)}")
         
-        # Extract user corrections from user_annotations format
-        user_corrections = []
-        deleted_count = 0
-        added_count = 0
-        edited_count = 0
-        
-        if user_annotations and "anomalies" in user_annotations:
-            for i, anomaly in enumerate(user_annotations["anomalies"]):
-                if anomaly.get("isDeleted", False):
-                    deleted_count += 1
-                    continue
-                    
-                if anomaly.get("isUserAdded", False):
-                    added_count += 1
-                    
-                if anomaly.get("edited", False):
-                    edited_count += 1
-                    
-                user_corrections.append({
-                    "id": f"corr_{i}",
-                    "category": anomaly.get("category", "unknown"),
-                    "severity": anomaly.get("severity", "Unknown"),
-                    "confidence": anomaly.get("confidence", 0.5),
-                    "bbox": anomaly.get("bbox", {}),
-                    "isUserAdded": anomaly.get("isUserAdded", False),
-                    "edited": anomaly.get("edited", False)
-                })
+        # Convert analysis_result / user_annotations format
+        original_detections, user_corrections, counts = detections_from_anomalies(original_anomalies, user_anomalies)
+        deleted_count, added_count, edited_count = counts["deleted"], counts["added"], counts["edited"]
         
         print(f" Feedback stats: {len(original_detections)} orig, {len(user_corrections)} corrected, {deleted_count} deleted, {added_count} added")
         
+        statistics = {
+            "originalDetections": len(original_detections),
+            "userCorrections": len(user_corrections), 
+            "deletedAnnotations": deleted_count,
+            "addedAnnotations": added_count,
+            "editedAnnotations": edited_count
+        }
+        
         # Process through adaptive system
-        if original_detections or user_corrections or deleted_count > 0:
+        if (original_detections or user_corrections or deleted_count > 0) and ASYNC_FEEDBACK:
+            ticket = enqueue_user_feedback(str(thermal_image_id), user_id, original_detections, user_corrections)
+            print(f" Feedback queued as ticket {ticket}")
+            return _accepted(
+                ticket,
+                thermalImageId=thermal_image_id,
+                message=f"Feedback for image {thermal_image_id} queued for adaptive learning",
+                statistics=statistics,
+                learningActive=True
+            )
+        elif original_detections or user_corrections or deleted_count > 0:
             result = process_user_feedback_api(str(thermal_image_id), user_id, original_detections, user_corrections)
             
             print(f" Adaptations applied: {result.get('adaptations_applied', [])}")
@@ -232,13 +151,7 @@ async def adaptive_feedback(request_data: dict):
                 "message": f"Adaptive learning completed for image {thermal_image_id}",
                 "adaptationsApplied": result.get("adaptations_applied", []),
                 "feedbackProcessed": result.get("feedback_count", 0),
-                "statistics": {
-                    "originalDetections": len(original_detections),
-                    "userCorrections": len(user_corrections), 
-                    "deletedAnnotations": deleted_count,
-                    "addedAnnotations": added_count,
-                    "editedAnnotations": edited_count
-                },
+                "statistics": statistics,
                 "currentThreshold": result.get("current_threshold", 50),
                 "learningActive": True
             })
@@ -250,6 +163,11 @@ async def adaptive_feedback(request_data: dict):
                 "learningActive": False
             })
         
+    except InvalidFeedback as e:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": str(e), "learningActive": False}
+        )
     except Exception as e:
         print(f" Adaptive learning error: {str(e)}")
         return JSONResponse(
@@ -261,6 +179,44 @@ async def adaptive_feedback(request_data: dict):
             }
         )
 
+@app.post("/feedback/replay")
+async def replay_feedback(request: Request, workers: int = 0, batch_size: int = 0):
+    """
+    Bulk backfill: body is JSON lines of /adaptive-feedback (or /feedback) records.
+    Records are applied in order; replies with counts, records/sec and the end-state parameters.
+    """
+    from feedback_replay import replay
+    
+    # Spool the upload to disk so any size is parsed line by line, never held in memory
+    with tempfile.TemporaryFile() as spool:
+        async for chunk in request.stream():
+            spool.write(chunk)
+        spool.seek(0)
+        lines = io.TextIOWrapper(spool, encoding="utf-8")
+        try:
+            # This process serves requests on several threads; analysis workers must not fork it
+            report = await run_in_threadpool(replay, lines, workers, batch_size, "spawn")
+        except Exception as e:
+            return JSONResponse(
+                status_code=500,
+                content={"status": "error", "message": f"Replay failed: {str(e)}"}
+            )
+    return JSONResponse(content={"status": "success", **report})
+
+@app.get("/feedback/status/{ticket}")
+async def get_feedback_status(ticket: str):
+    """Progress of a queued feedback event plus the current queue lag"""
+    info = get_feedback_ticket(ticket)
+    if info is None:
+        return JSONResponse(status_code=404, content={"status": "error", "message": f"Unknown ticket {ticket}"})
+    info["ticket_status"] = info.pop("status")
+    return JSONResponse(content={"status": "success", **info, "queue": get_queue_stats()})
+
+@app.get("/feedback/queue")
+async def get_feedback_queue():
+    """Queue depth, lag and batch counters"""
+    return JSONResponse(content={"status": "success", "queue": get_queue_stats()})
+
 @app.get("/parameters")
 async def get_adaptive_parameters():
     """Get current adaptive parameters"""
@@ -278,3 +234,46 @@ async def get_adaptive_parameters():
                 "message": f"Error getting parameters: {str(e)}"
             }
         )
+
+@app.get("/parameters/at")
+async def get_parameters_at(version: int = None, timestamp: str = None):
+    """Reconstruct the parameters after a history version or in effect at an ISO timestamp"""
+    if (version is None) == (timestamp is None):
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": "Pass exactly one of version or timestamp"}
+        )
+    try:
+        from parameter_tracker import parameter_tracker
+        history = parameter_tracker.history
+        params = history.parameters_at_version(version) if version is not None else history.parameters_at(timestamp)
+        if params is None:
+            return JSONResponse(
+                status_code=404,
+                content={"status": "error", "message": "No parameter history yet"}
+            )
+        return JSONResponse(content={
+            "status": "success",
+            "version": version,
+            "timestamp": timestamp,
+            "parameters": params
+        })
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={
+                "status": "error",
+                "message": f"Error reconstructing parameters: {str(e)}"
+            }
+        )
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Runtime counters for tuning inference"""
+    content = {"status": "success", "role": ROLE, "params_version": adaptive_params.version,
+               "params_persistence": adaptive_params.persistence_stats(),
+               "feedback_queue": get_queue_stats()}
+    if SERVES_INFERENCE:
+        content.update(inference_metrics())
+    return JSONResponse(content=content)
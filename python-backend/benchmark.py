@@ -0,0 +1,704 @@
+#!/usr/bin/env python3
+"""
+Benchmark Script
+Measures the classification hot path and checks the optimised stages against
+the original per-pixel reference implementations (bit-for-bit parity).
+
+Usage:
+    python benchmark.py warm-mask [--images DIR] [--repeat N]
+    python benchmark.py components [--images DIR] [--repeat N]
+    python benchmark.py batch --images DIR [--batch-size N]   (needs the model)
+    python benchmark.py knn [--bank-size N --dim D | --model] [--images DIR]
+    python benchmark.py precision --images DIR [--modes bf16,int8]   (needs the model)
+    python benchmark.py profile --workers N [--seconds S] [--compile-modes none,trace]   (needs the model)
+    python benchmark.py tiling [--sides 1024,2048,4096] [--mode tile|resize]   (needs the model)
+    python benchmark.py http --url http://localhost:5000 [--concurrency N] [--requests N]
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+# Add current directory to path for imports
+sys.path.append(os.path.dirname(__file__))
+
+from thermal_ops import build_warm_mask, build_warm_mask_cutoffs, find_components
+from adaptive_params import ParamSnapshot, adaptive_params
+
+DEFAULT_HSV_PARAMS = {"hue_low": 0.17, "hue_high": 0.95, "saturation_min": 0.35, "value_min": 0.5}
+RESOLUTIONS = [(120, 160), (240, 320), (480, 640), (640, 640)]
+
+
+# -------------------------
+# Reference implementations (the original pure-Python loops)
+# -------------------------
+def reference_warm_mask(hsv, hsv_params):
+    """Original per-pixel warm mask loop from classify_anomalies_adaptive"""
+    h, w = hsv.shape[:2]
+    mask = np.zeros((h, w), dtype=np.uint8)
+    for y in range(h):
+        for x in range(w):
+            H, S, V = hsv[y, x]
+            hC, sC, vC = H/180.0, S/255.0, V/255.0
+            warm_hue = (hC <= hsv_params["hue_low"]) or (hC >= hsv_params["hue_high"])
+            warm_sat = sC >= hsv_params["saturation_min"]
+            warm_val = vC >= hsv_params["value_min"]
+            if warm_hue and warm_sat and warm_val:
+                mask[y, x] = 1
+    return mask
+
+
+def reference_components(mask, min_area):
+    """Original 4-connected BFS box extraction from classify_anomalies_adaptive"""
+    h, w = mask.shape
+    visited = np.zeros_like(mask, dtype=bool)
+    boxes = []
+    dirs = [(1,0),(-1,0),(0,1),(0,-1)]
+    for y in range(h):
+        for x in range(w):
+            if mask[y, x] and not visited[y, x]:
+                q = deque([(x,y)])
+                visited[y, x] = True
+                minX = maxX = x
+                minY = maxY = y
+                area = 0
+                while q:
+                    px, py = q.popleft()
+                    area += 1
+                    minX, maxX = min(minX, px), max(maxX, px)
+                    minY, maxY = min(minY, py), max(maxY, py)
+                    for dx, dy in dirs:
+                        nx, ny = px+dx, py+dy
+                        if 0 <= nx < w and 0 <= ny < h and mask[ny, nx] and not visited[ny, nx]:
+                            visited[ny, nx] = True
+                            q.append((nx, ny))
+                if area >= min_area:
+                    boxes.append((minX, minY, maxX-minX+1, maxY-minY+1))
+    return boxes
+
+
+def reference_sidebar(hsv, mask):
+    """Original FLIR side-bar scan: zero the narrowest uniform strip on the right edge"""
+    w = hsv.shape[1]
+    max_check_width = max(1, int(w*0.06))
+    min_check_width = max(1, int(w*0.005))
+    hsv_float = hsv.astype(np.float32)
+    for cand_w in range(min_check_width, max_check_width+1):
+        x0 = w - cand_w
+        region = hsv_float[:, x0:w, :]
+        hue_var = np.mean(np.std(region[...,0], axis=0))
+        sat_mean = np.mean(region[...,1])
+        val_mean = np.mean(region[...,2])
+        if sat_mean > 40 and val_mean > 120 and hue_var < 8:
+            mask[:, x0:w] = 0
+            break
+    return mask
+
+
+def reference_classify(filtered_img, params):
+    """Original classify_anomalies_adaptive (per-pixel mask, BFS, per-box colour scan) for a raw parameter dict"""
+    hsv_params = params["hsv_warm_thresholds"]
+    color_params = params["color_classification"]
+    geom_params = params["geometric_rules"]
+    severity_params = params["severity_rules"]
+    conf_params = params["confidence_factors"]
+
+    hsv = cv2.cvtColor(filtered_img, cv2.COLOR_RGB2HSV)
+    h, w = filtered_img.shape[:2]
+    total_area = float(w * h)
+
+    mask = reference_warm_mask(hsv, hsv_params)
+    sidebar_width = int(w * 0.10)
+    mask[:, w - sidebar_width : w] = 0
+    reference_sidebar(hsv, mask)
+    boxes = reference_components(mask, max(32, int(w * h * params["min_area_factor"])))
+
+    labels, confidences, severities = [], [], []
+    for (x,y,bw,bh) in boxes:
+        area_frac = (bw*bh)/total_area
+        aspect = max(bw, bh)/max(1.0, min(bw, bh))
+        center_x0, center_y0 = int(w*0.33), int(h*0.33)
+        center_x1, center_y1 = int(w*0.67), int(h*0.67)
+        ox0, oy0 = max(x, center_x0), max(y, center_y0)
+        ox1, oy1 = min(x+bw, center_x1), min(y+bh, center_y1)
+        overlap_frac = max(0, ox1-ox0) * max(0, oy1-oy0)/(bw*bh)
+
+        box_hsv = hsv[y:y+bh, x:x+bw, :].astype(np.float32)
+        H, S, V = box_hsv[...,0], box_hsv[...,1], box_hsv[...,2]
+        gate = (S >= color_params["color_sat_min"]) & (V >= color_params["color_val_min"])
+        red_mask = ((H <= color_params["red_hue_max"]) | (H >= color_params["red_hue_min"])) & gate
+        orange_mask = (H > color_params["orange_hue_min"]) & (H <= color_params["orange_hue_max"]) & gate
+        yellow_mask = (H > color_params["yellow_hue_min"]) & (H <= color_params["yellow_hue_max"]) & gate
+        warm_count_local = np.count_nonzero(red_mask | orange_mask | yellow_mask)
+        if warm_count_local > 0:
+            red_orange_frac = (np.count_nonzero(red_mask | orange_mask))/float(warm_count_local)
+            yellow_frac_local = (np.count_nonzero(yellow_mask))/float(warm_count_local)
+        else:
+            red_orange_frac = 0.0
+            yellow_frac_local = 0.0
+        v_mean = float(np.mean(V/255.0))
+
+        if area_frac >= geom_params["loose_joint_area_min"] and \
+           (overlap_frac >= geom_params["loose_joint_overlap_min"] or area_frac >= geom_params["loose_joint_large_area"]):
+            base_label = "Loose Joint"
+            severity = "Faulty" if red_orange_frac >= severity_params["faulty_red_orange_threshold"] else "Potentially Faulty"
+            confidence = min(1.0, conf_params["loose_joint_base"] + conf_params["loose_joint_area_factor"] * area_frac)
+        elif aspect >= geom_params["wire_aspect_ratio"]:
+            if area_frac >= geom_params["wire_overload_area"] and (yellow_frac_local >= red_orange_frac):
+                base_label = "Full Wire Overload"
+                severity = "Potentially Faulty"
+            else:
+                base_label = "Point Overload"
+                severity = "Faulty" if red_orange_frac >= severity_params["faulty_red_orange_threshold"] else "Potentially Faulty"
+            confidence = min(1.0, conf_params["wire_base"] + conf_params["wire_aspect_factor"] * aspect)
+        else:
+            base_label = "Point Overload"
+            severity = "Faulty" if red_orange_frac >= severity_params["faulty_red_orange_threshold"] else "Potentially Faulty"
+            confidence = min(1.0, conf_params["point_base"] + conf_params["point_brightness_factor"] * v_mean)
+
+        labels.append(f"{base_label} ({severity})")
+        severities.append(severity)
+        confidences.append(confidence)
+
+    if not boxes:
+        return "Normal", [], [], [], []
+    return None, boxes, labels, confidences, severities
+
+
+# -------------------------
+# Frame sources
+# -------------------------
+def synthetic_frames(seed: int = 0):
+    """Random RGB frames with warm blobs at each benchmark resolution"""
+    rng = np.random.default_rng(seed)
+    for h, w in RESOLUTIONS:
+        frame = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+        for _ in range(8):
+            # Red/orange/yellow hotspots of varying size and shape
+            color = [(255, 0, 0), (255, 110, 0), (255, 230, 0)][int(rng.integers(0, 3))]
+            center = (int(rng.integers(0, w)), int(rng.integers(0, h)))
+            axes = (int(rng.integers(3, w // 6)), int(rng.integers(3, h // 6)))
+            cv2.ellipse(frame, center, axes, float(rng.integers(0, 180)), 0, 360, color, -1)
+        yield f"synthetic {w}x{h}", frame
+
+
+def image_frames(images_dir: str):
+    """RGB frames loaded from a folder of thermal images"""
+    if not images_dir or not os.path.isdir(images_dir):
+        return
+    for path in sorted(glob.glob(os.path.join(images_dir, "**", "*"), recursive=True)):
+        if not path.lower().endswith(('.png', '.jpg', '.jpeg')):
+            continue
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        yield os.path.basename(path), cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+def _time(fn, repeat):
+    """Best-of-N wall time in seconds, plus the last result"""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+# -------------------------
+# Benchmarks
+# -------------------------
+def bench_warm_mask(args):
+    """Compare vectorised warm mask against the per-pixel loop"""
+    print("📊 Warm mask: reference loop vs thermal_ops.build_warm_mask")
+    print("=" * 72)
+    print(f"{'frame':<36}{'loop (s)':>10}{'vector (ms)':>13}{'speedup':>10}  parity")
+
+    # Integer cut-offs as published in a parameter snapshot
+    snapshot_params = adaptive_params.snapshot().as_dict()
+    snapshot_params["hsv_warm_thresholds"] = DEFAULT_HSV_PARAMS
+    cutoffs = ParamSnapshot(-1, snapshot_params).warm_cutoffs
+
+    failures = 0
+    frames = list(synthetic_frames()) + list(image_frames(args.images))
+    for name, rgb in frames:
+        hsv = cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV)
+        t_ref, ref = _time(lambda: reference_warm_mask(hsv, DEFAULT_HSV_PARAMS), 1)
+        t_vec, vec = _time(lambda: build_warm_mask(hsv, DEFAULT_HSV_PARAMS), args.repeat)
+        same = ref.dtype == vec.dtype and np.array_equal(ref, vec) \
+            and np.array_equal(ref, build_warm_mask_cutoffs(hsv, cutoffs))
+        failures += 0 if same else 1
+        print(f"{name[:35]:<36}{t_ref:>10.3f}{t_vec * 1e3:>13.3f}{t_ref / max(t_vec, 1e-9):>9.0f}x  {'✅' if same else '❌'}")
+
+    print("=" * 72)
+    print("✅ All masks identical" if not failures else f"❌ {failures} frame(s) differ")
+    return failures
+
+
+def bench_components(args):
+    """Compare native connected components against the BFS loop"""
+    print("📊 Components: reference BFS vs thermal_ops.find_components")
+    print("=" * 80)
+    print(f"{'frame':<36}{'boxes':>7}{'bfs (s)':>10}{'native (ms)':>13}{'speedup':>10}  parity")
+
+    failures = 0
+    frames = list(synthetic_frames()) + list(image_frames(args.images))
+    for name, rgb in frames:
+        hsv = cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV)
+        mask = build_warm_mask(hsv, DEFAULT_HSV_PARAMS)
+        h, w = mask.shape
+        min_area = max(32, int(w * h * 0.001))
+        t_ref, ref = _time(lambda: reference_components(mask, min_area), 1)
+        t_cc, (_, comps) = _time(lambda: find_components(mask, min_area), args.repeat)
+        same = ref == [c["bbox"] for c in comps]
+        failures += 0 if same else 1
+        print(f"{name[:35]:<36}{len(ref):>7}{t_ref:>10.3f}{t_cc * 1e3:>13.3f}{t_ref / max(t_cc, 1e-9):>9.0f}x  {'✅' if same else '❌'}")
+
+    print("=" * 80)
+    print("✅ All boxes identical (same order)" if not failures else f"❌ {failures} frame(s) differ")
+    return failures
+
+
+def bench_batch(args):
+    """Throughput of bucketed batch inference vs one forward pass per image"""
+    # Imported here so the pure-OpenCV benchmarks run without torch/model weights
+    from model_core import image_to_tensor, infer_anomaly_maps, infer_anomaly_maps_bucketed
+
+    images = [rgb for _, rgb in image_frames(args.images)]
+    if not images:
+        images = [rgb for _, rgb in synthetic_frames() if rgb.shape[:2] == (480, 640)] * 16
+    print(f"📊 Batch inference: {len(images)} images, bucket step {args.bucket_step}, batch size {args.batch_size}")
+    print("=" * 60)
+
+    # Warm up both paths once so lazy initialisation is not timed
+    infer_anomaly_maps(image_to_tensor(images[0]))
+    infer_anomaly_maps_bucketed(images[:args.batch_size], args.bucket_step, args.batch_size)
+
+    start = time.perf_counter()
+    single = [infer_anomaly_maps(image_to_tensor(img))[0] for img in images]
+    t_single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = infer_anomaly_maps_bucketed(images, args.bucket_step, args.batch_size)
+    t_batched = time.perf_counter() - start
+
+    max_diff = max(
+        (float(np.abs(a - b).max()) for a, b in zip(single, batched) if a is not None and b is not None),
+        default=0.0,
+    )
+    print(f"Single-image path: {len(images) / t_single:8.2f} images/s")
+    print(f"Bucketed batches:  {len(images) / t_batched:8.2f} images/s  ({t_single / t_batched:.2f}x)")
+    print(f"Max |anomaly map difference|: {max_diff:.3e}")
+    return 0
+
+
+def _profile_worker(model, profile, side, seconds, results):
+    """Forked worker: forward passes for `seconds`, reports (passes/s, median latency)"""
+    import torch
+    torch.set_num_threads(profile.intra_op_threads)
+    if profile.inter_op_threads > 0:
+        torch.set_num_interop_threads(profile.inter_op_threads)
+    batch = profile.prepare_input(torch.rand(1, 3, side, side))
+    latencies = []
+    began = time.perf_counter()
+    with profile.grad_context():
+        while time.perf_counter() - began < seconds:
+            started = time.perf_counter()
+            model(batch)
+            latencies.append(time.perf_counter() - started)
+    elapsed = time.perf_counter() - began
+    results.put((len(latencies) / elapsed, sorted(latencies)[len(latencies) // 2]))
+
+
+def bench_profile(args):
+    """Sweep execution profiles with N forked workers (as serve.py runs them); keep the fastest"""
+    import itertools
+    import multiprocessing
+    import torch
+    import model_core
+    from execution_profile import ExecutionProfile, PROFILE_FILE, save_host_profile
+
+    cores = os.cpu_count() or 1
+    workers = max(1, args.workers)
+    if args.threads:
+        thread_options = sorted({int(v) for v in args.threads.split(",")})
+    else:
+        thread_options = sorted({1, 2, max(1, cores // workers), cores})
+    flags = [False, True]
+    grid = list(itertools.product(thread_options, flags, flags, args.compile_modes.split(",")))
+
+    ctx = multiprocessing.get_context("fork")
+    torch.set_num_threads(1)
+    print(f"📊 Execution profiles: {workers} worker(s), {cores} cores, {args.size}x{args.size} frames, "
+          f"{args.seconds:.0f}s per config")
+    print("=" * 78)
+    print(f"{'threads':>8}{'inf_mode':>10}{'ch_last':>9}{'compile':>9}{'images/s':>12}{'p50 ms':>10}")
+    best = None
+    for threads, inference_mode, channels_last, compile_mode in grid:
+        profile = ExecutionProfile(intra_op_threads=threads, inter_op_threads=args.inter_op_threads,
+                                   inference_mode=inference_mode, channels_last=channels_last,
+                                   compile=compile_mode.strip(), warmup=0, warmup_size=args.size)
+        model, _ = model_core.build_model(profile=profile)
+        if profile.compile != compile_mode.strip():
+            continue
+        with profile.grad_context():
+            model(profile.prepare_input(torch.rand(1, 3, args.size, args.size)))
+
+        results = ctx.Queue()
+        procs = [ctx.Process(target=_profile_worker, args=(model, profile, args.size, args.seconds, results))
+                 for _ in range(workers)]
+        for proc in procs:
+            proc.start()
+        reports = [results.get() for _ in procs]
+        for proc in procs:
+            proc.join()
+
+        throughput = sum(rate for rate, _ in reports)
+        p50 = sorted(latency for _, latency in reports)[len(reports) // 2]
+        print(f"{threads:>8}{str(inference_mode):>10}{str(channels_last):>9}{profile.compile:>9}"
+              f"{throughput:>12.2f}{p50 * 1e3:>10.1f}")
+        if best is None or throughput > best[0]:
+            best = (throughput, p50, profile)
+    print("=" * 78)
+    if best is None:
+        print("❌ No configuration ran")
+        return 1
+
+    throughput, p50, profile = best
+    settings = profile.as_dict()
+    settings["warmup"] = args.warmup
+    print(f"🏆 Best: {settings} -> {throughput:.2f} images/s")
+    if not args.no_save:
+        save_host_profile(settings, {"workers": workers, "images_per_s": round(throughput, 3),
+                                     "p50_ms": round(p50 * 1e3, 2), "frame_size": args.size},
+                          args.profile_file or PROFILE_FILE)
+        print(f"✅ Saved to {args.profile_file or PROFILE_FILE}; model_core uses it on this host")
+    return 0
+
+
+def bench_tiling(args):
+    """Latency and peak memory of large-frame inference as the upload grows"""
+    import resource
+    import model_core
+
+    if args.mode:
+        model_core.LARGE_INPUT_MODE = args.mode
+    if args.max_side is not None:
+        model_core.MAX_INPUT_SIDE = args.max_side
+    model_core.load_model()
+
+    rng = np.random.default_rng(0)
+    print(f"📊 Large-frame inference: mode {model_core.LARGE_INPUT_MODE}, max side {model_core.MAX_INPUT_SIDE}, "
+          f"max tiles {model_core.MAX_TILES}")
+    print("=" * 60)
+    print(f"{'frame':<14}{'seconds':>10}{'peak RSS (MB)':>16}")
+    # ru_maxrss only grows, so sides run smallest first
+    for side in sorted(int(v) for v in args.sides.split(",")):
+        frame = rng.integers(0, 256, (side * 3 // 4, side, 3), dtype=np.uint8)
+        start = time.perf_counter()
+        model_core.infer_image(frame)
+        elapsed = time.perf_counter() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+        print(f"{side}x{side * 3 // 4:<9}{elapsed:>10.2f}{peak:>16.0f}")
+    print("=" * 60)
+    return 0
+
+
+def _pearson(a, b):
+    a = np.asarray(a, dtype=np.float64).ravel()
+    b = np.asarray(b, dtype=np.float64).ravel()
+    if a.std() == 0 or b.std() == 0:
+        return 1.0 if np.allclose(a, b) else 0.0
+    return float(np.corrcoef(a, b)[0, 1])
+
+
+def bench_knn(args):
+    """Accuracy vs latency of the memory-bank search backends against exact search"""
+    # Imported here so the pure-OpenCV benchmarks run without torch
+    import tempfile
+    import torch
+    import knn_search
+
+    torch.manual_seed(0)
+    model = None
+    if args.model:
+        import model_core
+        model = model_core.load_model()
+        target = knn_search.find_memory_bank_module(model)
+        if target is None:
+            print("❌ Model has no PatchCore memory bank")
+            return 1
+        bank = target.memory_bank.detach().float()
+        index_dir = model_core.KNN_INDEX_DIR
+    else:
+        # Clustered synthetic bank, roughly like coreset-sampled patch features
+        centers = torch.randn(max(1, args.bank_size // 100), args.dim) * 3
+        bank = centers[torch.randint(0, centers.shape[0], (args.bank_size,))] + torch.randn(args.bank_size, args.dim)
+        index_dir = tempfile.mkdtemp(prefix="flarenet_knn_")
+
+    # Queries: perturbed bank rows (normal patches) plus far-off rows (anomalous patches)
+    picks = bank[torch.randint(0, bank.shape[0], (args.queries,))]
+    queries = picks + 0.5 * torch.randn_like(picks)
+    queries[: args.queries // 10] += 3 * torch.randn_like(queries[: args.queries // 10])
+
+    exact = knn_search.ExactSearch(bank)
+    exact.nearest_neighbors(queries, 1)
+    t_exact, (ref_scores, ref_idx) = _time(lambda: exact.nearest_neighbors(queries, 1), args.repeat)
+
+    print(f"📊 kNN search: bank {bank.shape[0]} x {bank.shape[1]}, {args.queries} queries")
+    print("=" * 78)
+    print(f"{'backend':<12}{'ms':>10}{'speedup':>10}{'recall@1':>10}{'score corr':>12}{'max rel err':>13}")
+    for name in args.backends.split(","):
+        name = name.strip()
+        if name == "native":
+            continue
+        backend = knn_search.build_backend(name, bank, index_dir, **knn_search.options_from_env(name))
+        backend.nearest_neighbors(queries, 1)
+        t_b, (scores, idx) = _time(lambda: backend.nearest_neighbors(queries, 1), args.repeat)
+        recall = float((idx == ref_idx).float().mean())
+        rel = float(((scores - ref_scores).abs() / ref_scores.clamp_min(1e-12)).max())
+        print(f"{name:<12}{t_b * 1e3:>10.1f}{t_exact / max(t_b, 1e-9):>9.1f}x{recall:>10.4f}"
+              f"{_pearson(scores, ref_scores):>12.6f}{rel:>13.2e}")
+    print("=" * 78)
+
+    if model is not None and args.images:
+        # End-to-end: anomaly maps with each backend vs native search
+        import model_core
+        frames = [rgb for _, rgb in image_frames(args.images)][:args.max_images]
+        target = knn_search.find_memory_bank_module(model)
+        native_maps = [model_core.infer_anomaly_maps(model_core.image_to_tensor(f))[0] for f in frames]
+        print(f"{'backend':<12}{'map corr (min)':>16}{'max |diff|':>12}")
+        for name in args.backends.split(","):
+            name = name.strip()
+            if name == "native":
+                continue
+            knn_search.install_knn_backend(model, name, index_dir, **knn_search.options_from_env(name))
+            maps = [model_core.infer_anomaly_maps(model_core.image_to_tensor(f))[0] for f in frames]
+            corr = min(_pearson(a, b) for a, b in zip(native_maps, maps))
+            diff = max(float(np.abs(a - b).max()) for a, b in zip(native_maps, maps))
+            print(f"{name:<12}{corr:>16.6f}{diff:>12.3e}")
+        # Restore the class method
+        target.__dict__.pop("nearest_neighbors", None)
+    return 0
+
+
+def _iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    ih = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = iw * ih
+    union = aw * ah + bw * bh - inter
+    return inter / union if union else 0.0
+
+
+def _box_agreement(ref, other, min_iou=0.5):
+    """(matched boxes, matched with the same label and severity) under greedy IoU matching"""
+    matched = same = 0
+    free = list(range(len(other)))
+    for r in ref:
+        rbox = (r["bbox"]["x"], r["bbox"]["y"], r["bbox"]["width"], r["bbox"]["height"])
+        best, best_iou = None, min_iou
+        for j in free:
+            o = other[j]
+            iou = _iou(rbox, (o["bbox"]["x"], o["bbox"]["y"], o["bbox"]["width"], o["bbox"]["height"]))
+            if iou >= best_iou:
+                best, best_iou = j, iou
+        if best is not None:
+            free.remove(best)
+            matched += 1
+            same += other[best]["label"] == r["label"] and other[best]["severity"] == r["severity"]
+    return matched, same
+
+
+def bench_precision(args):
+    """Reduced-precision backbone vs fp32: latency, anomaly-map correlation, box agreement"""
+    import torch
+    import model_core
+    from classifier import build_annotation
+
+    frames = [(name, rgb) for name, rgb in image_frames(args.images)][:args.max_images]
+    if not frames:
+        frames = list(synthetic_frames())
+        print("⚠️ No --images folder; using synthetic frames (box agreement is not meaningful)")
+    # Same input size for every mode; large frames are capped like the server would
+    frames = [(name, model_core._resize_to(rgb, model_core.MAX_INPUT_SIDE / float(max(rgb.shape[:2])))
+               if model_core.needs_resizing(rgb) else rgb) for name, rgb in frames]
+    snapshot = adaptive_params.snapshot()
+
+    def run(mode):
+        model, active = model_core.build_model(mode)
+        tensors = [model_core.image_to_tensor(rgb) for _, rgb in frames]
+        with torch.no_grad():
+            model(tensors[0])
+            maps, seconds = [], 0.0
+            for tensor in tensors:
+                best, output = _time(lambda: model(tensor), args.repeat)
+                seconds += best
+                maps.append(model_core.extract_anomaly_maps(output, 1)[0])
+        annotations = [build_annotation(rgb, amap, snapshot)["anomalies"] for (_, rgb), amap in zip(frames, maps)]
+        return active, seconds / len(frames), maps, annotations
+
+    _, ref_time, ref_maps, ref_boxes = run("fp32")
+    ref_total = sum(len(boxes) for boxes in ref_boxes)
+
+    print(f"📊 Backbone precision vs fp32: {len(frames)} frames, best of {args.repeat}")
+    print("=" * 86)
+    print(f"{'mode':<12}{'ms/frame':>10}{'speedup':>9}{'map corr (min)':>16}{'status agree':>14}"
+          f"{'box recall':>12}{'box prec':>10}{'same label':>12}")
+    print(f"{'fp32':<12}{ref_time * 1e3:>10.1f}{1.0:>8.2f}x{1.0:>16.4f}{1.0:>14.2f}{1.0:>12.2f}{1.0:>10.2f}{1.0:>12.2f}")
+    failed = False
+    for mode in args.modes.split(","):
+        mode = mode.strip()
+        active, seconds, maps, boxes = run(mode)
+        if active != mode:
+            print(f"{mode:<12}unavailable here (ran as {active}); skipped")
+            continue
+        corr = min(_pearson(a, b) for a, b in zip(ref_maps, maps))
+        status = sum(bool(a) == bool(b) for a, b in zip(ref_boxes, boxes)) / len(frames)
+        matched = same = 0
+        for a, b in zip(ref_boxes, boxes):
+            m, s_ = _box_agreement(a, b)
+            matched += m
+            same += s_
+        total = sum(len(b) for b in boxes)
+        recall = matched / ref_total if ref_total else 1.0
+        precision = matched / total if total else 1.0
+        labels = same / matched if matched else 1.0
+        print(f"{mode:<12}{seconds * 1e3:>10.1f}{ref_time / max(seconds, 1e-9):>8.2f}x{corr:>16.4f}{status:>14.2f}"
+              f"{recall:>12.2f}{precision:>10.2f}{labels:>12.2f}")
+        failed |= corr < args.min_corr
+    print("=" * 86)
+    if failed:
+        print(f"❌ Map correlation below {args.min_corr}")
+    return 1 if failed else 0
+
+
+def bench_http(args):
+    """Requests/sec and latency of POST /analyze against a running server"""
+    # Imported here so the offline benchmarks do not need requests
+    import threading
+    import requests
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Distinct bytes per request so the result cache does not answer them
+    base = [rgb for _, rgb in image_frames(args.images)] or [rgb for _, rgb in synthetic_frames() if rgb.shape[:2] == (480, 640)]
+    rng = np.random.default_rng(1)
+    payloads = []
+    for i in range(args.requests):
+        frame = base[i % len(base)].copy()
+        frame[0, :8] = rng.integers(0, 256, (8, 3), dtype=np.uint8)
+        payloads.append(cv2.imencode(".png", cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))[1].tobytes())
+
+    url = args.url.rstrip("/") + "/analyze"
+    requests.post(url, files={"file": ("warmup.png", payloads[0], "image/png")}).raise_for_status()
+    local = threading.local()
+
+    def _post(data):
+        # One keep-alive session per client thread
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        started = time.perf_counter()
+        response = local.session.post(url, files={"file": ("frame.png", data, "image/png")})
+        return response.status_code, time.perf_counter() - started
+
+    print(f"📊 HTTP /analyze: {args.requests} requests, concurrency {args.concurrency}")
+    print("=" * 60)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(_post, payloads))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(t for code, t in results if code == 200)
+    errors = sum(1 for code, _ in results if code != 200)
+    if latencies:
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"Throughput: {len(latencies) / elapsed:8.2f} requests/s")
+        print(f"Latency:    p50 {p50 * 1e3:.1f} ms  p95 {p95 * 1e3:.1f} ms")
+    print(f"Errors:     {errors}")
+    return 1 if errors else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FlareNet Benchmarks")
+    sub = parser.add_subparsers(dest="command")
+
+    warm = sub.add_parser("warm-mask", help="Warm-pixel mask parity and speed")
+    warm.add_argument("--images", default=None, help="Folder of real thermal frames")
+    warm.add_argument("--repeat", type=int, default=20, help="Timing repetitions for the fast path")
+
+    comp = sub.add_parser("components", help="Connected-components parity and speed")
+    comp.add_argument("--images", default=None, help="Folder of real thermal frames")
+    comp.add_argument("--repeat", type=int, default=20, help="Timing repetitions for the fast path")
+
+    batch = sub.add_parser("batch", help="Batched vs single-image inference throughput")
+    batch.add_argument("--images", default=None, help="Folder of thermal frames (synthetic if omitted)")
+    batch.add_argument("--bucket-step", type=int, default=32, help="Resolution bucket granularity")
+    batch.add_argument("--batch-size", type=int, default=8, help="Maximum images per forward pass")
+
+    knn = sub.add_parser("knn", help="Memory-bank search backends: accuracy vs latency")
+    knn.add_argument("--model", action="store_true", help="Use the loaded model's memory bank (else synthetic)")
+    knn.add_argument("--bank-size", type=int, default=20000, help="Synthetic bank rows")
+    knn.add_argument("--dim", type=int, default=1536, help="Synthetic embedding size")
+    knn.add_argument("--queries", type=int, default=784, help="Patch embeddings per search (28x28 = one image)")
+    knn.add_argument("--backends", default="exact,bf16,projection,ivf", help="Comma-separated backends")
+    knn.add_argument("--repeat", type=int, default=3, help="Timing repetitions")
+    knn.add_argument("--images", default=None, help="With --model: compare full anomaly maps on these frames")
+    knn.add_argument("--max-images", type=int, default=8, help="Frames used for the map comparison")
+
+    prec = sub.add_parser("precision", help="bf16/int8 backbone vs fp32: latency and detection agreement")
+    prec.add_argument("--images", default=None, help="Folder of thermal frames (synthetic if omitted)")
+    prec.add_argument("--modes", default="bf16,int8", help="Comma-separated modes to compare against fp32")
+    prec.add_argument("--max-images", type=int, default=32, help="Frames used")
+    prec.add_argument("--repeat", type=int, default=3, help="Timing repetitions per frame")
+    prec.add_argument("--min-corr", type=float, default=0.99, help="Fail if any map correlation is lower")
+
+    prof = sub.add_parser("profile", help="Sweep threads/inference_mode/channels_last/compile; save the best per host")
+    prof.add_argument("--workers", type=int, default=1, help="Worker processes running concurrently")
+    prof.add_argument("--threads", default=None, help="Comma-separated intra-op thread counts (default: 1,2,cores/workers,cores)")
+    prof.add_argument("--inter-op-threads", type=int, default=1, help="Inter-op threads per worker")
+    prof.add_argument("--compile-modes", default="none,trace", help="Comma-separated: none,trace,compile")
+    prof.add_argument("--size", type=int, default=640, help="Frame side")
+    prof.add_argument("--seconds", type=float, default=5.0, help="Measurement time per configuration")
+    prof.add_argument("--warmup", type=int, default=2, help="Warm-up passes recorded in the saved profile")
+    prof.add_argument("--profile-file", default=None, help="Where to save (default: model_weights/execution_profile.json)")
+    prof.add_argument("--no-save", action="store_true", help="Only print the sweep")
+
+    tiles = sub.add_parser("tiling", help="Large-frame latency/peak memory (tile or resize mode)")
+    tiles.add_argument("--sides", default="640,1024,2048,4096", help="Comma-separated frame widths (4:3)")
+    tiles.add_argument("--mode", choices=["tile", "resize"], default=None, help="Override FLARENET_LARGE_INPUT_MODE")
+    tiles.add_argument("--max-side", type=int, default=None, help="Override FLARENET_MAX_INPUT_SIDE")
+
+    http = sub.add_parser("http", help="Load test POST /analyze on a running server")
+    http.add_argument("--url", default="http://localhost:5000", help="Server base URL")
+    http.add_argument("--images", default=None, help="Folder of thermal frames (synthetic if omitted)")
+    http.add_argument("--concurrency", type=int, default=8, help="Parallel clients")
+    http.add_argument("--requests", type=int, default=200, help="Total requests")
+
+    args = parser.parse_args()
+    commands = {
+        "warm-mask": bench_warm_mask,
+        "components": bench_components,
+        "batch": bench_batch,
+        "precision": bench_precision,
+        "profile": bench_profile,
+        "tiling": bench_tiling,
+        "knn": bench_knn,
+        "http": bench_http,
+    }
+    if args.command not in commands:
+        parser.print_help()
+        return
+    sys.exit(1 if commands[args.command](args) else 0)
+
+
+if __name__ == "__main__":
+    main()
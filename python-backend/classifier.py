@@ -0,0 +1,195 @@
+"""
+Adaptive anomaly classification.
+
+Turns a PatchCore anomaly map plus the original RGB frame into labelled
+boxes using the current adaptive parameters. This module only needs
+NumPy/OpenCV, so it can run in worker processes that never load the model.
+"""
+
+import numpy as np
+import cv2
+from PIL import Image
+from typing import Dict, Any
+from adaptive_params import adaptive_params, percent_to_k, ParamSnapshot
+from thermal_ops import build_warm_mask_cutoffs, find_components, ColorStats, sidebar_detector
+
+# -----------------------------
+# Dynamic calibration parameters
+# These read the current sensitivity from adaptive_params. percent_to_k maps our 0–100
+# -----------------------------
+def get_current_threshold():
+    """Get current adaptive threshold"""
+    return adaptive_params.get_current_percent_threshold()
+
+def get_current_min_area_factor():
+    """Get current adaptive minimum area factor"""
+    return adaptive_params.get_current_min_area_factor()
+
+def get_adaptive_k():
+    """Get adaptive k value based on current parameters"""
+    current_threshold = get_current_threshold()
+    return percent_to_k(current_threshold)
+
+
+def as_snapshot(params=None) -> ParamSnapshot:
+    """Normalise None / raw dict / ParamSnapshot into a ParamSnapshot"""
+    if params is None:
+        return adaptive_params.snapshot()
+    if isinstance(params, ParamSnapshot):
+        return params
+    # Unversioned ad-hoc parameters (e.g. from scripts)
+    return ParamSnapshot(-1, params)
+
+
+# -------------------------
+# Enhanced adaptive anomaly classification function
+# -------------------------
+def classify_anomalies_adaptive(filtered_img, anomaly_map=None, camera_id=None, params=None):
+    """Enhanced classify_anomalies with adaptive parameters
+
+    camera_id optionally identifies the FLIR unit so its side-bar width is
+    cached separately from other cameras with the same resolution.
+    params is a ParamSnapshot (or a raw parameter dict); defaults to the
+    latest adaptive_params.snapshot(). The whole call uses that one snapshot,
+    so a concurrent feedback update cannot change thresholds half-way through.
+    """
+    
+    # Get current adaptive parameters
+    # Pulls one immutable snapshot (HSV cut-offs, color bands, geometric/severity rules, confidence factors).
+    snap = as_snapshot(params)
+    geom_params = snap.geom_params
+    severity_params = snap.severity_params
+    conf_params = snap.conf_params
+    
+    hsv = cv2.cvtColor(filtered_img, cv2.COLOR_RGB2HSV)
+    h, w = filtered_img.shape[:2]
+    total_area = float(w * h)
+
+    # Adaptive threshold for anomaly map
+    k_adaptive = snap.k
+    if anomaly_map is not None:
+        thresh = anomaly_map.mean() + k_adaptive * anomaly_map.std()
+        bin_mask = anomaly_map > thresh
+    else:
+        bin_mask = np.zeros((h, w), dtype=bool)
+
+    # Warm mask with adaptive HSV thresholds (precomputed integer cut-offs, see thermal_ops)
+    mask = build_warm_mask_cutoffs(hsv, snap.warm_cutoffs)
+
+    # -------------------------
+    # Ignore right-side FLIR bar and thin bars (unchanged)
+    sidebar_width = int(w * 0.10)  # right 10% width
+    mask[:, w - sidebar_width : w] = 0
+
+    bar_width = sidebar_detector.detect(hsv, camera_id)
+    if bar_width:
+        mask[:, w - bar_width : w] = 0
+    # -------------------------
+
+    # Connected components (4-connectivity, one native pass) with adaptive minimum area
+    # For each box: calculates geometry  and color ratios
+    # Classifies as Loose Joint / Full Wire Overload / Point Overload, 
+    # determines severity (red–orange fraction vs threshold), and 
+    # computes confidence from tuned factors.
+    min_area_factor = snap.min_area_factor
+    min_area = max(32, int(w * h * min_area_factor))
+    _, components = find_components(mask, min_area)
+
+    # Classify boxes with adaptive parameters
+    color_stats = ColorStats(hsv, snap.color_bands) if components else None
+    boxes = []
+    labels = []
+    confidences = []
+    severities = []
+    
+    for component in components:
+        x, y, bw, bh = component["bbox"]
+        area_frac = (bw*bh)/total_area
+        aspect = max(bw, bh)/max(1.0, min(bw, bh))
+        
+        # Calculate overlap (unchanged)
+        center_x0, center_y0 = int(w*0.33), int(h*0.33)
+        center_x1, center_y1 = int(w*0.67), int(h*0.67)
+        ox0, oy0 = max(x, center_x0), max(y, center_y0)
+        ox1, oy1 = min(x+bw, center_x1), min(y+bh, center_y1)
+        overlap = max(0, ox1-ox0) * max(0, oy1-oy0)
+        overlap_frac = overlap/(bw*bh)
+
+        # Color analysis with adaptive thresholds (O(1) summed-area lookups)
+        color = color_stats.box_stats(x, y, bw, bh)
+        red_orange_frac = color["red_orange_frac"]
+        yellow_frac_local = color["yellow_frac_local"]
+        v_mean = color["v_mean"]
+
+        # Adaptive geometric classification
+        if area_frac >= geom_params["loose_joint_area_min"] and \
+           (overlap_frac >= geom_params["loose_joint_overlap_min"] or area_frac >= geom_params["loose_joint_large_area"]):
+            base_label = "Loose Joint"
+            severity = "Faulty" if red_orange_frac >= severity_params["faulty_red_orange_threshold"] else "Potentially Faulty"
+            confidence = min(1.0, conf_params["loose_joint_base"] + conf_params["loose_joint_area_factor"] * area_frac)
+            
+        elif aspect >= geom_params["wire_aspect_ratio"]:
+            if area_frac >= geom_params["wire_overload_area"] and (yellow_frac_local >= red_orange_frac):
+                base_label = "Full Wire Overload"
+                severity = "Potentially Faulty"
+            else:
+                base_label = "Point Overload"
+                severity = "Faulty" if red_orange_frac >= severity_params["faulty_red_orange_threshold"] else "Potentially Faulty"
+            confidence = min(1.0, conf_params["wire_base"] + conf_params["wire_aspect_factor"] * aspect)
+            
+        else:
+            base_label = "Point Overload"
+            severity = "Faulty" if red_orange_frac >= severity_params["faulty_red_orange_threshold"] else "Potentially Faulty"
+            confidence = min(1.0, conf_params["point_base"] + conf_params["point_brightness_factor"] * v_mean)
+
+        boxes.append((x, y, bw, bh))
+        labels.append(f"{base_label} ({severity})")
+        severities.append(severity)
+        confidences.append(confidence)
+
+    if not boxes:
+        return "Normal", [], [], [], []
+
+    return None, boxes, labels, confidences, severities
+
+
+def build_annotation(orig_np: np.ndarray, anomaly_map, params=None, camera_id=None) -> Dict[str, Any]:
+    """Post-process one anomaly map into the annotation JSON returned to Java (camera_id: see classify_anomalies_adaptive)"""
+    h, w = orig_np.shape[:2]
+    if anomaly_map is not None:
+        norm_map = (255 * (anomaly_map - anomaly_map.min()) / (np.ptp(anomaly_map) + 1e-8)).astype(np.uint8)
+        mask_img = Image.fromarray(norm_map).resize((w, h), resample=Image.BILINEAR)
+        bin_mask = np.array(mask_img) > 128
+    else:
+        bin_mask = np.zeros_like(orig_np[:,:,0], dtype=bool)
+
+    filtered_img = np.zeros_like(orig_np)
+    filtered_img[bin_mask] = orig_np[bin_mask]
+
+    # classify anomalies (resolve the snapshot once for the whole request)
+    params = as_snapshot(params)
+    _, box_list, label_list, conf_list, severities = classify_anomalies_adaptive(
+        filtered_img, anomaly_map=anomaly_map, camera_id=camera_id, params=params
+    )
+
+    # format JSON
+    annotation = {
+        "status": "Normal" if not box_list else "Anomalies",
+        "anomalies": []
+    }
+    for (x, y, wb, hb), label, conf, sev in zip(box_list, label_list, conf_list, severities):
+        lname = label.lower()
+        category = (
+            "loose_joint" if "loose" in lname else
+            "wire_overload" if "wire" in lname else
+            "point_overload" if "point" in lname else
+            "anomaly"
+        )
+        annotation["anomalies"].append({
+            "label": label,
+            "category": category,
+            "severity": sev,
+            "confidence": float(conf),
+            "bbox": {"x": int(x), "y": int(y), "width": int(wb), "height": int(hb)}
+        })
+    return annotation
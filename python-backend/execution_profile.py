@@ -0,0 +1,231 @@
+"""
+CPU execution profile for the model.
+
+Collects the knobs that decide how a forward pass uses the host:
+
+    intra_op_threads   torch.set_num_threads (0 = torch default, i.e. all cores)
+    inter_op_threads   torch.set_num_interop_threads (0 = torch default)
+    inference_mode     torch.inference_mode() instead of torch.no_grad()
+    channels_last      NHWC memory layout for the model and its inputs
+    compile            none | trace | compile
+                       trace:   TorchScript trace + freeze of the backbone, saved to disk
+                       compile: torch.compile of the backbone (inductor cache on disk)
+    warmup             forward passes run right after loading
+
+Only the backbone (the PatchCore feature extractor) is traced or compiled;
+memory-bank search and map generation keep their dynamic shapes.
+
+Settings come from the per-host entry that `python benchmark.py profile`
+writes to model_weights/execution_profile.json, overridden by FLARENET_*
+environment variables.
+"""
+
+import hashlib
+import json
+import os
+import socket
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict
+
+import torch
+
+from file_utils import file_lock, write_json_atomic
+from precision import find_feature_extractor
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILE_FILE = os.environ.get(
+    "FLARENET_PROFILE_FILE", os.path.join(BASE_DIR, "model_weights", "execution_profile.json")
+)
+COMPILE_CACHE_DIR = os.path.join(BASE_DIR, "model_weights", "compiled")
+COMPILE_MODES = ("none", "trace", "compile")
+
+_ENV = {
+    "intra_op_threads": ("FLARENET_INTRA_OP_THREADS", int),
+    "inter_op_threads": ("FLARENET_INTER_OP_THREADS", int),
+    "inference_mode": ("FLARENET_INFERENCE_MODE", lambda v: v.lower() in ("1", "true", "yes")),
+    "channels_last": ("FLARENET_CHANNELS_LAST", lambda v: v.lower() in ("1", "true", "yes")),
+    "compile": ("FLARENET_COMPILE", str.lower),
+    "warmup": ("FLARENET_WARMUP", int),
+    "warmup_size": ("FLARENET_WARMUP_SIZE", int),
+}
+
+
+class ExecutionProfile:
+    DEFAULTS = {
+        "intra_op_threads": 0,
+        "inter_op_threads": 0,
+        "inference_mode": True,
+        "channels_last": False,
+        "compile": "none",
+        "warmup": 1,
+        "warmup_size": 256,
+    }
+
+    def __init__(self, **settings):
+        for key, default in self.DEFAULTS.items():
+            setattr(self, key, settings.get(key, default))
+        if self.compile not in COMPILE_MODES:
+            print(f"⚠️ Unknown compile mode '{self.compile}' (expected one of {', '.join(COMPILE_MODES)}); using none")
+            self.compile = "none"
+        self.source = settings.get("source", "defaults")
+        self._interop_applied = False
+
+    @classmethod
+    def from_env(cls, profile_file: str = PROFILE_FILE) -> "ExecutionProfile":
+        """Host entry from the profile file (if any), then FLARENET_* overrides"""
+        settings, sources = {}, []
+        host_entry = load_host_profile(profile_file)
+        if host_entry:
+            settings.update({key: host_entry[key] for key in cls.DEFAULTS if key in host_entry})
+            sources.append(f"{os.path.basename(profile_file)}[{socket.gethostname()}]")
+        for key, (var, parse) in _ENV.items():
+            if os.environ.get(var):
+                settings[key] = parse(os.environ[var])
+                sources.append(var)
+        settings["source"] = ", ".join(sources) or "defaults"
+        return cls(**settings)
+
+    def as_dict(self) -> Dict:
+        return {key: getattr(self, key) for key in self.DEFAULTS}
+
+    # -------------------------
+    # Threads and autograd mode
+    # -------------------------
+    def apply_threads(self):
+        """Set torch thread pools; the inter-op pool can only be sized once per process"""
+        if self.intra_op_threads > 0:
+            torch.set_num_threads(self.intra_op_threads)
+        if self.inter_op_threads > 0 and not self._interop_applied:
+            try:
+                torch.set_num_interop_threads(self.inter_op_threads)
+            except RuntimeError as e:
+                print(f"⚠️ Could not set inter-op threads: {e}")
+            self._interop_applied = True
+
+    @contextmanager
+    def grad_context(self):
+        """inference_mode (no autograd bookkeeping at all) or plain no_grad"""
+        with (torch.inference_mode() if self.inference_mode else torch.no_grad()):
+            yield
+
+    def prepare_input(self, batch: torch.Tensor) -> torch.Tensor:
+        return batch.contiguous(memory_format=torch.channels_last) if self.channels_last else batch
+
+    # -------------------------
+    # Model preparation
+    # -------------------------
+    def prepare(self, model: torch.nn.Module, device: torch.device) -> torch.nn.Module:
+        """Apply memory format and backbone compilation to a freshly loaded model"""
+        if self.channels_last:
+            model = model.to(memory_format=torch.channels_last)
+        if self.compile != "none":
+            self._compile_backbone(model, device)
+        return model
+
+    def _compile_backbone(self, model: torch.nn.Module, device: torch.device):
+        owner, extractor = find_feature_extractor(model)
+        if extractor is None:
+            print(f"⚠️ compile={self.compile} requested but the model has no PatchCore feature extractor; running eager")
+            self.compile = "none"
+            return
+        # TimmFeatureExtractor wraps the timm network; compile that and keep the wrapper
+        holder = extractor if hasattr(extractor, "feature_extractor") else owner
+        backbone = holder.feature_extractor
+        example = self.prepare_input(torch.rand(1, 3, self.warmup_size, self.warmup_size, device=device))
+
+        started = time.perf_counter()
+        try:
+            if self.compile == "trace":
+                compiled, cached = self._traced(backbone, example, device)
+            else:
+                os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", os.path.join(COMPILE_CACHE_DIR, "inductor"))
+                compiled, cached = torch.compile(backbone, dynamic=True), False
+            # Surface tracing/compilation errors now rather than on the first request
+            with self.grad_context():
+                compiled(example)
+        except Exception as e:
+            print(f"⚠️ compile={self.compile} failed ({e}); running eager")
+            self.compile = "none"
+            return
+        holder.feature_extractor = compiled
+        print(f"✅ Backbone {'loaded from cache' if cached else self.compile + 'd'} "
+              f"({time.perf_counter() - started:.2f}s)")
+
+    def _traced(self, backbone: torch.nn.Module, example: torch.Tensor, device: torch.device):
+        """Frozen TorchScript backbone, loaded from COMPILE_CACHE_DIR when already traced"""
+        path = os.path.join(COMPILE_CACHE_DIR, f"backbone_{self._fingerprint(backbone, device)}.pt")
+        if os.path.exists(path):
+            try:
+                return torch.jit.load(path, map_location=device), True
+            except Exception as e:
+                print(f"⚠️ Ignoring unreadable traced backbone {path}: {e}")
+
+        with torch.no_grad():
+            traced = torch.jit.trace(backbone.eval(), example, strict=False, check_trace=False)
+        traced = torch.jit.freeze(traced.eval())
+        try:
+            os.makedirs(COMPILE_CACHE_DIR, exist_ok=True)
+            torch.jit.save(traced, path)
+        except Exception as e:
+            print(f"⚠️ Could not cache traced backbone: {e}")
+        return traced, False
+
+    def _fingerprint(self, backbone: torch.nn.Module, device: torch.device) -> str:
+        """Stable id of (weights, torch version, layout, device) for the trace cache"""
+        digest = hashlib.sha1()
+        digest.update(f"{torch.__version__}:{self.channels_last}:{device.type}".encode())
+        for key, tensor in backbone.state_dict().items():
+            if not isinstance(tensor, torch.Tensor):
+                continue
+            digest.update(f"{key}:{tuple(tensor.shape)}:{tensor.dtype}".encode())
+            if tensor.is_floating_point() and tensor.numel():
+                digest.update(tensor.detach().reshape(-1)[:64].float().cpu().numpy().tobytes())
+        return digest.hexdigest()[:16]
+
+    def warm_up(self, run_batch):
+        """Run `warmup` forward passes on a warmup_size frame via run_batch(tensor)"""
+        if self.warmup <= 0:
+            return
+        started = time.perf_counter()
+        for _ in range(self.warmup):
+            run_batch(torch.rand(1, 3, self.warmup_size, self.warmup_size))
+        print(f"✅ Warm-up: {self.warmup} pass(es) at {self.warmup_size}x{self.warmup_size} "
+              f"in {time.perf_counter() - started:.2f}s")
+
+
+# -------------------------
+# Per-host profile file
+# -------------------------
+def load_host_profile(profile_file: str = PROFILE_FILE) -> Dict:
+    """This host's entry from the profile file, or {}"""
+    try:
+        with open(profile_file) as f:
+            return json.load(f).get(socket.gethostname(), {})
+    except (OSError, ValueError):
+        return {}
+
+
+def save_host_profile(settings: Dict, measurements: Dict, profile_file: str = PROFILE_FILE):
+    """Record the best settings for this host, keeping other hosts' entries"""
+    os.makedirs(os.path.dirname(profile_file) or ".", exist_ok=True)
+    # Hosts sharing the file must not drop each other's entries, and readers never see a partial file
+    with file_lock(profile_file + ".lock"):
+        try:
+            with open(profile_file) as f:
+                profiles = json.load(f)
+        except (OSError, ValueError):
+            profiles = {}
+        profiles[socket.gethostname()] = {
+            **settings,
+            **measurements,
+            "cpu_count": os.cpu_count(),
+            "torch_version": torch.__version__,
+            "measured": datetime.now().isoformat(),
+        }
+        write_json_atomic(profile_file, profiles)
+
+
+# Global instance for use across modules
+execution_profile = ExecutionProfile.from_env()
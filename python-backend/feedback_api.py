@@ -0,0 +1,135 @@
+"""
+Feedback and parameter API functions.
+
+These bridge the HTTP APIs (app.py, adaptive_api.py) to the feedback/parameter
+system. Nothing here imports torch or the model, so a feedback-only worker
+starts without loading PatchCore. model_core re-exports these for older callers.
+"""
+
+import copy
+import json
+from typing import Dict, Iterator, List, Tuple
+from adaptive_params import adaptive_params
+from feedback_handler import feedback_handler
+from feedback_queue import feedback_queue
+from file_utils import file_lock
+
+
+class InvalidFeedback(ValueError):
+    pass
+
+def parse_anomalies(analysis, field: str) -> List[Dict]:
+    """The anomalies list of an analysis_result/user_annotations payload (JSON string or object)"""
+    if isinstance(analysis, str):
+        try:
+            analysis = json.loads(analysis) if analysis else {}
+        except ValueError as e:
+            raise InvalidFeedback(f"{field} is not valid JSON: {e}")
+    if not analysis:
+        return []
+    if not isinstance(analysis, dict):
+        raise InvalidFeedback(f"{field} must be an object with an 'anomalies' list")
+    anomalies = analysis.get("anomalies", [])
+    if not isinstance(anomalies, list) or not all(isinstance(a, dict) for a in anomalies):
+        raise InvalidFeedback(f"{field}.anomalies must be a list of objects")
+    return anomalies
+
+def detections_from_anomalies(original_anomalies: List[Dict], user_anomalies: List[Dict]) -> Tuple[List[Dict], List[Dict], Dict]:
+    """Internal (original_detections, user_corrections) plus deleted/added/edited counts"""
+    original_detections = [{
+        "id": f"orig_{i}",
+        "category": anomaly.get("category", "unknown"),
+        "severity": anomaly.get("severity", "Unknown"),
+        "confidence": anomaly.get("confidence", 0.5),
+        "bbox": anomaly.get("bbox", {})
+    } for i, anomaly in enumerate(original_anomalies)]
+    
+    user_corrections = []
+    counts = {"deleted": 0, "added": 0, "edited": 0}
+    for i, anomaly in enumerate(user_anomalies):
+        # Skip if deleted by user
+        if anomaly.get("isDeleted", False):
+            counts["deleted"] += 1
+            continue
+        counts["added"] += bool(anomaly.get("isUserAdded", False))
+        counts["edited"] += bool(anomaly.get("edited", False))
+        user_corrections.append({
+            "id": f"corr_{i}",
+            "category": anomaly.get("category", "unknown"),
+            "severity": anomaly.get("severity", "Unknown"),
+            "confidence": anomaly.get("confidence", 0.5),
+            "bbox": anomaly.get("bbox", {}),
+            "isUserAdded": anomaly.get("isUserAdded", False),
+            "edited": anomaly.get("edited", False)
+        })
+    return original_detections, user_corrections, counts
+
+def process_user_feedback_api(image_id: str, user_id: str, original_detections: List[Dict], user_corrections: List[Dict]):
+    """API endpoint to process user feedback and adapt model parameters"""
+    # Same lock as the queue worker and replay: no other process adapts between our reload and flush
+    with file_lock(feedback_queue.lock_file):
+        # Adapt from the latest saved parameters, not a stale copy held by this worker
+        adaptive_params.reload_if_changed(0)
+        result = feedback_handler.process_user_feedback(image_id, user_id, original_detections, user_corrections)
+        # One file write for the whole request, visible to sibling workers right away
+        adaptive_params.flush()
+
+    # Add current parameters to response
+    current_params = get_current_parameters()
+    result["current_threshold"] = current_params.get("percent_threshold", 50)
+    result["current_min_area_factor"] = current_params.get("min_area_factor", 0.001)
+
+    return result
+
+def enqueue_user_feedback(image_id: str, user_id: str, original_detections: List[Dict], user_corrections: List[Dict]) -> str:
+    """Queue feedback for the background worker; returns a ticket for get_feedback_ticket()"""
+    return feedback_queue.enqueue(image_id, user_id, original_detections, user_corrections)
+
+def get_feedback_ticket(ticket: str):
+    """Progress of a queued feedback event (None for an unknown ticket)"""
+    return feedback_queue.status(ticket)
+
+def get_queue_stats():
+    """Queue depth, lag and batch counters"""
+    return feedback_queue.stats()
+
+def _reload_parameters():
+    # Adapt from the latest saved parameters, not a stale copy held by this worker
+    adaptive_params.reload_if_changed(0)
+
+def start_feedback_worker():
+    """Drain the feedback queue in this process: one parameter save and one tracker record per batch"""
+    feedback_queue.start_worker(feedback_handler.process_feedback_batch,
+                                before=_reload_parameters, after=adaptive_params.flush)
+
+def stop_feedback_worker():
+    feedback_queue.stop_worker()
+
+def get_current_parameters():
+    """Get current adaptive parameters for debugging/monitoring"""
+    # A copy: callers must not mutate the live parameters behind the lock's back
+    return copy.deepcopy(adaptive_params.current_params)
+
+def get_persistence_stats():
+    """Parameter save/flush counters and write latency"""
+    return adaptive_params.persistence_stats()
+
+def get_feedback_statistics():
+    """Get statistics about feedback received"""
+    return feedback_handler.get_feedback_statistics()
+
+def export_feedback_log(format_type: str = "json"):
+    """Export feedback log for analysis"""
+    return feedback_handler.export_feedback_log(format_type)
+
+def stream_feedback_log(format_type: str = "json") -> Iterator[str]:
+    """Export feedback log chunk by chunk, without building it in memory"""
+    return feedback_handler.iter_feedback_export(format_type)
+
+def reset_parameters_to_default():
+    """Reset all adaptive parameters to default values"""
+    # A batch in progress elsewhere would otherwise flush its parameters over the reset
+    with file_lock(feedback_queue.lock_file):
+        adaptive_params.reset_to_defaults()
+        adaptive_params.flush()
+    return {"status": "success", "message": "Parameters reset to default values"}
@@ -1,84 +1,139 @@
-import json
+import copy
 import os
 from datetime import datetime
-from typing import Dict, List, Tuple
+from typing import Dict, Iterator, List, Tuple
 from adaptive_params import adaptive_params
+from feedback_log import FeedbackLog
+from feedback_stats import FeedbackStats
 class FeedbackHandler:
     def __init__(self):
-        # Prepares a feedback_data/ directory and a user_corrections.json log
+        # Prepares a feedback_data/ directory and the append-only feedback log in feedback_data/log/
         self.base_dir = os.path.dirname(__file__)
         self.feedback_data_dir = os.path.join(self.base_dir, "feedback_data")
+        # Legacy single-file log; imported into the segmented log once
         self.feedback_file = os.path.join(self.feedback_data_dir, "user_corrections.json")
         
         # Ensure feedback_data directory exists
         os.makedirs(self.feedback_data_dir, exist_ok=True)
+        self.feedback_log = FeedbackLog(os.path.join(self.feedback_data_dir, "log"))
+        self.feedback_log.migrate_legacy(self.feedback_file)
+        # Counters kept up to date incrementally in a sidecar next to the log
+        self.feedback_stats = FeedbackStats(self.feedback_log, os.path.join(self.feedback_data_dir, "feedback_stats.json"))
 # Takes originals vs corrections and calls _analyze_feedback 
 # to produce a list of events:   
     def process_user_feedback(self, image_id: str, user_id: str, original_detections: List[Dict], user_corrections: List[Dict]):
         """Process user feedback and adapt parameters"""
-        
+        return self.process_feedback_batch([{
+            "image_id": image_id,
+            "user_id": user_id,
+            "original_detections": original_detections,
+            "user_corrections": user_corrections
+        }])[0]
+    
+    def process_feedback_batch(self, events: List[Dict]) -> List[Dict]:
+        """Analyze and log several feedback events, then adapt with one parameter save and one tracker record.
+
+        Each event has image_id, user_id, original_detections and user_corrections,
+        optionally a precomputed feedback_analysis and the original timestamp;
+        returns one result dict per event, in order.
+        """
+        results = []
+        adaptations = []
+        log_entries = []
         try:
-            print(f" Processing feedback for image {image_id} by user {user_id}")
-            print(f" Original: {len(original_detections)}, Corrections: {len(user_corrections)}")
-            
-            # Analyze the feedback
-            feedback_analysis = self._analyze_feedback(original_detections, user_corrections)
-            
-            print(f" Feedback analysis: {len(feedback_analysis)} items")
-            for analysis in feedback_analysis:
-                print(f"   - {analysis['type']}")
-            
-            # Store feedback for logging
-            self._store_feedback(image_id, user_id, original_detections, user_corrections, feedback_analysis)
-            
             # Store parameters BEFORE adaptation
-            params_before = adaptive_params.current_params.copy()
+            params_before = copy.deepcopy(adaptive_params.current_params)
+            detection_counts = {"original": 0, "corrected": 0, "added": 0, "deleted": 0}
             
-            # Adapt parameters based on feedback
-            adaptations_applied = []
-            for analysis in feedback_analysis:
-                adaptive_params.adapt_from_feedback(analysis)
-                adaptations_applied.append(analysis["type"])
+            for event in events:
+                image_id, user_id = event["image_id"], event["user_id"]
+                original_detections, user_corrections = event["original_detections"], event["user_corrections"]
+                print(f" Processing feedback for image {image_id} by user {user_id}")
+                print(f" Original: {len(original_detections)}, Corrections: {len(user_corrections)}")
+                
+                # Analyze the feedback (bulk replay analyses in worker processes beforehand)
+                feedback_analysis = event.get("feedback_analysis")
+                if feedback_analysis is None:
+                    feedback_analysis = self._analyze_feedback(original_detections, user_corrections)
+                
+                print(f" Feedback analysis: {len(feedback_analysis)} items")
+                for analysis in feedback_analysis:
+                    print(f"   - {analysis['type']}")
+                
+                # Store feedback for logging (one log write and statistics refresh per batch)
+                log_entries.append(self._feedback_entry(image_id, user_id, original_detections, user_corrections,
+                                                        feedback_analysis, event.get("timestamp")))
+                
+                # Adapt parameters based on feedback; saved once below
+                adaptations_applied = []
+                for analysis in feedback_analysis:
+                    adaptive_params.adapt_from_feedback(analysis, save=False)
+                    adaptations_applied.append(analysis["type"])
+                
+                print(f" Applied adaptations: {adaptations_applied}")
+                if adaptations_applied:
+                    adaptations.append({"image_id": image_id, "user_id": user_id,
+                                        "feedback_types": adaptations_applied})
+                    for key, value in self._detection_counts(original_detections, user_corrections).items():
+                        detection_counts[key] += value
+                
+                results.append({
+                    "status": "success", 
+                    "message": f"Processed {len(feedback_analysis)} feedback items",
+                    "adaptations_applied": adaptations_applied,
+                    "feedback_count": len(feedback_analysis)
+                })
             
-            print(f" Applied adaptations: {adaptations_applied}")
+            try:
+                self.feedback_log.append_many(log_entries)
+                log_entries = []
+                self.feedback_stats.refresh()
+            except Exception as e:
+                print(f"Warning: Could not store feedback: {e}")
             
             # Track parameter changes if any adaptations were made
-            if adaptations_applied:
+            if adaptations:
+                adaptive_params.save_params()
+                
                 # Import here to avoid circular imports
                 from parameter_tracker import parameter_tracker
                 
-                params_after = adaptive_params.current_params.copy()
-                detection_counts = {
-                    "original": len(original_detections),
-                    "corrected": len(user_corrections),
-                    "added": len(user_corrections) - len([c for c in user_corrections for o in original_detections if self._detections_match(c, o)]),
-                    "deleted": len(original_detections) - len([o for o in original_detections for c in user_corrections if self._detections_match(o, c)])
-                }
-                
+                # One record for the batch; each event keeps its own image and user
                 parameter_tracker.log_parameter_change(
-                    image_id=image_id,
-                    user_id=user_id, 
+                    image_id=None,
+                    user_id=None,
                     params_before=params_before,
-                    params_after=params_after,
-                    feedback_type=adaptations_applied,
-                    detection_counts=detection_counts
+                    params_after=copy.deepcopy(adaptive_params.current_params),
+                    feedback_type=[t for r in results for t in r["adaptations_applied"]],
+                    detection_counts=detection_counts,
+                    events=adaptations
                 )
             
-            return {
-                "status": "success", 
-                "message": f"Processed {len(feedback_analysis)} feedback items",
-                "adaptations_applied": adaptations_applied,
-                "feedback_count": len(feedback_analysis)
-            }
+            return results
             
         except Exception as e:
             print(f" Feedback processing error: {str(e)}")
-            return {
+            if adaptations:
+                adaptive_params.save_params()  # keep what was applied
+            try:
+                self.feedback_log.append_many(log_entries)  # events analysed before the failure
+            except Exception:
+                pass
+            error = {
                 "status": "error",
                 "message": f"Failed to process feedback: {str(e)}",
                 "adaptations_applied": [],
                 "feedback_count": 0
             }
+            return results + [dict(error) for _ in events[len(results):]]
+    
+    def _detection_counts(self, original_detections: List[Dict], user_corrections: List[Dict]) -> Dict:
+        return {
+            "original": len(original_detections),
+            "corrected": len(user_corrections),
+            "added": len(user_corrections) - len([c for c in user_corrections for o in original_detections if self._detections_match(c, o)]),
+            "deleted": len(original_detections) - len([o for o in original_detections for c in user_corrections if self._detections_match(o, c)])
+        }
     
     def _analyze_feedback(self, original: List[Dict], corrected: List[Dict]) -> List[Dict]:
         """Analyze user feedback to determine adaptation strategy"""
@@ -212,11 +267,11 @@ class FeedbackHandler:
         
         return False, {}
     
-    def _store_feedback(self, image_id: str, user_id: str, original: List[Dict], 
-                       corrected: List[Dict], analysis: List[Dict]):
-        """Store feedback data for logging and analysis"""
-        feedback_entry = {
-            "timestamp": datetime.now().isoformat(),
+    def _feedback_entry(self, image_id: str, user_id: str, original: List[Dict],
+                        corrected: List[Dict], analysis: List[Dict], timestamp: str = None) -> Dict:
+        """Feedback log entry for one event"""
+        return {
+            "timestamp": timestamp or datetime.now().isoformat(),
             "image_id": image_id,
             "user_id": user_id,
             "original_count": len(original),
@@ -225,74 +280,42 @@ class FeedbackHandler:
             "user_corrections": corrected,
             "feedback_analysis": analysis
         }
+    
+    def iter_feedback_export(self, format_type: str = "json") -> Iterator[str]:
+        """Export feedback log for analysis, chunk by chunk (one entry at a time)"""
+        if format_type.lower() == "json":
+            yield '{"feedback_entries": ['
+            for i, line in enumerate(self.feedback_log.iter_lines()):
+                yield ("," if i else "") + line
+            yield "]}"
         
-        try:
-            # Load existing feedback
-            if os.path.exists(self.feedback_file):
-                with open(self.feedback_file, 'r') as f:
-                    feedback_data = json.load(f)
-            else:
-                feedback_data = {"feedback_entries": []}
-            
-            feedback_data["feedback_entries"].append(feedback_entry)
-            
-            # Save updated feedback
-            with open(self.feedback_file, 'w') as f:
-                json.dump(feedback_data, f, indent=2)
-                
-        except Exception as e:
-            print(f"Warning: Could not store feedback: {e}")
+        elif format_type.lower() == "csv":
+            # Convert to CSV format for easier analysis
+            yield "timestamp,image_id,user_id,original_count,corrected_count,feedback_type"
+            for entry in self.feedback_log.iter_entries():
+                for analysis in entry.get("feedback_analysis", []):
+                    yield f"\n{entry['timestamp']},{entry['image_id']},{entry['user_id']},{entry['original_count']},{entry['corrected_count']},{analysis['type']}"
     
     def export_feedback_log(self, format_type: str = "json") -> str:
         """Export feedback log for analysis"""
         try:
-            if not os.path.exists(self.feedback_file):
-                return json.dumps({"feedback_entries": []})
-            
-            if format_type.lower() == "json":
-                with open(self.feedback_file, 'r') as f:
-                    return f.read()
-            
-            elif format_type.lower() == "csv":
-                # Convert to CSV format for easier analysis
-                if os.path.exists(self.feedback_file):
-                    with open(self.feedback_file, 'r') as f:
-                        data = json.load(f)
-                    
-                    csv_lines = ["timestamp,image_id,user_id,original_count,corrected_count,feedback_type"]
-                    for entry in data.get("feedback_entries", []):
-                        for analysis in entry.get("feedback_analysis", []):
-                            csv_lines.append(f"{entry['timestamp']},{entry['image_id']},{entry['user_id']},{entry['original_count']},{entry['corrected_count']},{analysis['type']}")
-                    
-                    return "\n".join(csv_lines)
-            
-            return ""
-            
+            return "".join(self.iter_feedback_export(format_type))
         except Exception as e:
             print(f"Warning: Could not export feedback log: {e}")
             return ""
     
     def get_feedback_statistics(self) -> Dict:
-        """Get statistics about feedback received"""
+        """Get statistics about feedback received (from the incremental summary, not the log)"""
         try:
-            if not os.path.exists(self.feedback_file):
-                return {"total_feedback": 0, "feedback_types": {}}
-            
-            with open(self.feedback_file, 'r') as f:
-                data = json.load(f)
-            
-            total_feedback = len(data.get("feedback_entries", []))
-            feedback_types = {}
-            
-            for entry in data.get("feedback_entries", []):
-                for analysis in entry.get("feedback_analysis", []):
-                    feedback_type = analysis["type"]
-                    feedback_types[feedback_type] = feedback_types.get(feedback_type, 0) + 1
-            
+            summary = self.feedback_stats.summary()
             return {
-                "total_feedback": total_feedback,
-                "feedback_types": feedback_types,
-                "last_feedback": data.get("feedback_entries", [])[-1]["timestamp"] if total_feedback > 0 else None
+                "total_feedback": summary["total"],
+                "feedback_types": summary["types"],
+                "first_feedback": summary["first"],
+                "last_feedback": summary["last"],
+                "by_user": summary["by_user"],
+                "by_day": summary["by_day"],
+                "by_category": summary["by_category"]
             }
             
         except Exception as e:
@@ -0,0 +1,207 @@
+"""
+Append-only, segmented feedback log.
+
+Each feedback event is one JSON line appended to the newest segment
+(feedback_data/log/feedback-000001.jsonl, -000002, ...). A segment is closed
+once it reaches FLARENET_FEEDBACK_SEGMENT_BYTES and a new one is started, so
+appending costs the same however much history is kept, and a crash can at
+worst leave one incomplete last line (skipped by readers).
+
+Every line is written with a single O_APPEND write, so several worker
+processes can share the log. FLARENET_FEEDBACK_FSYNC chooses durability:
+
+    always    - fsync after every entry (default; feedback is low-rate)
+    interval  - fsync at most every FLARENET_FEEDBACK_FSYNC_INTERVAL seconds
+    never     - leave flushing to the OS
+
+The old single-file log (user_corrections.json) is imported once, on first
+use, by whichever worker takes the migration lock first; the file itself is
+left in place.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+from file_utils import file_lock, write_json_atomic
+
+SEGMENT_BYTES = int(os.environ.get("FLARENET_FEEDBACK_SEGMENT_BYTES", 8 * 1024 * 1024))
+FSYNC_POLICY = os.environ.get("FLARENET_FEEDBACK_FSYNC", "always").lower()
+FSYNC_INTERVAL = float(os.environ.get("FLARENET_FEEDBACK_FSYNC_INTERVAL", 1.0))
+
+_SEGMENT_RE = re.compile(r"^feedback-(\d{6})\.jsonl$")
+MIGRATION_MARKER = "MIGRATED"
+
+
+class FeedbackLog:
+    def __init__(self, log_dir: str, segment_bytes: int = SEGMENT_BYTES,
+                 fsync_policy: str = FSYNC_POLICY, fsync_interval: float = FSYNC_INTERVAL):
+        self.log_dir = log_dir
+        self.segment_bytes = max(1, segment_bytes)
+        if fsync_policy not in ("always", "interval", "never"):
+            print(f"⚠️ Unknown fsync policy '{fsync_policy}'; using 'always'")
+            fsync_policy = "always"
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+
+        self._lock = threading.Lock()
+        self._fd = None
+        self._fd_pid = None
+        self._segment = None
+        self._last_fsync = 0.0
+        os.makedirs(self.log_dir, exist_ok=True)
+
+    # -------------------------
+    # Segments
+    # -------------------------
+    def segments(self) -> List[str]:
+        """Segment paths, oldest first"""
+        numbered = []
+        for name in os.listdir(self.log_dir):
+            match = _SEGMENT_RE.match(name)
+            if match:
+                numbered.append((int(match.group(1)), name))
+        return [os.path.join(self.log_dir, name) for _, name in sorted(numbered)]
+
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self.log_dir, f"feedback-{number:06d}.jsonl")
+
+    def _open_segment(self, path: str):
+        if self._fd is not None and self._fd_pid == os.getpid():
+            os.close(self._fd)
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._fd_pid = os.getpid()
+        self._segment = path
+        # A crash mid-write can leave a line without its newline; terminate it so
+        # the next entry starts on a fresh line (the torn line is skipped on read)
+        size = os.fstat(self._fd).st_size
+        if size:
+            with open(path, "rb") as f:
+                f.seek(size - 1)
+                if f.read(1) != b"\n":
+                    os.write(self._fd, b"\n")
+
+    def _ensure_segment(self):
+        """Open the newest segment, or the next one if it is full"""
+        if self._fd is None or self._fd_pid != os.getpid():
+            existing = self.segments()
+            self._open_segment(existing[-1] if existing else self._segment_path(1))
+        if os.fstat(self._fd).st_size < self.segment_bytes:
+            return
+        # Full: move to the newest segment (another process may already have rotated)
+        existing = self.segments()
+        newest = existing[-1] if existing else self._segment
+        if newest != self._segment and os.path.getsize(newest) < self.segment_bytes:
+            self._open_segment(newest)
+        else:
+            number = int(_SEGMENT_RE.match(os.path.basename(newest)).group(1)) + 1
+            self._open_segment(self._segment_path(number))
+
+    # -------------------------
+    # Writing
+    # -------------------------
+    def append(self, entry: Dict):
+        """Append one entry as a JSON line"""
+        self.append_many([entry])
+
+    def append_many(self, entries: List[Dict]):
+        """Append entries as JSON lines with one write (and at most one fsync)"""
+        if not entries:
+            return
+        data = "".join(json.dumps(entry, separators=(",", ":")) + "\n" for entry in entries).encode("utf-8")
+        with self._lock:
+            self._ensure_segment()
+            os.write(self._fd, data)
+            now = time.monotonic()
+            if self.fsync_policy == "always" or (
+                self.fsync_policy == "interval" and now - self._last_fsync >= self.fsync_interval
+            ):
+                os.fsync(self._fd)
+                self._last_fsync = now
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None and self._fd_pid == os.getpid():
+                if self.fsync_policy != "never":
+                    os.fsync(self._fd)
+                os.close(self._fd)
+            self._fd = None
+
+    # -------------------------
+    # Reading
+    # -------------------------
+    def iter_lines(self) -> Iterator[str]:
+        """Raw JSON lines, oldest first, without loading whole segments"""
+        for path in self.segments():
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        # A missing newline means a torn (or still in-flight) last write
+                        if line.endswith("\n") and line.strip():
+                            yield line.rstrip("\n")
+            except OSError as e:
+                print(f"Warning: Could not read feedback segment {path}: {e}")
+
+    def iter_entries(self) -> Iterator[Dict]:
+        """Parsed entries, oldest first; unreadable lines are skipped"""
+        for line in self.iter_lines():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                print("Warning: Skipping corrupt feedback log line")
+
+    def is_empty(self) -> bool:
+        return not any(os.path.getsize(path) for path in self.segments())
+
+    # -------------------------
+    # Migration
+    # -------------------------
+    def migrate_legacy(self, legacy_file: str) -> Optional[int]:
+        """Import {"feedback_entries": [...]} once; returns the count or None if nothing was done.
+
+        Workers migrate one at a time under a lock. The entries go to a temporary
+        file that is renamed into place as the first segment, and the marker is
+        written last, so a crash at any point leaves either no entries or all of them.
+        """
+        marker = os.path.join(self.log_dir, MIGRATION_MARKER)
+        if os.path.exists(marker) or not os.path.exists(legacy_file):
+            return None
+        with file_lock(marker + ".lock"):
+            # Another worker may have finished while this one waited
+            if os.path.exists(marker):
+                return None
+            try:
+                with open(legacy_file, "r") as f:
+                    entries = json.load(f).get("feedback_entries", [])
+            except (OSError, ValueError) as e:
+                print(f"Warning: Could not migrate {legacy_file}: {e}")
+                return None
+
+            # A non-empty log already holds the import (a crash before the marker) or newer feedback
+            if self.is_empty() and entries:
+                existing = self.segments()
+                target = existing[0] if existing else self._segment_path(1)
+                tmp = os.path.join(self.log_dir, f".migrating.tmp{os.getpid()}")
+                try:
+                    with open(tmp, "w", encoding="utf-8") as f:
+                        for entry in entries:
+                            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+                        f.flush()
+                        os.fsync(f.fileno())
+                except BaseException:
+                    os.remove(tmp)
+                    raise
+                with self._lock:
+                    os.replace(tmp, target)
+                    # An open descriptor would still point at the replaced (empty) file
+                    if self._fd is not None and self._fd_pid == os.getpid():
+                        os.close(self._fd)
+                    self._fd = None
+
+            write_json_atomic(marker, {"source": os.path.basename(legacy_file), "entries": len(entries),
+                                       "migrated": time.strftime("%Y-%m-%dT%H:%M:%S")})
+        print(f"✅ Migrated {len(entries)} feedback entries from {os.path.basename(legacy_file)}")
+        return len(entries)
@@ -0,0 +1,250 @@
+"""
+Durable ingestion queue for user feedback (SQLite, WAL mode).
+
+/feedback and /adaptive-feedback validate the payload, enqueue it and answer
+202 with a ticket; the caller does not wait for analysis, logging,
+adaptation or tracking. A background worker in each API process drains the
+queue in batches of up to FLARENET_FEEDBACK_BATCH_MAX events and hands each
+batch to feedback_handler.process_feedback_batch(), so a batch costs one
+parameter save and one tracker record.
+
+Batches are applied under an inter-process lock, one process at a time, after
+reloading the parameters from disk, so workers never adapt from stale copies.
+Events survive restarts: anything still queued, or claimed by a process that
+died mid-batch, is picked up again. Delivery is at-least-once: a crash between
+the parameter flush and marking the batch done re-applies that batch.
+
+Finished tickets are kept for FLARENET_FEEDBACK_RETENTION seconds for status lookups.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from file_utils import file_lock
+
+BATCH_MAX = int(os.environ.get("FLARENET_FEEDBACK_BATCH_MAX", 64))
+POLL_INTERVAL = float(os.environ.get("FLARENET_FEEDBACK_POLL_INTERVAL", 0.5))
+RETENTION_SECONDS = float(os.environ.get("FLARENET_FEEDBACK_RETENTION", 7 * 24 * 3600))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ticket TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL,
+    enqueued REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    batch_size INTEGER,
+    image_id TEXT,
+    user_id TEXT,
+    payload TEXT NOT NULL,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_events_status ON events(status, id);
+CREATE INDEX IF NOT EXISTS idx_events_finished ON events(finished);
+"""
+
+
+class FeedbackQueue:
+    def __init__(self, db_path: str, batch_max: int = BATCH_MAX, retention_seconds: float = RETENTION_SECONDS):
+        self.db_path = db_path
+        self.lock_file = db_path + ".lock"
+        self.batch_max = max(1, batch_max)
+        self.retention_seconds = retention_seconds
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._local = threading.local()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_prune = 0.0
+        self._counters = {"enqueued": 0, "processed": 0, "failed": 0, "batches": 0,
+                          "last_batch_size": None, "last_batch_ms": None}
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread (and per process after fork)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=10.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    # -------------------------
+    # Producer side
+    # -------------------------
+    def enqueue(self, image_id: str, user_id: str, original_detections: List[Dict],
+                user_corrections: List[Dict]) -> str:
+        """Persist one feedback event; returns its ticket"""
+        ticket = uuid.uuid4().hex
+        payload = json.dumps({"original_detections": original_detections, "user_corrections": user_corrections})
+        self._conn().execute(
+            "INSERT INTO events (ticket, status, enqueued, image_id, user_id, payload) VALUES (?, 'queued', ?, ?, ?, ?)",
+            (ticket, time.time(), str(image_id), str(user_id), payload),
+        )
+        self._counters["enqueued"] += 1
+        self._wake.set()
+        return ticket
+
+    def status(self, ticket: str) -> Optional[Dict]:
+        """Progress of one ticket: queued (with position), processing, done or error"""
+        conn = self._conn()
+        row = conn.execute("SELECT * FROM events WHERE ticket = ?", (ticket,)).fetchone()
+        if row is None:
+            return None
+        info = {
+            "ticket": ticket,
+            "status": row["status"],
+            "image_id": row["image_id"],
+            "user_id": row["user_id"],
+            "enqueued": row["enqueued"],
+            "started": row["started"],
+            "finished": row["finished"],
+            "attempts": row["attempts"],
+        }
+        if row["status"] == "queued":
+            info["position"] = conn.execute(
+                "SELECT COUNT(*) FROM events WHERE status = 'queued' AND id < ?", (row["id"],)
+            ).fetchone()[0]
+            info["waiting_seconds"] = time.time() - row["enqueued"]
+        if row["finished"] is not None:
+            info["latency_seconds"] = row["finished"] - row["enqueued"]
+            info["batch_size"] = row["batch_size"]
+        if row["result"]:
+            info["result"] = json.loads(row["result"])
+        return info
+
+    def stats(self) -> Dict:
+        """Queue depth and lag (age of the oldest queued event)"""
+        conn = self._conn()
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM events GROUP BY status").fetchall())
+        oldest = conn.execute("SELECT MIN(enqueued) FROM events WHERE status = 'queued'").fetchone()[0]
+        return {
+            "queued": counts.get("queued", 0),
+            "processing": counts.get("processing", 0),
+            "done": counts.get("done", 0),
+            "error": counts.get("error", 0),
+            "lag_seconds": time.time() - oldest if oldest is not None else 0.0,
+            "worker_running": self._thread is not None and self._thread.is_alive(),
+            "batch_max": self.batch_max,
+            # Counters for this process
+            **self._counters,
+        }
+
+    # -------------------------
+    # Consumer side
+    # -------------------------
+    def _claim(self) -> List[sqlite3.Row]:
+        """Mark up to batch_max events as processing, oldest first (called under the queue lock).
+
+        Holding the lock means no other process is mid-batch, so rows still marked
+        processing were left by a process that died and are claimed again.
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT * FROM events WHERE status IN ('queued', 'processing') ORDER BY id LIMIT ?",
+                (self.batch_max,),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE events SET status = 'processing', started = ?, attempts = attempts + 1 WHERE id = ?",
+                [(now, row["id"]) for row in rows],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    def _finish(self, rows: List[sqlite3.Row], results: List[Dict]):
+        now = time.time()
+        self._conn().executemany(
+            "UPDATE events SET status = ?, finished = ?, batch_size = ?, result = ? WHERE id = ?",
+            [("done" if result.get("status") == "success" else "error", now, len(rows), json.dumps(result), row["id"])
+             for row, result in zip(rows, results)],
+        )
+
+    def _prune(self):
+        now = time.time()
+        if now - self._last_prune < 3600:
+            return
+        self._last_prune = now
+        self._conn().execute("DELETE FROM events WHERE status IN ('done', 'error') AND finished < ?",
+                             (now - self.retention_seconds,))
+
+    def process_batch(self, handler: Callable[[List[Dict]], List[Dict]], before: Callable = None,
+                      after: Callable = None) -> int:
+        """Claim and process one batch under the inter-process lock; returns the number of events.
+
+        `before` runs after the claim (e.g. reload parameters), `after` once the
+        handler returns and before the events are marked done (e.g. flush).
+        """
+        with file_lock(self.lock_file):
+            rows = self._claim()
+            if not rows:
+                return 0
+            started = time.perf_counter()
+            events = []
+            for row in rows:
+                payload = json.loads(row["payload"])
+                events.append({"image_id": row["image_id"], "user_id": row["user_id"], **payload})
+            if before:
+                before()
+            try:
+                results = handler(events)
+            except Exception as e:
+                results = [{"status": "error", "message": f"Failed to process feedback: {e}"}] * len(rows)
+            if after:
+                after()
+            self._finish(rows, results)
+
+        errors = sum(result.get("status") != "success" for result in results)
+        self._counters["processed"] += len(rows) - errors
+        self._counters["failed"] += errors
+        self._counters["batches"] += 1
+        self._counters["last_batch_size"] = len(rows)
+        self._counters["last_batch_ms"] = (time.perf_counter() - started) * 1000
+        self._prune()
+        return len(rows)
+
+    def start_worker(self, handler: Callable[[List[Dict]], List[Dict]], before: Callable = None,
+                     after: Callable = None, poll_interval: float = POLL_INTERVAL):
+        """Drain the queue in a daemon thread until stop_worker()"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.is_set():
+                try:
+                    if self.process_batch(handler, before, after):
+                        continue  # more may be waiting
+                except Exception as e:
+                    print(f"⚠️ Feedback queue worker error: {e}")
+                self._wake.wait(poll_interval)
+                self._wake.clear()
+
+        self._thread = threading.Thread(target=run, name="feedback-queue", daemon=True)
+        self._thread.start()
+
+    def stop_worker(self, timeout: float = 10.0):
+        """Stop after the batch in progress (queued events stay queued)"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+
+# Global instance for use across modules
+feedback_queue = FeedbackQueue(os.path.join(os.path.dirname(__file__), "feedback_data", "ingest_queue.db"))
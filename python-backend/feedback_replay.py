@@ -0,0 +1,148 @@
+"""
+Bulk replay of historical feedback (site onboarding / backfill).
+
+Input is JSON lines, one feedback record per line, either in the
+/adaptive-feedback format (thermalImageId, userId, originalAnalysisJson,
+userAnnotationsJson) or the /feedback format (image_id, user_id,
+original_detections, user_corrections). An optional "timestamp" (or
+"createdAt") is kept in the feedback log.
+
+Records are read lazily in batches of FLARENET_REPLAY_BATCH. Each batch is
+parsed and analysed by a pool of worker processes while the previous batch is
+being applied. Batches are applied strictly in input order, so the end state
+matches posting the records one by one. A batch is applied the way the
+feedback queue applies one: under the queue lock, with one feedback-log
+write, one parameter save and one tracker record that keeps each record's
+image and user as a separate event.
+"""
+
+import json
+import multiprocessing
+import os
+import time
+from typing import Dict, Iterable, List, Tuple
+
+from adaptive_params import adaptive_params
+from feedback_api import InvalidFeedback, parse_anomalies, detections_from_anomalies
+from feedback_handler import feedback_handler
+from feedback_queue import feedback_queue
+from file_utils import file_lock
+
+REPLAY_BATCH = int(os.environ.get("FLARENET_REPLAY_BATCH", 500))
+REPLAY_WORKERS = int(os.environ.get("FLARENET_REPLAY_WORKERS", 0))  # 0 = one per core
+MAX_REPORTED_ERRORS = 20
+
+
+def record_to_event(record: Dict) -> Dict:
+    """Feedback event (as queued by the API) from one replay record"""
+    if not isinstance(record, dict):
+        raise InvalidFeedback("record must be a JSON object")
+    if "originalAnalysisJson" in record or "userAnnotationsJson" in record:
+        image_id = record.get("thermalImageId", record.get("thermal_image_id"))
+        user_id = record.get("userId", record.get("user_id", "unknown"))
+        original = parse_anomalies(record.get("originalAnalysisJson", "{}"), "originalAnalysisJson")
+        user = parse_anomalies(record.get("userAnnotationsJson", "{}"), "userAnnotationsJson")
+    else:
+        image_id = record.get("image_id", "unknown")
+        user_id = record.get("user_id", "user")
+        original = parse_anomalies(record.get("original_detections", {}), "original_detections")
+        user = parse_anomalies(record.get("user_corrections", {}), "user_corrections")
+    original_detections, user_corrections, _ = detections_from_anomalies(original, user)
+    return {
+        "image_id": str(image_id),
+        "user_id": str(user_id),
+        "original_detections": original_detections,
+        "user_corrections": user_corrections,
+        "timestamp": record.get("timestamp") or record.get("createdAt"),
+    }
+
+
+def _analyze_line(item: Tuple[int, str]) -> Tuple[int, Dict]:
+    """Worker process: parse and analyse one line; returns (line number, event or error)"""
+    line_number, line = item
+    try:
+        event = record_to_event(json.loads(line))
+        event["feedback_analysis"] = feedback_handler._analyze_feedback(
+            event["original_detections"], event["user_corrections"]
+        )
+    except (ValueError, InvalidFeedback) as e:
+        return line_number, {"error": str(e)}
+    except Exception as e:
+        # A record that parses but breaks analysis must not abort the whole replay (or the pool's map)
+        return line_number, {"error": f"{type(e).__name__}: {e}"}
+    return line_number, event
+
+
+def _batches(lines: Iterable[str], size: int) -> Iterable[List[Tuple[int, str]]]:
+    batch = []
+    for line_number, line in enumerate(lines, 1):
+        if line.strip():
+            batch.append((line_number, line))
+            if len(batch) >= size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def replay(lines: Iterable[str], workers: int = REPLAY_WORKERS, batch_size: int = REPLAY_BATCH,
+           start_method: str = None) -> Dict:
+    """Replay JSON-lines feedback records in order; returns counts, records/sec and end-state parameters.
+
+    start_method picks how analysis workers start ("fork" where available by
+    default; pass "spawn" from a multi-threaded server).
+    """
+    workers = workers or os.cpu_count() or 1
+    batch_size = max(1, batch_size or REPLAY_BATCH)
+    report = {"records": 0, "applied": 0, "invalid": 0, "failed": 0, "adaptations": 0, "batches": 0,
+              "workers": workers, "errors": []}
+
+    def apply(analysed: List[Tuple[int, Dict]]):
+        events = []
+        for line_number, event in analysed:
+            report["records"] += 1
+            if "error" in event:
+                report["invalid"] += 1
+                if len(report["errors"]) < MAX_REPORTED_ERRORS:
+                    report["errors"].append({"line": line_number, "error": event["error"]})
+            else:
+                events.append(event)
+        if not events:
+            return
+        # Same protocol as the queue worker, so replay and live feedback never interleave mid-batch
+        with file_lock(feedback_queue.lock_file):
+            adaptive_params.reload_if_changed(0)
+            results = feedback_handler.process_feedback_batch(events)
+            adaptive_params.flush()
+        for result in results:
+            if result["status"] == "success":
+                report["applied"] += 1
+                report["adaptations"] += len(result["adaptations_applied"])
+            else:
+                report["failed"] += 1
+        report["batches"] += 1
+
+    started = time.perf_counter()
+    if workers <= 1:
+        for batch in _batches(lines, batch_size):
+            apply([_analyze_line(item) for item in batch])
+    else:
+        if start_method is None:
+            start_method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+        with multiprocessing.get_context(start_method).Pool(workers) as pool:
+            pending = None
+            for batch in _batches(lines, batch_size):
+                # Analyse this batch while the previous one is applied
+                job = pool.map_async(_analyze_line, batch, chunksize=max(1, len(batch) // (workers * 4)))
+                if pending is not None:
+                    apply(pending.get())
+                pending = job
+            if pending is not None:
+                apply(pending.get())
+
+    elapsed = time.perf_counter() - started
+    report["elapsed_seconds"] = elapsed
+    report["records_per_second"] = report["records"] / elapsed if elapsed > 0 else None
+    report["params_version"] = adaptive_params.version
+    report["parameters"] = adaptive_params.current_params
+    return report
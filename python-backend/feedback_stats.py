@@ -0,0 +1,159 @@
+"""
+Incrementally maintained feedback statistics.
+
+Counts per feedback type, user, day and category are kept in a small sidecar
+file (feedback_data/feedback_stats.json) next to the feedback log. The sidecar
+remembers how far into the log it has counted (segment + byte offset), so each
+update or query only reads lines appended since then, never the whole
+history. Counts and position are saved together in one atomic write (every
+CHECKPOINT_LINES lines during a long catch-up), so an interrupted update
+never counts a line twice. Any process can catch the sidecar up, under a file
+lock, which keeps it consistent across workers. Deleting the sidecar (or
+calling rebuild()) recounts everything from the log.
+"""
+
+import json
+import os
+import re
+import threading
+from typing import Dict, Iterable, Optional
+
+from file_utils import file_lock, write_json_atomic
+
+SUMMARY_VERSION = 1
+# Save counts and position together every this many lines while catching up
+CHECKPOINT_LINES = int(os.environ.get("FLARENET_STATS_CHECKPOINT_LINES", 1000))
+_SEGMENT_RE = re.compile(r"feedback-(\d{6})\.jsonl$")
+
+
+# -------------------------
+# Helpers shared with the parameter tracker summary
+# -------------------------
+def empty_summary() -> Dict:
+    return {"total": 0, "types": {}, "first": None, "last": None,
+            "by_user": {}, "by_day": {}, "by_category": {}}
+
+
+def add_to_summary(summary: Dict, timestamp: Optional[str], user_id, types: Iterable[str],
+                   categories: Iterable[Optional[str]] = ()):
+    """Count one event; `types` and `categories` are parallel per-item lists"""
+    types = list(types)
+    categories = list(categories) or [None] * len(types)
+    day = timestamp[:10] if timestamp else "unknown"
+    user = summary["by_user"].setdefault(str(user_id), {"total": 0, "types": {}, "last": None})
+    per_day = summary["by_day"].setdefault(day, {"total": 0, "types": {}})
+
+    summary["total"] += 1
+    user["total"] += 1
+    per_day["total"] += 1
+    if timestamp:
+        summary["first"] = summary["first"] or timestamp
+        summary["last"] = timestamp
+        user["last"] = timestamp
+    for feedback_type, category in zip(types, categories):
+        for counts in (summary["types"], user["types"], per_day["types"]):
+            counts[feedback_type] = counts.get(feedback_type, 0) + 1
+        if category:
+            per_category = summary["by_category"].setdefault(category, {})
+            per_category[feedback_type] = per_category.get(feedback_type, 0) + 1
+
+
+# -------------------------
+# Feedback log statistics
+# -------------------------
+class FeedbackStats:
+    def __init__(self, feedback_log, summary_file: str):
+        self.feedback_log = feedback_log
+        self.summary_file = summary_file
+        self.lock_file = summary_file + ".lock"
+        self._lock = threading.Lock()
+        self._summary = None
+        self._stamp = None
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.summary_file)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _load(self):
+        """Re-read the sidecar if another process has updated it"""
+        stamp = self._file_stamp()
+        if stamp is not None and stamp == self._stamp and self._summary is not None:
+            return
+        summary = None
+        if stamp is not None:
+            try:
+                with open(self.summary_file, "r") as f:
+                    summary = json.load(f)
+            except (OSError, ValueError):
+                print("Warning: Feedback statistics sidecar unreadable; rebuilding from the log")
+        if not summary or summary.get("version") != SUMMARY_VERSION:
+            summary = {"version": SUMMARY_VERSION, "position": {"segment": 0, "offset": 0}, **empty_summary()}
+        self._summary, self._stamp = summary, stamp
+
+    def _count(self, entry: Dict):
+        analyses = entry.get("feedback_analysis", [])
+        add_to_summary(
+            self._summary, entry.get("timestamp"), entry.get("user_id"),
+            [a.get("type", "unknown") for a in analyses],
+            [(a.get("changes") or {}).get("category") or None for a in analyses],
+        )
+
+    def _save(self):
+        write_json_atomic(self.summary_file, self._summary)
+        self._stamp = self._file_stamp()
+
+    def _catch_up(self) -> bool:
+        """Count complete lines appended after the recorded position"""
+        position = self._summary["position"]
+        advanced = False
+        counted = 0
+        for path in self.feedback_log.segments():
+            number = int(_SEGMENT_RE.search(path).group(1))
+            if number < position["segment"]:
+                continue
+            offset = position["offset"] if number == position["segment"] else 0
+            with open(path, "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # torn or in-flight last line; counted once it is complete
+                    offset += len(line)
+                    if line.strip():
+                        try:
+                            self._count(json.loads(line))
+                        except ValueError:
+                            pass
+                    # The position moves with the counts, line by line
+                    position["segment"], position["offset"] = number, offset
+                    advanced = True
+                    counted += 1
+                    if counted % max(1, CHECKPOINT_LINES) == 0:
+                        self._save()
+            if (number, offset) != (position["segment"], position["offset"]):
+                position["segment"], position["offset"] = number, offset
+                advanced = True
+        return advanced
+
+    def refresh(self) -> Dict:
+        """Bring the sidecar up to date with the log; returns the summary"""
+        with self._lock, file_lock(self.lock_file):
+            self._load()
+            if self._catch_up():
+                self._save()
+            return self._summary
+
+    def rebuild(self) -> Dict:
+        """Recount the whole log from scratch"""
+        with self._lock, file_lock(self.lock_file):
+            self._summary = {"version": SUMMARY_VERSION, "position": {"segment": 0, "offset": 0}, **empty_summary()}
+            self._catch_up()
+            self._save()
+            return self._summary
+
+    def summary(self) -> Dict:
+        """Current counts (reads only what was appended since the last refresh)"""
+        summary = self.refresh()
+        return {key: value for key, value in summary.items() if key not in ("version", "position")}
@@ -0,0 +1,348 @@
+"""
+Inference endpoints (/analyze, /analyze/batch, /reclassify).
+
+Mounted by app.py unless FLARENET_ROLE=feedback. Importing this module pulls in
+model_core (torch); the model itself is loaded at startup (FLARENET_EAGER_MODEL_LOAD,
+default on) or on the first request.
+"""
+
+from fastapi import APIRouter, File, Form, UploadFile, HTTPException
+from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+import os, uuid, asyncio, hashlib, multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import contextmanager
+import numpy as np
+from typing import List, Dict, Any, Optional
+
+from model_core import (
+    image_to_tensor, infer_anomaly_maps_bucketed, inference_scheduler, load_model,
+    infer_image, needs_resizing
+)
+import model_core
+from classifier import build_annotation
+from thermal_ops import decode_image_bytes
+from cache import LRUCache
+from adaptive_params import adaptive_params
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+router = APIRouter()
+
+# Load the model when the server starts instead of on the first /analyze
+EAGER_MODEL_LOAD = os.environ.get("FLARENET_EAGER_MODEL_LOAD", "1").lower() in ("1", "true", "yes")
+
+# -------------------------
+# Batch settings
+# Images are grouped into resolution buckets (sides rounded up to BATCH_BUCKET_STEP),
+# padded to the bucket size and run through the model BATCH_MAX_SIZE at a time.
+# -------------------------
+BATCH_BUCKET_STEP = int(os.environ.get("FLARENET_BATCH_BUCKET_STEP", 32))
+BATCH_MAX_SIZE = int(os.environ.get("FLARENET_BATCH_MAX_SIZE", 8))
+
+# -------------------------
+# CPU executor and admission control
+# Decode and post-processing run in a bounded pool (thread or process) so the
+# event loop stays free for light endpoints. At most ANALYZE_MAX_PENDING images
+# may be admitted at once; beyond that /analyze answers 503 with Retry-After. A
+# larger batch is admitted chunk by chunk, each chunk within the limit.
+# -------------------------
+ANALYZE_EXECUTOR = os.environ.get("FLARENET_ANALYZE_EXECUTOR", "thread").lower()
+ANALYZE_WORKERS = int(os.environ.get("FLARENET_ANALYZE_WORKERS", min(4, os.cpu_count() or 1)))
+ANALYZE_MAX_PENDING = int(os.environ.get("FLARENET_ANALYZE_MAX_PENDING", 16))
+ANALYZE_RETRY_AFTER = int(os.environ.get("FLARENET_ANALYZE_RETRY_AFTER", 2))
+
+# Uploads are decoded in memory; set FLARENET_PERSIST_UPLOADS=1 to also keep raw copies for debugging
+PERSIST_UPLOADS = os.environ.get("FLARENET_PERSIST_UPLOADS", "0").lower() in ("1", "true", "yes")
+DEBUG_UPLOAD_DIR = os.path.join(BASE_DIR, "debug_uploads")
+
+# -------------------------
+# Result cache
+# Annotations keyed by (sha256 of the upload, adaptive parameter version). Any
+# parameter change bumps the version, which empties the cache. /analyze/batch
+# pads images to their bucket, which changes the maps, so its entries use a
+# separate image key (see _batch_key).
+# -------------------------
+RESULT_CACHE_SIZE = int(os.environ.get("FLARENET_RESULT_CACHE_SIZE", 256))
+RESULT_CACHE_TTL = float(os.environ.get("FLARENET_RESULT_CACHE_TTL", 3600))
+result_cache = LRUCache(max_entries=RESULT_CACHE_SIZE, ttl_seconds=RESULT_CACHE_TTL)
+_result_cache_version = adaptive_params.version
+
+# How often (seconds) to check whether another worker saved new parameters
+PARAMS_RELOAD_INTERVAL = float(os.environ.get("FLARENET_PARAMS_RELOAD_INTERVAL", 1.0))
+
+# -------------------------
+# Anomaly-map cache
+# The PatchCore map depends only on the image (and, for /analyze/batch, its bucket
+# padding), so (image, float16 map) pairs are kept per image key under a memory
+# budget. /reclassify reuses them to apply the current parameters without
+# another forward pass.
+# -------------------------
+MAP_CACHE_MB = float(os.environ.get("FLARENET_MAP_CACHE_MB", 256))
+MAP_CACHE_ENTRIES = int(os.environ.get("FLARENET_MAP_CACHE_ENTRIES", 4096))
+map_cache = LRUCache(
+    max_entries=MAP_CACHE_ENTRIES,
+    max_bytes=int(MAP_CACHE_MB * 1024 * 1024),
+    sizeof=lambda entry: entry[0].nbytes + (entry[1].nbytes if entry[1] is not None else 0)
+)
+
+_cpu_executor = None
+_analyze_pending = 0
+_analyze_rejected = 0
+
+
+def _get_cpu_executor():
+    """Create the decode/post-processing pool on first use (after any fork)"""
+    global _cpu_executor
+    if _cpu_executor is None:
+        if ANALYZE_EXECUTOR == "process":
+            # spawn: workers import only classifier/thermal_ops, never the model
+            _cpu_executor = ProcessPoolExecutor(
+                max_workers=ANALYZE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        else:
+            _cpu_executor = ThreadPoolExecutor(max_workers=ANALYZE_WORKERS, thread_name_prefix="analyze")
+    return _cpu_executor
+
+
+async def _run_cpu(fn, *args):
+    """Run a CPU-bound stage in the bounded pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_cpu_executor(), fn, *args)
+
+
+@contextmanager
+def _admit(count: int = 1):
+    """Reserve analysis slots (count <= ANALYZE_MAX_PENDING); 503 + Retry-After when saturated"""
+    global _analyze_pending, _analyze_rejected
+    if _analyze_pending + count > ANALYZE_MAX_PENDING:
+        _analyze_rejected += 1
+        raise HTTPException(
+            status_code=503,
+            detail="Analysis queue is full, retry later",
+            headers={"Retry-After": str(ANALYZE_RETRY_AFTER)}
+        )
+    _analyze_pending += count
+    try:
+        yield
+    finally:
+        # Also runs on CancelledError when a client disconnect cancels the request task
+        _analyze_pending -= count
+
+
+def _params_snapshot():
+    """Consistent (version, immutable snapshot) of the adaptive parameters for one request"""
+    # Other workers (see serve.py) may have saved new parameters
+    adaptive_params.reload_if_changed(PARAMS_RELOAD_INTERVAL)
+    snapshot = adaptive_params.snapshot()
+    return snapshot.version, snapshot
+
+
+def _cached_result(image_hash: str, params_version: int):
+    """Stored annotation for this image under these parameters, or None"""
+    global _result_cache_version
+    # Parameters changed since the cache was filled: every entry is stale
+    if params_version != _result_cache_version:
+        result_cache.clear()
+        _result_cache_version = params_version
+    return result_cache.get((image_hash, params_version))
+
+
+def _store_result(image_hash: str, params_version: int, annotation: Dict[str, Any]):
+    # Skip results computed under parameters that changed while the request ran
+    if params_version == _result_cache_version:
+        result_cache.put((image_hash, params_version), annotation)
+
+
+def _store_map(image_hash: str, orig_np: np.ndarray, anomaly_map):
+    """Keep the decoded image and a float16 copy of its anomaly map for /reclassify"""
+    compact = None if anomaly_map is None else np.asarray(anomaly_map, dtype=np.float16)
+    map_cache.put(image_hash, (orig_np, compact))
+
+
+def _batch_key(image_hash: str) -> str:
+    """Cache key for a /analyze/batch map or result: the bucket (hence the padding) follows from image and step"""
+    return f"{image_hash}:batch{BATCH_BUCKET_STEP}"
+
+
+def _reclassify_entry(entry, params, camera_id=None) -> Dict[str, Any]:
+    """Post-process a cached (image, float16 map) pair against the given parameters"""
+    orig_np, compact = entry
+    anomaly_map = None if compact is None else compact.astype(np.float32)
+    return build_annotation(orig_np, anomaly_map, params, camera_id)
+
+
+def _persist_upload(filename: str, data: bytes):
+    """Debug aid: keep a copy of the raw upload when FLARENET_PERSIST_UPLOADS is set"""
+    if not PERSIST_UPLOADS:
+        return
+    try:
+        os.makedirs(DEBUG_UPLOAD_DIR, exist_ok=True)
+        safe_name = os.path.basename(filename or "upload")
+        with open(os.path.join(DEBUG_UPLOAD_DIR, f"{uuid.uuid4()}_{safe_name}"), "wb") as f:
+            f.write(data)
+    except Exception as e:
+        print(f"Warning: Could not persist upload {filename}: {e}")
+
+
+async def _read_upload(file: UploadFile):
+    """Read an upload's bytes and their sha256"""
+    data = await file.read()
+    _persist_upload(file.filename, data)
+    return data, hashlib.sha256(data).hexdigest()
+
+
+async def _decode(data: bytes) -> np.ndarray:
+    """Decode in memory (no temporary file)"""
+    try:
+        return await _run_cpu(decode_image_bytes, data)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not decode image: {str(e)}")
+
+
+def _decode_and_infer_batch(uploads: List[bytes]):
+    """Decode every upload and run the bucketed forward passes, all in one worker thread"""
+    images = []
+    for data in uploads:
+        try:
+            images.append(decode_image_bytes(data))
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Could not decode image: {str(e)}")
+    return images, infer_anomaly_maps_bucketed(images, BATCH_BUCKET_STEP, BATCH_MAX_SIZE)
+
+
+@router.post("/analyze")
+async def analyze(file: UploadFile = File(...), camera_id: Optional[str] = Form(None)):
+    data, image_hash = await _read_upload(file)
+    params_version, params = _params_snapshot()
+
+    # Same bytes under the same parameters: answer from the cache without touching the model
+    cached = _cached_result(image_hash, params_version)
+    if cached is not None:
+        return JSONResponse(content=jsonable_encoder(cached))
+
+    with _admit():
+        orig_np = await _decode(data)
+
+        # run inference (shared with concurrent requests by the micro-batching scheduler)
+        if needs_resizing(orig_np):
+            # Above FLARENET_MAX_INPUT_SIDE: tiles (or a downscaled copy) go through the scheduler
+            anomaly_map = await asyncio.to_thread(infer_image, orig_np)
+        else:
+            anomaly_map = await asyncio.wrap_future(inference_scheduler.submit(image_to_tensor(orig_np)))
+        _store_map(image_hash, orig_np, anomaly_map)
+
+        # post-process
+        annotation = await _run_cpu(build_annotation, orig_np, anomaly_map, params, camera_id)
+
+    _store_result(image_hash, params_version, annotation)
+
+    # return result
+    return JSONResponse(content=jsonable_encoder(annotation))
+
+
+@router.post("/analyze/batch")
+async def analyze_batch(files: List[UploadFile] = File(...), camera_id: Optional[str] = Form(None)):
+    """
+    Analyze many images in one request.
+    Images are grouped into resolution buckets and each bucket runs as one
+    batched forward pass; results come back in request order. camera_id, if
+    given, applies to every image in the batch.
+    """
+    uploads = [await _read_upload(f) for f in files]
+    params_version, params = _params_snapshot()
+
+    keys = [_batch_key(image_hash) for _, image_hash in uploads]
+    annotations: List[Optional[Dict[str, Any]]] = [_cached_result(key, params_version) for key in keys]
+    misses = [i for i, annotation in enumerate(annotations) if annotation is None]
+
+    # Admit at most ANALYZE_MAX_PENDING images at a time; a 503 part-way still leaves earlier chunks cached
+    chunk_size = max(1, ANALYZE_MAX_PENDING)
+    for start in range(0, len(misses), chunk_size):
+        chunk = misses[start:start + chunk_size]
+        with _admit(len(chunk)):
+            # Decoding rides along in the inference thread instead of blocking the event loop
+            images, anomaly_maps = await asyncio.to_thread(
+                _decode_and_infer_batch, [uploads[i][0] for i in chunk]
+            )
+            for i, orig_np, anomaly_map in zip(chunk, images, anomaly_maps):
+                _store_map(keys[i], orig_np, anomaly_map)
+
+            computed = await asyncio.gather(*[
+                _run_cpu(build_annotation, orig_np, anomaly_map, params, camera_id)
+                for orig_np, anomaly_map in zip(images, anomaly_maps)
+            ])
+
+        for i, annotation in zip(chunk, computed):
+            annotations[i] = annotation
+            _store_result(keys[i], params_version, annotation)
+
+    results = [{"image": upload.filename, **annotation} for upload, annotation in zip(files, annotations)]
+    return JSONResponse(content=jsonable_encoder({
+        "status": "success",
+        "count": len(results),
+        "results": results
+    }))
+
+
+@router.post("/reclassify")
+async def reclassify(file: Optional[UploadFile] = File(None), image_hash: Optional[str] = Form(None),
+                     camera_id: Optional[str] = Form(None)):
+    """
+    Re-run mask building, components and box classification for a previously
+    analysed image against the current adaptive parameters, reusing its cached
+    anomaly map instead of running the model again.
+    Identify the image by uploading it again (file) or by the sha256 hex digest
+    of its bytes (image_hash). Returns 404 if the map is no longer cached.
+    """
+    if file is not None:
+        _, image_hash = await _read_upload(file)
+    if not image_hash:
+        raise HTTPException(status_code=400, detail="Provide either file or image_hash")
+    image_hash = image_hash.lower()
+
+    params_version, params = _params_snapshot()
+    # Prefer the unpadded /analyze map; fall back to the one /analyze/batch kept
+    for key in (image_hash, _batch_key(image_hash)):
+        cached = _cached_result(key, params_version)
+        if cached is not None:
+            return JSONResponse(content=jsonable_encoder(cached))
+        entry = map_cache.get(key)
+        if entry is not None:
+            break
+    else:
+        raise HTTPException(status_code=404, detail="Anomaly map not cached; call /analyze first")
+
+    annotation = await _run_cpu(_reclassify_entry, entry, params, camera_id)
+    _store_result(key, params_version, annotation)
+    return JSONResponse(content=jsonable_encoder(annotation))
+
+
+@router.on_event("startup")
+def _load_model_at_startup():
+    if EAGER_MODEL_LOAD:
+        load_model()
+
+
+@router.on_event("shutdown")
+def _shutdown_executors():
+    if _cpu_executor is not None:
+        _cpu_executor.shutdown(wait=False, cancel_futures=True)
+
+
+def inference_metrics() -> Dict[str, Any]:
+    """Scheduler, cache and admission counters for /metrics"""
+    return {
+        # Requested vs in effect (None until the model is loaded)
+        "precision": {"requested": model_core.PRECISION, "active": model_core.model_precision},
+        "execution_profile": {**model_core.execution_profile.as_dict(), "source": model_core.execution_profile.source},
+        "scheduler": inference_scheduler.stats(),
+        "result_cache": {**result_cache.stats(), "params_version": _result_cache_version},
+        "map_cache": map_cache.stats(),
+        "admission": {
+            "executor": ANALYZE_EXECUTOR,
+            "workers": ANALYZE_WORKERS,
+            "max_pending": ANALYZE_MAX_PENDING,
+            "pending": _analyze_pending,
+            "rejected": _analyze_rejected
+        }
+    }
@@ -0,0 +1,169 @@
+"""
+Dynamic micro-batching scheduler for model inference.
+
+Concurrent requests submit single-image inputs; one worker thread drains the
+queue into batches bounded by max_batch_size and max_wait_ms, runs one
+forward pass per group of same-shaped inputs and fans the results back out
+to the waiting callers through futures.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List
+
+
+class InferenceScheduler:
+    def __init__(self, batch_fn: Callable[[List], List], max_batch_size: int = 8, max_wait_ms: float = 5.0):
+        """
+        batch_fn receives a list of same-shaped inputs and must return one
+        result per input, in the same order.
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+        self._batches = 0
+        self._batch_size_hist: Dict[int, int] = {}
+        self._wait_ms_total = 0.0
+        self._wait_ms_max = 0.0
+        self._infer_ms_total = 0.0
+        self._max_queue_depth = 0
+
+    # -------------------------
+    # Public API
+    # -------------------------
+    def submit(self, item) -> Future:
+        """Queue one input; the returned future resolves to its result"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        with self._lock:
+            self._submitted += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+        return future
+
+    def infer(self, item, timeout: float = None):
+        """Blocking convenience wrapper around submit()"""
+        return self.submit(item).result(timeout=timeout)
+
+    def stats(self) -> Dict:
+        """Counters for tuning the latency/throughput trade-off"""
+        with self._lock:
+            items = self._completed + self._failed
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "cancelled": self._cancelled,
+                "batches": self._batches,
+                "avg_batch_size": items / self._batches if self._batches else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_size_hist.items())),
+                "avg_wait_ms": self._wait_ms_total / items if items else 0.0,
+                "max_wait_ms_observed": self._wait_ms_max,
+                "avg_inference_ms": self._infer_ms_total / self._batches if self._batches else 0.0,
+            }
+
+    # -------------------------
+    # Worker
+    # -------------------------
+    def _ensure_worker(self):
+        # Threads do not survive fork, so a forked worker process starts its own
+        pid = os.getpid()
+        if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+                return
+            if self._worker_pid != pid:
+                self._queue = queue.Queue()
+                self._reset_counters()
+            self._worker_pid = pid
+            self._worker = threading.Thread(target=self._run, name="inference-scheduler", daemon=True)
+            self._worker.start()
+
+    def _collect_batch(self):
+        """Block for the first request, then gather more until full or max_wait_ms passes"""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            started = time.perf_counter()
+
+            # Only same-shaped inputs can be stacked into one forward pass
+            groups: Dict[tuple, list] = {}
+            for entry in batch:
+                groups.setdefault(tuple(getattr(entry[0], "shape", ())), []).append(entry)
+
+            for entries in groups.values():
+                self._run_group(entries, started)
+
+    def _run_group(self, entries, started):
+        # Claim each future first; callers that disconnected have cancelled theirs
+        claimed = [entry for entry in entries if entry[1].set_running_or_notify_cancel()]
+        if len(claimed) < len(entries):
+            with self._lock:
+                self._cancelled += len(entries) - len(claimed)
+        entries = claimed
+        if not entries:
+            return
+
+        infer_start = time.perf_counter()
+        try:
+            results = self.batch_fn([item for item, _, _ in entries])
+            error = None
+        except Exception as e:
+            results = [None] * len(entries)
+            error = e
+        infer_ms = (time.perf_counter() - infer_start) * 1000.0
+
+        with self._lock:
+            self._batches += 1
+            self._batch_size_hist[len(entries)] = self._batch_size_hist.get(len(entries), 0) + 1
+            self._infer_ms_total += infer_ms
+            for _, _, enqueued in entries:
+                wait_ms = (started - enqueued) * 1000.0
+                self._wait_ms_total += wait_ms
+                self._wait_ms_max = max(self._wait_ms_max, wait_ms)
+            if error is None:
+                self._completed += len(entries)
+            else:
+                self._failed += len(entries)
+
+        for (_, future, _), result in zip(entries, results):
+            # One bad future must never take the worker thread down with it
+            try:
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+            except Exception as e:
+                print(f"⚠️ Inference scheduler could not deliver a result: {e}")
@@ -0,0 +1,307 @@
+"""
+Nearest-neighbour search backends for the PatchCore memory bank.
+
+PatchCore scores every patch embedding by its distance to the closest entry
+of the coreset memory bank (PatchcoreModel.nearest_neighbors, a brute-force
+|x|^2 - 2x.y + |y|^2 over the whole bank). install_knn_backend() replaces
+that method on the loaded model with one of:
+
+    native      - leave anomalib's implementation untouched (default)
+    exact       - same distances, queries processed in chunks with the bank
+                  norms precomputed (bounded memory, no accuracy change)
+    bf16        - coarse search in bfloat16, exact fp32 re-rank of the best
+                  candidates (distances of the returned neighbours are exact)
+    projection  - coarse search on a random projection of the embeddings,
+                  exact re-rank of the best candidates
+    ivf         - inverted file: k-means lists over the bank, each query only
+                  scans its n_probe closest lists (exact distances within them)
+
+Approximate indexes are built once and saved next to the weights, keyed by a
+fingerprint of the bank and the index settings.
+"""
+
+import hashlib
+import math
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+import torch
+
+BACKENDS = ("native", "exact", "bf16", "projection", "ivf")
+
+
+def _distances(x: torch.Tensor, bank: torch.Tensor, bank_norm: torch.Tensor) -> torch.Tensor:
+    """Euclidean distances (n, m), same expression as PatchcoreModel.euclidean_dist"""
+    x_norm = x.pow(2).sum(dim=-1, keepdim=True)
+    res = x_norm - 2 * torch.matmul(x, bank.transpose(-2, -1)) + bank_norm.unsqueeze(0)
+    return res.clamp_min_(0).sqrt_()
+
+
+def _smallest(distances: torch.Tensor, k: int) -> Tuple[torch.Tensor, torch.Tensor]:
+    k = min(k, distances.shape[-1])
+    if k == 1:
+        scores, idx = distances.min(dim=-1, keepdim=True)
+        return scores, idx
+    return distances.topk(k=k, largest=False, dim=-1)
+
+
+class ExactSearch:
+    """Brute force over the whole bank, processed chunk_size queries at a time"""
+
+    name = "exact"
+
+    def __init__(self, bank: torch.Tensor, chunk_size: int = 4096):
+        self.bank = bank.float()
+        self.bank_norm = self.bank.pow(2).sum(dim=-1)
+        self.chunk_size = max(1, chunk_size)
+
+    def search(self, x: torch.Tensor, k: int) -> Tuple[torch.Tensor, torch.Tensor]:
+        """(distances, indices), both (n, k), nearest first"""
+        x = x.float()
+        scores, indices = [], []
+        for start in range(0, x.shape[0], self.chunk_size):
+            s, i = _smallest(_distances(x[start:start + self.chunk_size], self.bank, self.bank_norm), k)
+            scores.append(s)
+            indices.append(i)
+        return torch.cat(scores), torch.cat(indices)
+
+    def rerank(self, x: torch.Tensor, candidates: torch.Tensor, k: int) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Exact distances to (n, c) candidate indices; keep the k nearest"""
+        x = x.float()
+        vectors = self.bank[candidates]                                   # (n, c, d)
+        res = x.pow(2).sum(-1, keepdim=True) - 2 * torch.einsum("nd,ncd->nc", x, vectors) + self.bank_norm[candidates]
+        scores, order = _smallest(res.clamp_min_(0).sqrt_(), k)
+        return scores, candidates.gather(1, order)
+
+    def nearest_neighbors(self, embedding: torch.Tensor, n_neighbors: int):
+        """Drop-in for PatchcoreModel.nearest_neighbors (1-D results when n_neighbors == 1)"""
+        scores, indices = self.search(embedding, n_neighbors)
+        if n_neighbors == 1:
+            return scores[:, 0], indices[:, 0]
+        return scores, indices
+
+    def state(self) -> Dict[str, torch.Tensor]:
+        """Tensors worth persisting (none for exact search)"""
+        return {}
+
+
+class ReducedPrecisionSearch(ExactSearch):
+    """Coarse distances in bfloat16, exact re-rank of the top candidates"""
+
+    name = "bf16"
+
+    def __init__(self, bank: torch.Tensor, candidates: int = 8, chunk_size: int = 4096, dtype=torch.bfloat16):
+        super().__init__(bank, chunk_size)
+        self.dtype = dtype
+        self.candidates = max(0, candidates)
+        self.bank_low = self.bank.to(dtype)
+        self.bank_norm_low = self.bank_norm.to(dtype)
+
+    def search(self, x: torch.Tensor, k: int):
+        x = x.float()
+        scores, indices = [], []
+        for start in range(0, x.shape[0], self.chunk_size):
+            chunk = x[start:start + self.chunk_size]
+            coarse = _distances(chunk.to(self.dtype), self.bank_low, self.bank_norm_low)
+            s, i = _smallest(coarse, k + self.candidates)
+            if self.candidates:
+                s, i = self.rerank(chunk, i, k)
+            scores.append(s.float())
+            indices.append(i)
+        return torch.cat(scores), torch.cat(indices)
+
+
+class ProjectionSearch(ExactSearch):
+    """Coarse search on a Gaussian random projection, exact re-rank of the top candidates"""
+
+    name = "projection"
+    index_options = ("dim", "seed")
+
+    def __init__(self, bank: torch.Tensor, dim: int = 64, candidates: int = 32, chunk_size: int = 4096,
+                 seed: int = 0, index: Optional[Dict[str, torch.Tensor]] = None):
+        super().__init__(bank, chunk_size)
+        self.candidates = max(1, candidates)
+        if index is None:
+            generator = torch.Generator().manual_seed(seed)
+            projection = torch.randn(self.bank.shape[1], dim, generator=generator) / math.sqrt(dim)
+            projection = projection.to(self.bank.device)
+            index = {"projection": projection, "bank_projected": self.bank @ projection}
+        self.projection = index["projection"].to(self.bank.device)
+        self.bank_projected = index["bank_projected"].to(self.bank.device)
+        self.bank_projected_norm = self.bank_projected.pow(2).sum(dim=-1)
+
+    def search(self, x: torch.Tensor, k: int):
+        x = x.float()
+        scores, indices = [], []
+        for start in range(0, x.shape[0], self.chunk_size):
+            chunk = x[start:start + self.chunk_size]
+            coarse = _distances(chunk @ self.projection, self.bank_projected, self.bank_projected_norm)
+            _, candidates = _smallest(coarse, max(k, self.candidates))
+            s, i = self.rerank(chunk, candidates, k)
+            scores.append(s)
+            indices.append(i)
+        return torch.cat(scores), torch.cat(indices)
+
+    def state(self):
+        return {"projection": self.projection, "bank_projected": self.bank_projected}
+
+
+class IVFSearch(ExactSearch):
+    """Inverted file index: k-means lists, each query scans its n_probe nearest lists"""
+
+    name = "ivf"
+    index_options = ("n_lists", "iterations", "seed")
+
+    def __init__(self, bank: torch.Tensor, n_lists: Optional[int] = None, n_probe: int = 8, iterations: int = 10,
+                 chunk_size: int = 4096, seed: int = 0, index: Optional[Dict[str, torch.Tensor]] = None):
+        super().__init__(bank, chunk_size)
+        n_lists = n_lists or max(1, int(4 * math.sqrt(self.bank.shape[0])))
+        self.n_probe = max(1, n_probe)
+        if index is None:
+            index = self._build(n_lists, iterations, seed)
+        self.centroids = index["centroids"].to(self.bank.device)
+        self.order = index["order"].to(self.bank.device)
+        self.offsets = index["offsets"].tolist()
+        self.centroid_norm = self.centroids.pow(2).sum(dim=-1)
+
+    def _assign(self, vectors: torch.Tensor, centroids: torch.Tensor) -> torch.Tensor:
+        centroid_norm = centroids.pow(2).sum(dim=-1)
+        return torch.cat([
+            _distances(vectors[s:s + self.chunk_size], centroids, centroid_norm).argmin(dim=1)
+            for s in range(0, vectors.shape[0], self.chunk_size)
+        ])
+
+    def _build(self, n_lists: int, iterations: int, seed: int) -> Dict[str, torch.Tensor]:
+        """Lloyd's k-means on a sample of the bank, then bucket every bank row"""
+        generator = torch.Generator().manual_seed(seed)
+        m = self.bank.shape[0]
+        n_lists = min(n_lists, m)
+        sample = self.bank[torch.randperm(m, generator=generator)[:min(m, 64 * n_lists)].to(self.bank.device)]
+        centroids = sample[torch.randperm(sample.shape[0], generator=generator)[:n_lists].to(self.bank.device)].clone()
+        for _ in range(iterations):
+            assignment = self._assign(sample, centroids)
+            sums = torch.zeros_like(centroids).index_add_(0, assignment, sample)
+            counts = torch.bincount(assignment, minlength=n_lists).unsqueeze(1)
+            # Empty lists keep their previous centroid
+            centroids = torch.where(counts > 0, sums / counts.clamp_min(1), centroids)
+
+        assignment = self._assign(self.bank, centroids)
+        order = torch.argsort(assignment, stable=True)
+        counts = torch.bincount(assignment, minlength=n_lists)
+        offsets = torch.cat([torch.zeros(1, dtype=torch.long), counts.cumsum(0).cpu()])
+        return {"centroids": centroids, "order": order, "offsets": offsets}
+
+    def search(self, x: torch.Tensor, k: int):
+        x = x.float()
+        n = x.shape[0]
+        k_eff = min(k, self.bank.shape[0])
+        best_scores = torch.full((n, k_eff), float("inf"), device=x.device)
+        best_indices = torch.zeros((n, k_eff), dtype=torch.long, device=x.device)
+
+        probes = _smallest(_distances(x, self.centroids, self.centroid_norm), self.n_probe)[1]
+        for lst in torch.unique(probes).tolist():
+            members = self.order[self.offsets[lst]:self.offsets[lst + 1]]
+            if members.numel() == 0:
+                continue
+            rows = (probes == lst).any(dim=1).nonzero(as_tuple=True)[0]
+            scores, local = _smallest(_distances(x[rows], self.bank[members], self.bank_norm[members]), k_eff)
+            # Merge with the best found so far for these queries
+            merged_scores = torch.cat([best_scores[rows], scores], dim=1)
+            merged_indices = torch.cat([best_indices[rows], members[local]], dim=1)
+            top_scores, top = _smallest(merged_scores, k_eff)
+            best_scores[rows] = top_scores
+            best_indices[rows] = merged_indices.gather(1, top)
+
+        # The probed lists held fewer than k rows: answer those queries exactly
+        short = torch.isinf(best_scores[:, -1]).nonzero(as_tuple=True)[0]
+        if short.numel():
+            best_scores[short], best_indices[short] = super().search(x[short], k_eff)
+        return best_scores, best_indices
+
+    def state(self):
+        offsets = torch.tensor(self.offsets, dtype=torch.long)
+        return {"centroids": self.centroids, "order": self.order, "offsets": offsets}
+
+
+# -------------------------
+# Construction, persistence and installation
+# -------------------------
+def _fingerprint(bank: torch.Tensor, name: str, options: Dict) -> str:
+    """Stable id of (bank contents, backend settings) for the index file name"""
+    digest = hashlib.sha1()
+    digest.update(f"{name}:{tuple(bank.shape)}:{bank.dtype}:{sorted(options.items())}".encode())
+    step = max(1, bank.shape[0] // 256)
+    digest.update(bank[::step].detach().float().cpu().contiguous().numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+def build_backend(name: str, bank: torch.Tensor, index_dir: Optional[str] = None, **options):
+    """Create a search backend; approximate indexes are loaded from / saved to index_dir"""
+    bank = bank.detach()
+    if name == "exact":
+        return ExactSearch(bank, **options)
+    if name == "bf16":
+        return ReducedPrecisionSearch(bank, **options)
+
+    classes = {"projection": ProjectionSearch, "ivf": IVFSearch}
+    if name not in classes:
+        raise ValueError(f"Unknown kNN backend '{name}', expected one of {BACKENDS}")
+
+    path = None
+    if index_dir:
+        # Only settings that change the index itself go into its key
+        index_settings = {key: options[key] for key in classes[name].index_options if key in options}
+        path = os.path.join(index_dir, f"knn_{name}_{_fingerprint(bank, name, index_settings)}.pt")
+        if os.path.exists(path):
+            index = torch.load(path, map_location="cpu", weights_only=True)
+            return classes[name](bank, index=index, **options)
+
+    started = time.perf_counter()
+    backend = classes[name](bank, **options)
+    print(f"🔹 Built {name} kNN index over {bank.shape[0]} entries in {time.perf_counter() - started:.2f}s")
+    if path:
+        try:
+            os.makedirs(index_dir, exist_ok=True)
+            torch.save({key: value.cpu() for key, value in backend.state().items()}, path)
+        except Exception as e:
+            print(f"Warning: Could not save kNN index {path}: {e}")
+    return backend
+
+
+def options_from_env(name: str) -> Dict:
+    """Backend settings from FLARENET_KNN_* environment variables"""
+    options = {"chunk_size": int(os.environ.get("FLARENET_KNN_CHUNK", 4096))}
+    if name == "bf16":
+        options["candidates"] = int(os.environ.get("FLARENET_KNN_CANDIDATES", 8))
+    elif name == "projection":
+        options["candidates"] = int(os.environ.get("FLARENET_KNN_CANDIDATES", 32))
+        options["dim"] = int(os.environ.get("FLARENET_KNN_PROJECTION_DIM", 64))
+    elif name == "ivf":
+        options["n_lists"] = int(os.environ.get("FLARENET_KNN_IVF_LISTS", 0)) or None
+        options["n_probe"] = int(os.environ.get("FLARENET_KNN_IVF_PROBE", 8))
+    return options
+
+
+def find_memory_bank_module(model: torch.nn.Module):
+    """The submodule holding memory_bank + nearest_neighbors (PatchcoreModel), if any"""
+    for module in model.modules():
+        if hasattr(module, "nearest_neighbors") and isinstance(getattr(module, "memory_bank", None), torch.Tensor):
+            return module
+    return None
+
+
+def install_knn_backend(model: torch.nn.Module, name: str, index_dir: Optional[str] = None, **options):
+    """Route the model's nearest-neighbour search through the chosen backend"""
+    if not name or name == "native":
+        return None
+    target = find_memory_bank_module(model)
+    if target is None:
+        print(f"⚠️ kNN backend '{name}' requested but the model has no PatchCore memory bank; using native search")
+        return None
+    backend = build_backend(name, target.memory_bank, index_dir, **options)
+    # Instance attribute shadows the class method. state_dict is unchanged; pickling the model
+    # still works (a bound method of a module-level class) but carries the backend and its index along
+    target.nearest_neighbors = backend.nearest_neighbors
+    print(f"✅ kNN backend: {name} ({target.memory_bank.shape[0]} x {target.memory_bank.shape[1]} memory bank)")
+    return backend
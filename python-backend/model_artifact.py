@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Model artifact converter and loader.
+
+The pickled PatchCore object (model_weights/patchcore_model.pkl) is converted
+once into:
+    patchcore_model.pt    - state dict (backbone weights, memory bank, ...) saved with torch.save
+    patchcore_model.json  - manifest: model class, constructor kwargs, tensor summary
+
+Loading maps the .pt file with torch.load(mmap=True, weights_only=True) and
+assigns the mapped tensors straight into a freshly built module, so worker
+processes on the same host share the file's pages instead of each holding a
+private unpickled copy. The pickle is still accepted as a fallback input.
+
+Usage:
+    python model_artifact.py convert [--src PKL] [--dst-dir DIR]
+    python model_artifact.py time [--repeat N]     (cold start of each format, fresh process per run)
+"""
+
+import argparse
+import importlib
+import json
+import os
+import pickle
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Dict
+
+import torch
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+WEIGHTS_DIR = os.path.join(BASE_DIR, "model_weights")
+PICKLE_FILE = os.path.join(WEIGHTS_DIR, "patchcore_model.pkl")
+STATE_FILE = os.path.join(WEIGHTS_DIR, "patchcore_model.pt")
+MANIFEST_FILE = os.path.join(WEIGHTS_DIR, "patchcore_model.json")
+
+MANIFEST_VERSION = 1
+
+# Constructor flags that would fetch weights we are about to load from the artifact anyway
+_SKIP_DOWNLOAD_KWARGS = {"pre_trained": False, "pretrained": False}
+
+
+# -------------------------
+# Conversion
+# -------------------------
+def _init_kwargs(model) -> Dict:
+    """Constructor kwargs recorded by Lightning-style modules (hparams), if any"""
+    hparams = getattr(model, "hparams", None)
+    if not hparams:
+        return {}
+    kwargs = {}
+    for key, value in dict(hparams).items():
+        try:
+            json.dumps(value)
+        except TypeError:
+            value = str(value)
+        kwargs[key] = value
+    return kwargs
+
+
+def convert(src: str = PICKLE_FILE, dst_dir: str = WEIGHTS_DIR) -> Dict:
+    """Write <name>.pt + <name>.json next to the pickle and return the manifest"""
+    print(f"🔹 Loading pickled model from {src}...")
+    with open(src, "rb") as f:
+        model = pickle.load(f)
+
+    state = {key: tensor.detach().cpu().contiguous() for key, tensor in model.state_dict().items()}
+    name = os.path.splitext(os.path.basename(src))[0]
+    os.makedirs(dst_dir, exist_ok=True)
+    state_path = os.path.join(dst_dir, f"{name}.pt")
+    manifest_path = os.path.join(dst_dir, f"{name}.json")
+
+    torch.save(state, state_path)
+
+    cls = type(model)
+    manifest = {
+        "format_version": MANIFEST_VERSION,
+        "class": f"{cls.__module__}.{cls.__qualname__}",
+        "init_kwargs": _init_kwargs(model),
+        "state_file": os.path.basename(state_path),
+        "tensors": len(state),
+        "tensor_bytes": sum(t.numel() * t.element_size() for t in state.values()),
+        "buffers": {key: list(t.shape) for key, t in state.items() if "memory_bank" in key},
+        "torch_version": torch.__version__,
+        "source": os.path.basename(src),
+        "created": datetime.now().isoformat(),
+    }
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    print(f"✅ Wrote {state_path} ({manifest['tensor_bytes'] / 2**20:.1f} MB in {len(state)} tensors)")
+    print(f"✅ Wrote {manifest_path}")
+    return manifest
+
+
+# -------------------------
+# Loading
+# -------------------------
+def _import_class(path: str):
+    module_name, _, qualname = path.rpartition(".")
+    obj = importlib.import_module(module_name)
+    for part in qualname.split("."):
+        obj = getattr(obj, part)
+    return obj
+
+
+def _assign_resized_buffers(model: torch.nn.Module, state: Dict[str, torch.Tensor]):
+    """Install buffers whose saved shape differs from the freshly built module.
+
+    PatchCore registers its memory bank as an empty buffer and fills it during
+    fit; load_state_dict would reject the shape change, so those entries are
+    placed directly (still the memory-mapped tensors) and removed from state.
+    Returns the keys that were placed.
+    """
+    placed = set()
+    for key in list(state):
+        module_path, _, name = key.rpartition(".")
+        module = model.get_submodule(module_path) if module_path else model
+        buffer = module._buffers.get(name)
+        if buffer is not None and buffer.shape != state[key].shape:
+            module._buffers[name] = state.pop(key)
+            placed.add(key)
+    return placed
+
+
+def load_state_artifact(manifest_path: str = MANIFEST_FILE) -> torch.nn.Module:
+    """Build the model from its manifest and map its weights from disk"""
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported model manifest version: {manifest.get('format_version')}")
+
+    kwargs = dict(manifest.get("init_kwargs", {}))
+    for key, value in _SKIP_DOWNLOAD_KWARGS.items():
+        if key in kwargs:
+            kwargs[key] = value
+    model = _import_class(manifest["class"])(**kwargs)
+
+    state_path = os.path.join(os.path.dirname(manifest_path), manifest["state_file"])
+    # mmap: tensors stay backed by the file, so processes share its page cache
+    state = torch.load(state_path, map_location="cpu", mmap=True, weights_only=True)
+    placed = _assign_resized_buffers(model, state)
+    result = model.load_state_dict(state, assign=True, strict=False)
+    missing = set(result.missing_keys) - placed
+    if missing or result.unexpected_keys:
+        raise RuntimeError(f"State dict mismatch: missing {sorted(missing)}, unexpected {result.unexpected_keys}")
+    return model
+
+
+def load_model_artifact(manifest_path: str = MANIFEST_FILE, pickle_path: str = PICKLE_FILE):
+    """Load the model, preferring the mmap artifact and falling back to the pickle.
+
+    Returns (model, format, seconds).
+    """
+    started = time.perf_counter()
+    if os.path.exists(manifest_path):
+        try:
+            model = load_state_artifact(manifest_path)
+            return model, "state_dict (mmap)", time.perf_counter() - started
+        except Exception as e:
+            print(f"⚠️ Could not load model artifact {manifest_path}: {e}; falling back to pickle")
+
+    with open(pickle_path, "rb") as f:
+        model = pickle.load(f)
+    return model, "pickle", time.perf_counter() - started
+
+
+# -------------------------
+# Cold-start measurement
+# -------------------------
+def _rss_mb() -> Dict[str, float]:
+    """Private (RssAnon) and file-backed (RssFile) resident memory in MB; Linux only"""
+    usage = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("RssAnon:", "RssFile:")):
+                    key, value = line.split(":", 1)
+                    usage[key] = int(value.split()[0]) / 1024.0
+    except OSError:
+        pass
+    return usage
+
+
+def _cold_start_child(fmt: str):
+    """Runs in a fresh interpreter: load once and print seconds + memory growth as JSON"""
+    before = _rss_mb()
+    started = time.perf_counter()
+    if fmt == "state":
+        model = load_state_artifact(MANIFEST_FILE)
+    else:
+        with open(PICKLE_FILE, "rb") as f:
+            model = pickle.load(f)
+    seconds = time.perf_counter() - started
+    # Touch every tensor once, as the first forward pass would
+    for tensor in model.state_dict().values():
+        if tensor.numel():
+            tensor.sum()
+    after = _rss_mb()
+    print(json.dumps({
+        "seconds": seconds,
+        "private_mb": after.get("RssAnon", 0.0) - before.get("RssAnon", 0.0),
+        "shared_file_mb": after.get("RssFile", 0.0) - before.get("RssFile", 0.0),
+    }))
+
+
+def time_cold_start(repeat: int = 3):
+    """Compare pickle vs mmap state-dict load, each in a new process"""
+    print("📊 Model cold start (fresh process per run; import time excluded)")
+    print("=" * 60)
+    formats = [("pickle", PICKLE_FILE), ("state", MANIFEST_FILE)]
+    for fmt, path in formats:
+        if not os.path.exists(path):
+            print(f"{fmt:<10} skipped ({path} not found)")
+            continue
+        runs = []
+        for _ in range(repeat):
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "_child", fmt],
+                capture_output=True, text=True
+            )
+            if out.returncode != 0:
+                print(f"{fmt:<10} failed: {out.stderr.strip().splitlines()[-1] if out.stderr.strip() else out.returncode}")
+                break
+            runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        if not runs:
+            continue
+        best = min(runs, key=lambda r: r["seconds"])
+        print(f"{fmt:<10} best {best['seconds']:.3f}s  +{best['private_mb']:.0f} MB private  "
+              f"+{best['shared_file_mb']:.0f} MB file-backed  ({len(runs)} runs)")
+    print("=" * 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FlareNet model artifact tools")
+    sub = parser.add_subparsers(dest="command")
+
+    conv = sub.add_parser("convert", help="Convert the pickled model to state dict + manifest")
+    conv.add_argument("--src", default=PICKLE_FILE, help="Pickled model file")
+    conv.add_argument("--dst-dir", default=WEIGHTS_DIR, help="Output directory")
+
+    timing = sub.add_parser("time", help="Measure cold start of each format")
+    timing.add_argument("--repeat", type=int, default=3, help="Fresh-process runs per format")
+
+    child = sub.add_parser("_child")
+    child.add_argument("format", choices=["pickle", "state"])
+
+    args = parser.parse_args()
+    if args.command == "convert":
+        convert(args.src, args.dst_dir)
+    elif args.command == "time":
+        time_cold_start(args.repeat)
+    elif args.command == "_child":
+        _cold_start_child(args.format)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,27 @@
 import os
+import threading
+import time
 import torch
 import numpy as np
 import cv2
 from PIL import Image
-import pickle
-from collections import deque
 import json
-from typing import Dict, List
 from adaptive_params import adaptive_params
-from feedback_handler import feedback_handler
+from classifier import (
+    get_current_threshold, get_current_min_area_factor, percent_to_k, get_adaptive_k,
+    classify_anomalies_adaptive
+)
+# Feedback/parameter API lives in feedback_api (torch-free); re-exported for existing imports
+from feedback_api import (
+    process_user_feedback_api, get_current_parameters, get_feedback_statistics,
+    export_feedback_log, reset_parameters_to_default
+)
+from inference_scheduler import InferenceScheduler
+from model_artifact import load_model_artifact, MANIFEST_FILE
+from knn_search import install_knn_backend, options_from_env
+from tiling import tile_grid, fit_scale, TileStitcher
+from precision import apply_precision
+from execution_profile import execution_profile
 
 # -------------------------
 # Paths
@@ -25,248 +38,234 @@ os.makedirs(OUT_DIR, exist_ok=True)
 os.makedirs(SEGMENTED_DIR, exist_ok=True)
 os.makedirs(ANNOTATION_DIR, exist_ok=True)
 
-# -----------------------------
-# Dynamic calibration parameters
-# These read the current sensitivity from adaptive_params. percent_to_k maps our 0–100
-# -----------------------------
-def get_current_threshold():
-    """Get current adaptive threshold"""
-    return adaptive_params.get_current_percent_threshold()
-
-def get_current_min_area_factor():
-    """Get current adaptive minimum area factor"""
-    return adaptive_params.get_current_min_area_factor()
-
-# Convert percent into k value in range [1.1, 2.1]
-def percent_to_k(percent):
-    # Clamp input between 0 and 100
-    percent = max(0, min(percent, 100))
-    # Map 0% → 1.1 (very sensitive), 100% → 2.1 (least sensitive)
-    return 1.1 + (percent / 100.0) * (2.1 - 1.1)
-
-def get_adaptive_k():
-    """Get adaptive k value based on current parameters"""
-    current_threshold = get_current_threshold()
-    return percent_to_k(current_threshold)
-
 # -------------------------
-# Load model  ,a pre-trained PatchCore-like model and sets it to eval
+# Micro-batching scheduler settings
+# Concurrent single-image requests are grouped into one forward pass of up to
+# SCHEDULER_MAX_BATCH_SIZE images, waiting at most SCHEDULER_MAX_WAIT_MS for company.
 # -------------------------
-print("🔹 Loading model from saved file...")
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-with open(MODEL_FILE, "rb") as f:
-    model = pickle.load(f)
-model.eval()
-model = model.to(device)
-print("✅ Model loaded for inference.")
+SCHEDULER_MAX_BATCH_SIZE = int(os.environ.get("FLARENET_SCHEDULER_MAX_BATCH", 8))
+SCHEDULER_MAX_WAIT_MS = float(os.environ.get("FLARENET_SCHEDULER_MAX_WAIT_MS", 5))
 
 # -------------------------
-# Enhanced adaptive anomaly classification function
+# Large-frame handling
+# Frames with a side above MAX_INPUT_SIDE are either split into overlapping
+# MAX_INPUT_SIDE tiles (stitched with blended seams) or downscaled to fit.
+# At most MAX_TILES tiles are run per frame; larger frames are downscaled first.
+# MAX_INPUT_SIDE=0 disables the cap.
 # -------------------------
-def classify_anomalies_adaptive(filtered_img, anomaly_map=None):
-    """Enhanced classify_anomalies with adaptive parameters"""
-    
-    # Get current adaptive parameters
-    # Pulls adaptive params (HSV thresholds, color bands, geometric/severity rules, confidence factors).
-    hsv_params = adaptive_params.get_param("hsv_warm_thresholds")
-    color_params = adaptive_params.get_param("color_classification")
-    geom_params = adaptive_params.get_param("geometric_rules")
-    severity_params = adaptive_params.get_param("severity_rules")
-    conf_params = adaptive_params.get_param("confidence_factors")
-    
-    hsv = cv2.cvtColor(filtered_img, cv2.COLOR_RGB2HSV)
-    h, w = filtered_img.shape[:2]
-    total_area = float(w * h)
-
-    # Adaptive threshold for anomaly map
-    k_adaptive = get_adaptive_k()
-    if anomaly_map is not None:
-        thresh = anomaly_map.mean() + k_adaptive * anomaly_map.std()
-        bin_mask = anomaly_map > thresh
-    else:
-        bin_mask = np.zeros((h, w), dtype=bool)
-
-    # Warm mask with adaptive HSV thresholds 
-    mask = np.zeros((h, w), dtype=np.uint8)
-    for y in range(h):
-        for x in range(w):
-            H, S, V = hsv[y, x]
-            hC, sC, vC = H/180.0, S/255.0, V/255.0
-            
-            # Use adaptive HSV thresholds
-            warm_hue = (hC <= hsv_params["hue_low"]) or (hC >= hsv_params["hue_high"])
-            warm_sat = sC >= hsv_params["saturation_min"]
-            warm_val = vC >= hsv_params["value_min"]
-            
-            if warm_hue and warm_sat and warm_val:
-                mask[y, x] = 1
-
-    # -------------------------
-    # Ignore right-side FLIR bar and thin bars (unchanged)
-    sidebar_width = int(w * 0.10)  # right 10% width
-    mask[:, w - sidebar_width : w] = 0
-
-    max_check_width = max(1, int(w*0.06))
-    min_check_width = max(1, int(w*0.005))
-    hsv_float = hsv.astype(np.float32)
-
-    for cand_w in range(min_check_width, max_check_width+1):
-        x0 = w - cand_w
-        region = hsv_float[:, x0:w, :]
-        hue = region[...,0]
-        sat = region[...,1]
-        val = region[...,2]
-        hue_var = np.mean(np.std(hue, axis=0))
-        sat_mean = np.mean(sat)
-        val_mean = np.mean(val)
-        if sat_mean > 40 and val_mean > 120 and hue_var < 8:
-            mask[:, x0:w] = 0
-            break
-    # -------------------------
-
-    # Connected components with adaptive minimum area
-    # For each box: calculates geometry  and color ratios
-    # Classifies as Loose Joint / Full Wire Overload / Point Overload, 
-    # determines severity (red–orange fraction vs threshold), and 
-    # computes confidence from tuned factors.
-    visited = np.zeros_like(mask, dtype=bool)
-    boxes = []
-    dirs = [(1,0),(-1,0),(0,1),(0,-1)]
-    min_area_factor = get_current_min_area_factor()
-    min_area = max(32, int(w * h * min_area_factor))
-
-    for y in range(h):
-        for x in range(w):
-            if mask[y, x] and not visited[y, x]:
-                q = deque([(x,y)])
-                visited[y, x] = True
-                minX = maxX = x
-                minY = maxY = y
-                area = 0
-                while q:
-                    px, py = q.popleft()
-                    area += 1
-                    minX, maxX = min(minX, px), max(maxX, px)
-                    minY, maxY = min(minY, py), max(maxY, py)
-                    for dx, dy in dirs:
-                        nx, ny = px+dx, py+dy
-                        if 0 <= nx < w and 0 <= ny < h and mask[ny, nx] and not visited[ny, nx]:
-                            visited[ny, nx] = True
-                            q.append((nx, ny))
-                if area >= min_area:
-                    boxes.append((minX, minY, maxX-minX+1, maxY-minY+1))
-
-    # Classify boxes with adaptive parameters
-    labels = []
-    confidences = []
-    severities = []
-    
-    for (x,y,bw,bh) in boxes:
-        area_frac = (bw*bh)/total_area
-        aspect = max(bw, bh)/max(1.0, min(bw, bh))
-        
-        # Calculate overlap (unchanged)
-        center_x0, center_y0 = int(w*0.33), int(h*0.33)
-        center_x1, center_y1 = int(w*0.67), int(h*0.67)
-        ox0, oy0 = max(x, center_x0), max(y, center_y0)
-        ox1, oy1 = min(x+bw, center_x1), min(y+bh, center_y1)
-        overlap = max(0, ox1-ox0) * max(0, oy1-oy0)
-        overlap_frac = overlap/(bw*bh)
-
-        # Color analysis with adaptive thresholds
-        box_hsv = hsv[y:y+bh, x:x+bw, :].astype(np.float32)
-        H = box_hsv[...,0]  # 0..180
-        S = box_hsv[...,1]  # 0..255
-        V = box_hsv[...,2]  # 0..255
-        
-        # Use adaptive color thresholds
-        red_mask = ((H <= color_params["red_hue_max"]) | (H >= color_params["red_hue_min"])) & \
-                   (S >= color_params["color_sat_min"]) & (V >= color_params["color_val_min"])
-        orange_mask = (H > color_params["orange_hue_min"]) & (H <= color_params["orange_hue_max"]) & \
-                      (S >= color_params["color_sat_min"]) & (V >= color_params["color_val_min"])
-        yellow_mask = (H > color_params["yellow_hue_min"]) & (H <= color_params["yellow_hue_max"]) & \
-                      (S >= color_params["color_sat_min"]) & (V >= color_params["color_val_min"])
-        
-        warm_mask_local = red_mask | orange_mask | yellow_mask
-        warm_count_local = np.count_nonzero(warm_mask_local)
-        
-        if warm_count_local > 0:
-            red_orange_frac = (np.count_nonzero(red_mask | orange_mask))/float(warm_count_local)
-            yellow_frac_local = (np.count_nonzero(yellow_mask))/float(warm_count_local)
-        else:
-            red_orange_frac = 0.0
-            yellow_frac_local = 0.0
-
-        v_mean = float(np.mean(V/255.0))
-
-        # Adaptive geometric classification
-        if area_frac >= geom_params["loose_joint_area_min"] and \
-           (overlap_frac >= geom_params["loose_joint_overlap_min"] or area_frac >= geom_params["loose_joint_large_area"]):
-            base_label = "Loose Joint"
-            severity = "Faulty" if red_orange_frac >= severity_params["faulty_red_orange_threshold"] else "Potentially Faulty"
-            confidence = min(1.0, conf_params["loose_joint_base"] + conf_params["loose_joint_area_factor"] * area_frac)
-            
-        elif aspect >= geom_params["wire_aspect_ratio"]:
-            if area_frac >= geom_params["wire_overload_area"] and (yellow_frac_local >= red_orange_frac):
-                base_label = "Full Wire Overload"
-                severity = "Potentially Faulty"
-            else:
-                base_label = "Point Overload"
-                severity = "Faulty" if red_orange_frac >= severity_params["faulty_red_orange_threshold"] else "Potentially Faulty"
-            confidence = min(1.0, conf_params["wire_base"] + conf_params["wire_aspect_factor"] * aspect)
-            
-        else:
-            base_label = "Point Overload"
-            severity = "Faulty" if red_orange_frac >= severity_params["faulty_red_orange_threshold"] else "Potentially Faulty"
-            confidence = min(1.0, conf_params["point_base"] + conf_params["point_brightness_factor"] * v_mean)
-
-        labels.append(f"{base_label} ({severity})")
-        severities.append(severity)
-        confidences.append(confidence)
-
-    if not boxes:
-        return "Normal", [], [], [], []
+MAX_INPUT_SIDE = int(os.environ.get("FLARENET_MAX_INPUT_SIDE", 1024))
+LARGE_INPUT_MODE = os.environ.get("FLARENET_LARGE_INPUT_MODE", "tile").lower()
+TILE_OVERLAP = float(os.environ.get("FLARENET_TILE_OVERLAP", 0.125))
+TILE_BATCH = int(os.environ.get("FLARENET_TILE_BATCH", 4))
+MAX_TILES = int(os.environ.get("FLARENET_MAX_TILES", 36))
 
-    return None, boxes, labels, confidences, severities
+# -------------------------
+# Memory-bank search backend (see knn_search.py): native | exact | bf16 | projection | ivf
+# Approximate indexes are built on first load and cached next to the weights.
+# -------------------------
+KNN_BACKEND = os.environ.get("FLARENET_KNN_BACKEND", "native").lower()
+KNN_INDEX_DIR = os.path.dirname(MODEL_FILE)
 
+# -------------------------
+# Backbone precision (see precision.py): fp32 | bf16 | int8
+# int8 calibrates activation ranges on up to INT8_CALIBRATION_IMAGES frames
+# from INT8_CALIBRATION_DIR when the model loads.
+# -------------------------
+PRECISION = os.environ.get("FLARENET_PRECISION", "fp32").lower()
+INT8_CALIBRATION_DIR = os.environ.get("FLARENET_INT8_CALIBRATION_DIR", TEST_DIR)
+INT8_CALIBRATION_IMAGES = int(os.environ.get("FLARENET_INT8_CALIBRATION_IMAGES", 16))
 
 # -------------------------
-# API Functions for User Feedback Processing --- These bridge the APIs to the feedback/parameter system.
+# Load model  ,a pre-trained PatchCore-like model and sets it to eval
+# Loaded lazily on first inference, or explicitly via load_model() at worker
+# startup, so importing this module stays cheap. The memory-mapped artifact from
+# `python model_artifact.py convert` is preferred; the pickle is the fallback.
 # -------------------------
-def process_user_feedback_api(image_id: str, user_id: str, original_detections: List[Dict], user_corrections: List[Dict]):
-    """API endpoint to process user feedback and adapt model parameters"""
-    result = feedback_handler.process_user_feedback(image_id, user_id, original_detections, user_corrections)
-    
-    # Add current parameters to response
-    current_params = get_current_parameters()
-    result["current_threshold"] = current_params.get("percent_threshold", 50)
-    result["current_min_area_factor"] = current_params.get("min_area_factor", 0.001)
-    
-    return result
-
-def get_current_parameters():
-    """Get current adaptive parameters for debugging/monitoring"""
-    return adaptive_params.current_params
-
-def get_feedback_statistics():
-    """Get statistics about feedback received"""
-    return feedback_handler.get_feedback_statistics()
-
-def export_feedback_log(format_type: str = "json"):
-    """Export feedback log for analysis"""
-    return feedback_handler.export_feedback_log(format_type)
-
-def reset_parameters_to_default():
-    """Reset all adaptive parameters to default values"""
-    adaptive_params.current_params = adaptive_params.default_params.copy()
-    adaptive_params.save_params()
-    return {"status": "success", "message": "Parameters reset to default values"}
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+model = None
+model_precision = None
+_model_lock = threading.Lock()
+
+def calibration_frames():
+    """1x3xHxW tensors from INT8_CALIBRATION_DIR, capped at MAX_INPUT_SIDE"""
+    tensors = []
+    if not os.path.isdir(INT8_CALIBRATION_DIR):
+        return tensors
+    for img_file in sorted(os.listdir(INT8_CALIBRATION_DIR)):
+        if len(tensors) >= INT8_CALIBRATION_IMAGES:
+            break
+        if not img_file.lower().endswith(('.png', '.jpg', '.jpeg')):
+            continue
+        img_np = np.array(Image.open(os.path.join(INT8_CALIBRATION_DIR, img_file)).convert("RGB"))
+        if needs_resizing(img_np):
+            img_np = _resize_to(img_np, MAX_INPUT_SIDE / float(max(img_np.shape[:2])))
+        tensors.append(image_to_tensor(img_np))
+    return tensors
+
+def build_model(precision=None, profile=None):
+    """Fresh model from disk with the kNN backend, backbone precision and execution profile applied.
+
+    Returns (model, precision in effect).
+    """
+    print("🔹 Loading model from saved file...")
+    started = time.perf_counter()
+    loaded, fmt, _ = load_model_artifact(MANIFEST_FILE, MODEL_FILE)
+    loaded.eval()
+    loaded = loaded.to(device)
+    install_knn_backend(loaded, KNN_BACKEND, KNN_INDEX_DIR, **options_from_env(KNN_BACKEND))
+    mode = apply_precision(loaded, precision or PRECISION, device, calibration_frames)
+    loaded = (profile or execution_profile).prepare(loaded, device)
+    print(f"✅ Model loaded for inference from {fmt} ({time.perf_counter() - started:.2f}s).")
+    return loaded, mode
+
+def load_model():
+    """Load the model once per process and return it"""
+    global model, model_precision
+    if model is None:
+        with _model_lock:
+            if model is None:
+                execution_profile.apply_threads()
+                model, model_precision = build_model()
+                execution_profile.warm_up(infer_anomaly_maps)
+    return model
 
+# -------------------------
+# Inference helpers shared by the CLI and the API
+# -------------------------
+def image_to_tensor(img_np):
+    """HxWx3 uint8 RGB array -> 1x3xHxW float tensor in [0, 1] on the model device"""
+    img_tensor = torch.tensor(img_np).permute(2,0,1).unsqueeze(0).float()/255.0
+    return img_tensor.to(device)
+
+def extract_anomaly_maps(output, batch_size):
+    """Split model output into one HxW numpy anomaly map per batch item (None if absent)"""
+    if hasattr(output, 'anomaly_map'):
+        maps = output.anomaly_map
+    elif isinstance(output, (tuple, list)) and len(output) > 1:
+        maps = output[1]
+    else:
+        return [None] * batch_size
+
+    maps = maps.detach().float().cpu().numpy()
+    maps = maps.reshape(batch_size, -1, *maps.shape[-2:])[:, 0]
+    return [maps[i] for i in range(batch_size)]
+
+def infer_anomaly_maps(batch_tensor):
+    """Run one forward pass over an Nx3xHxW batch and return N anomaly maps"""
+    net = load_model()
+    with execution_profile.grad_context():
+        output = net(execution_profile.prepare_input(batch_tensor.to(device)))
+    return extract_anomaly_maps(output, batch_tensor.shape[0])
+
+def _infer_tensor_list(tensors):
+    """Scheduler batch function: stack same-shaped 1x3xHxW tensors into one pass"""
+    return infer_anomaly_maps(torch.cat(tensors, dim=0))
+
+# Shared by every request handler; submit(image_to_tensor(img)) returns a future anomaly map
+inference_scheduler = InferenceScheduler(
+    _infer_tensor_list,
+    max_batch_size=SCHEDULER_MAX_BATCH_SIZE,
+    max_wait_ms=SCHEDULER_MAX_WAIT_MS,
+)
+
+def bucket_key(img_np, bucket_step=32):
+    """Resolution bucket for an image: both sides rounded up to bucket_step"""
+    h, w = img_np.shape[:2]
+    step = max(1, bucket_step)
+    return (-(-h // step) * step, -(-w // step) * step)
+
+def infer_anomaly_maps_bucketed(images, bucket_step=32, max_batch_size=8):
+    """Anomaly maps for many RGB images, returned in input order.
+
+    Images are grouped by bucket_key, edge-padded to the bucket size and run
+    max_batch_size at a time, so each bucket chunk costs one forward pass.
+    Maps are cropped back to each image's own size.
+    """
+    buckets = {}
+    oversized = []
+    for idx, img in enumerate(images):
+        if needs_resizing(img):
+            oversized.append(idx)
+        else:
+            buckets.setdefault(bucket_key(img, bucket_step), []).append(idx)
+
+    max_batch_size = max(1, max_batch_size)
+    anomaly_maps = [None] * len(images)
+    # Frames above MAX_INPUT_SIDE go through tiling/resizing instead of a giant bucket
+    for idx in oversized:
+        anomaly_maps[idx] = infer_image(images[idx])
+    for (bh, bw), indices in buckets.items():
+        for start in range(0, len(indices), max_batch_size):
+            chunk = indices[start:start + max_batch_size]
+            padded = []
+            for idx in chunk:
+                h, w = images[idx].shape[:2]
+                # Edge-replicate so the padding looks like the image border
+                padded.append(cv2.copyMakeBorder(images[idx], 0, bh - h, 0, bw - w, cv2.BORDER_REPLICATE))
+            batch_tensor = torch.cat([image_to_tensor(img) for img in padded], dim=0)
+            for idx, amap in zip(chunk, infer_anomaly_maps(batch_tensor)):
+                h, w = images[idx].shape[:2]
+                anomaly_maps[idx] = None if amap is None else amap[:h, :w]
+    return anomaly_maps
+
+def needs_resizing(img_np) -> bool:
+    """True if the frame is above the configured maximum input side"""
+    return MAX_INPUT_SIDE > 0 and max(img_np.shape[:2]) > MAX_INPUT_SIDE
+
+def _resize_to(img_np, scale):
+    h, w = img_np.shape[:2]
+    size = (max(1, int(w * scale)), max(1, int(h * scale)))
+    return cv2.resize(img_np, size, interpolation=cv2.INTER_AREA)
+
+def _upsample_map(amap, h, w):
+    return None if amap is None else cv2.resize(amap.astype(np.float32), (w, h), interpolation=cv2.INTER_LINEAR)
+
+def infer_tiled(img_np):
+    """Anomaly map for a frame of any size, at most MAX_INPUT_SIDE pixels per side per forward pass.
+
+    Tiles share one shape, so the scheduler batches them (TILE_BATCH in flight
+    at a time keeps peak memory bounded). Maps are stitched back to full size.
+    """
+    h, w = img_np.shape[:2]
+    overlap = int(MAX_INPUT_SIDE * TILE_OVERLAP)
+
+    # Too many tiles: downscale first so work per frame stays bounded
+    scale = fit_scale(h, w, MAX_INPUT_SIDE, overlap, MAX_TILES)
+    frame = _resize_to(img_np, scale) if scale < 1.0 else img_np
+    fh, fw = frame.shape[:2]
+
+    tile_h, tile_w, positions = tile_grid(fh, fw, MAX_INPUT_SIDE, overlap)
+    stitcher = TileStitcher(fh, fw, tile_h, tile_w, overlap)
+    for start in range(0, len(positions), max(1, TILE_BATCH)):
+        wave = positions[start:start + max(1, TILE_BATCH)]
+        futures = [
+            inference_scheduler.submit(image_to_tensor(np.ascontiguousarray(frame[y:y + tile_h, x:x + tile_w])))
+            for y, x in wave
+        ]
+        for (y, x), future in zip(wave, futures):
+            tile_map = future.result()
+            if tile_map is None:
+                return None
+            stitcher.add(y, x, tile_map)
+
+    amap = stitcher.result()
+    return amap if (fh, fw) == (h, w) else _upsample_map(amap, h, w)
+
+def infer_image(img_np):
+    """Blocking anomaly map for one RGB frame, applying the large-frame policy"""
+    if not needs_resizing(img_np):
+        return inference_scheduler.infer(image_to_tensor(img_np))
+    if LARGE_INPUT_MODE == "resize":
+        h, w = img_np.shape[:2]
+        small = _resize_to(img_np, MAX_INPUT_SIDE / float(max(h, w)))
+        return _upsample_map(inference_scheduler.infer(image_to_tensor(small)), h, w)
+    return infer_tiled(img_np)
 
 if __name__ == "__main__":
 # -------------------------
 # Process all images in test folder
 # -------------------------
+    load_model()
     for img_file in os.listdir(TEST_DIR):
         if not img_file.lower().endswith(('.png', '.jpg', '.jpeg')):
             continue
@@ -278,18 +277,9 @@ if __name__ == "__main__":
 
         # Load image
         img = Image.open(TEST_IMAGE).convert("RGB")
-        img_tensor = torch.tensor(np.array(img)).permute(2,0,1).unsqueeze(0).float()/255.0
-        img_tensor = img_tensor.to(device)
-
-        # Inference
-        with torch.no_grad():
-            output = model(img_tensor)
-            if hasattr(output, 'anomaly_map'):
-                anomaly_map = output.anomaly_map.squeeze().cpu().numpy()
-            elif isinstance(output, (tuple, list)) and len(output) > 1:
-                anomaly_map = output[1].squeeze().cpu().numpy()
-            else:
-                anomaly_map = None
+
+        # Inference (large frames are tiled or downscaled, see MAX_INPUT_SIDE)
+        anomaly_map = infer_image(np.array(img))
 
         # Post-processing
         if anomaly_map is not None:
@@ -304,7 +294,9 @@ if __name__ == "__main__":
         filtered_img[bin_mask] = orig_np[bin_mask]
 
         # Classify anomalies with adaptive parameters
-        image_label, box_list, label_list, conf_list, severities = classify_anomalies_adaptive(filtered_img, anomaly_map=anomaly_map)
+        image_label, box_list, label_list, conf_list, severities = classify_anomalies_adaptive(
+            filtered_img, anomaly_map=anomaly_map, camera_id=os.environ.get("FLARENET_CAMERA_ID")
+        )
 
         # Save segmented labeled image
         segmented_img_with_labels = filtered_img.copy()
@@ -58,53 +58,50 @@ def show_current_parameters():
     for key, value in geo.items():
         print(f"  - {key}: {value}")
 
-def create_visualization():
+def create_visualization(since=None, until=None):
     """Create parameter trend visualization"""
     print("📊 Creating parameter visualization...")
     try:
-        parameter_tracker.create_visualization()
+        parameter_tracker.create_visualization(start=since, end=until)
         print("✅ Visualization created successfully!")
     except Exception as e:
         print(f"❌ Error creating visualization: {e}")
 
 def show_tracking_stats():
     """Show parameter tracking statistics"""
-    import json
     import os
     
-    json_file = os.path.join(parameter_tracker.tracking_dir, "parameter_changes.json")
+    # Counts come from the incrementally maintained summary, not the full log
+    summary = parameter_tracker.get_summary()
     
-    if not os.path.exists(json_file):
+    if not summary.get("total"):
         print("📊 No parameter changes tracked yet.")
         return
     
     try:
-        with open(json_file, 'r') as f:
-            records = json.load(f)
-        
         print(f"📊 Parameter Tracking Statistics:")
         print("=" * 50)
-        print(f"Total changes tracked: {len(records)}")
+        print(f"Total changes tracked: {summary['changes']} ({summary['total']} feedback events)")
         
-        if records:
-            feedback_types = {}
-            for record in records:
-                for fb_type in record.get("feedback_types", []):
-                    feedback_types[fb_type] = feedback_types.get(fb_type, 0) + 1
-            
-            print(f"Feedback types:")
-            for fb_type, count in feedback_types.items():
-                print(f"  - {fb_type}: {count}")
-            
-            latest = records[-1]
-            print(f"Latest change: {latest['timestamp']}")
-            print(f"Latest image: {latest['image_id']}")
+        print(f"Feedback types:")
+        for fb_type, count in summary["types"].items():
+            print(f"  - {fb_type}: {count}")
+        
+        print(f"Latest change: {summary['last']}")
+        print(f"Latest image: {summary.get('last_image')}")
+        
+        print(f"By user:")
+        for user_id, user in summary["by_user"].items():
+            print(f"  - {user_id}: {user['total']} (last {user['last']})")
+        
+        print(f"By day (last 7):")
+        for day in sorted(summary["by_day"])[-7:]:
+            print(f"  - {day}: {summary['by_day'][day]['total']}")
             
         print(f"\n📁 Files created:")
-        if os.path.exists(json_file):
-            print(f"  - {json_file}")
+        print(f"  - {parameter_tracker.history.db_path}")
         
-        csv_file = os.path.join(parameter_tracker.tracking_dir, "parameter_changes.csv")
+        csv_file = os.path.join(parameter_tracker.tracking_dir, "parameter_deltas.csv")
         if os.path.exists(csv_file):
             print(f"  - {csv_file}")
             
@@ -115,6 +112,65 @@ def show_tracking_stats():
     except Exception as e:
         print(f"❌ Error reading tracking stats: {e}")
 
+def show_history(args):
+    """List tracked changes matching the given filters (indexed lookups)"""
+    records = parameter_tracker.history.query(
+        start=args.since, end=args.until, image_id=args.image, user_id=args.user,
+        feedback_type=args.type, limit=args.limit, newest_first=True
+    )
+    print(f"📜 {len(records)} parameter change(s), newest first:")
+    print("=" * 50)
+    for record in records:
+        changed = ", ".join(change["path"] for change in record["changes"]) or "-"
+        print(f"v{record['version']}  {record['timestamp']}  image {parameter_tracker.describe(record, 'image_id')}  "
+              f"user {parameter_tracker.describe(record, 'user_id')}  "
+              f"{','.join(record['feedback_types'])}  changed: {changed}")
+
+def show_parameters_at(timestamp=None, version=None):
+    """Show the parameters that were in effect at a point in time or after a version"""
+    import json
+    if version is not None:
+        params = parameter_tracker.history.parameters_at_version(version)
+        label = f"after version {version}"
+    else:
+        params = parameter_tracker.history.parameters_at(timestamp)
+        label = f"in effect at {timestamp}"
+    if params is None:
+        print("📊 No parameter changes tracked yet.")
+        return
+    print(f"📋 Parameters {label}:")
+    print(json.dumps(params, indent=2))
+
+def replay_feedback(args):
+    """Replay a JSON-lines file of historical feedback ('-' reads stdin)"""
+    import contextlib
+    import io
+    import json
+    import sys
+    from feedback_replay import replay
+    
+    source = sys.stdin if args.replay == "-" else open(args.replay, "r", encoding="utf-8")
+    print(f"🔁 Replaying feedback from {args.replay} ...")
+    with source:
+        # The per-event processing output is only shown with --verbose
+        quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with quiet:
+            report = replay(source, args.workers, args.batch_size)
+    
+    print(f"✅ {report['applied']} record(s) applied in {report['batches']} batch(es), "
+          f"{report['adaptations']} adaptation(s); {report['invalid']} invalid, {report['failed']} failed")
+    print(f"⏱️ {report['elapsed_seconds']:.2f}s, {report['records_per_second']:.1f} records/sec "
+          f"with {report['workers']} worker(s)")
+    for error in report["errors"]:
+        print(f"  line {error['line']}: {error['error']}")
+    print(f"📋 Parameters after replay (version {report['params_version']}):")
+    print(json.dumps(report["parameters"], indent=2))
+
+def import_logs():
+    """Import parameter_changes.json/.csv into the history store"""
+    added = parameter_tracker.import_legacy_logs()
+    print(f"✅ {added} new change(s) imported; {parameter_tracker.history.count()} in history")
+
 def main():
     parser = argparse.ArgumentParser(description="FlareNet Parameter Management")
     
@@ -126,10 +182,31 @@ def main():
                        help="Create parameter trend visualization")
     parser.add_argument("--stats", action="store_true",
                        help="Show parameter tracking statistics")
+    parser.add_argument("--history", action="store_true",
+                       help="List tracked changes (filter with --since/--until/--image/--user/--type)")
+    parser.add_argument("--params-at", metavar="TIMESTAMP",
+                       help="Show the parameters in effect at an ISO timestamp")
+    parser.add_argument("--params-at-version", metavar="VERSION", type=int,
+                       help="Show the parameters right after a history version (0 = before the first change)")
+    parser.add_argument("--import-logs", action="store_true",
+                       help="Import parameter_changes.json/.csv into the history store")
+    parser.add_argument("--since", help="ISO timestamp lower bound (--history, --visualize)")
+    parser.add_argument("--until", help="ISO timestamp upper bound (--history, --visualize)")
+    parser.add_argument("--image", help="Only changes from feedback on this image_id")
+    parser.add_argument("--user", help="Only changes from this user_id")
+    parser.add_argument("--type", help="Only changes with this feedback type")
+    parser.add_argument("--limit", type=int, default=50, help="Maximum changes listed by --history")
+    parser.add_argument("--replay", metavar="FILE",
+                       help="Replay a JSON-lines file of feedback records in order (- for stdin)")
+    parser.add_argument("--workers", type=int, default=0, help="Analysis processes for --replay (0 = one per core)")
+    parser.add_argument("--batch-size", type=int, default=0,
+                       help="Records per applied batch for --replay (0 = FLARENET_REPLAY_BATCH, default 500)")
+    parser.add_argument("--verbose", action="store_true", help="Show per-record processing output for --replay")
     
     args = parser.parse_args()
     
-    if not any(vars(args).values()):
+    actions = ("reset", "show", "visualize", "stats", "history", "params_at", "params_at_version", "import_logs", "replay")
+    if not any(getattr(args, action) is not None and getattr(args, action) is not False for action in actions):
         # No arguments provided, show help
         parser.print_help()
         return
@@ -140,11 +217,26 @@ def main():
     if args.show:
         show_current_parameters()
     
+    if args.import_logs:
+        import_logs()
+    
+    if args.replay:
+        replay_feedback(args)
+    
     if args.visualize:
-        create_visualization()
+        create_visualization(args.since, args.until)
         
     if args.stats:
         show_tracking_stats()
+    
+    if args.history:
+        show_history(args)
+    
+    if args.params_at:
+        show_parameters_at(timestamp=args.params_at)
+    
+    if args.params_at_version is not None:
+        show_parameters_at(version=args.params_at_version)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
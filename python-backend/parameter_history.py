@@ -0,0 +1,444 @@
+"""
+Indexed, delta-encoded parameter-change history (SQLite, WAL mode).
+
+Each adaptation is one row holding only what changed, as nested-path deltas
+("hsv_warm_thresholds.hue_low": 0.17 -> 0.16), not full before/after copies
+of the parameter dict. Every CHECKPOINT_EVERY rows (and on the first row) the
+complete parameters_after is stored as a checkpoint, so the parameter set at
+any version (row id) or timestamp is rebuilt from the nearest checkpoint plus
+at most CHECKPOINT_EVERY deltas, never by replaying from the start.
+
+If the parameters changed outside the tracker between two records (reset,
+manual edit), the row also stores that `gap` delta, keeping the chain exact.
+
+A batch of feedback events adapts the parameters once and is stored as one
+row; the image, user and feedback types of each event go to change_events.
+The row's own image_id/user_id are set only when every event shares them.
+
+Indexes on timestamp, per-event image_id and user_id, and feedback type make
+range and per-image lookups O(log n); an append is one INSERT per table. WAL mode lets the
+API workers append while param_manager.py reads. The importer loads the old
+JSON/CSV logs and is idempotent (rows are unique per timestamp, image and user).
+"""
+
+import ast
+import copy
+import csv
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, Optional
+
+CHECKPOINT_EVERY = int(os.environ.get("FLARENET_HISTORY_CHECKPOINT_EVERY", 50))
+
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS changes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    image_id TEXT,
+    user_id TEXT,
+    feedback_types TEXT NOT NULL,
+    detection_counts TEXT NOT NULL,
+    gap TEXT,
+    changes TEXT NOT NULL,
+    checkpoint TEXT,
+    UNIQUE (timestamp, image_id, user_id)
+);
+CREATE TABLE IF NOT EXISTS change_types (
+    change_id INTEGER NOT NULL REFERENCES changes(id),
+    feedback_type TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS change_events (
+    change_id INTEGER NOT NULL REFERENCES changes(id),
+    image_id TEXT,
+    user_id TEXT,
+    feedback_types TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_changes_timestamp ON changes(timestamp);
+CREATE INDEX IF NOT EXISTS idx_changes_checkpoint ON changes(id) WHERE checkpoint IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_change_types ON change_types(feedback_type, change_id);
+CREATE INDEX IF NOT EXISTS idx_change_events ON change_events(change_id);
+CREATE INDEX IF NOT EXISTS idx_change_events_image ON change_events(image_id, change_id);
+CREATE INDEX IF NOT EXISTS idx_change_events_user ON change_events(user_id, change_id);
+"""
+
+
+# -------------------------
+# Nested-path deltas
+# -------------------------
+def diff_params(before: Dict, after: Dict, prefix: str = "") -> List[Dict]:
+    """Leaf-level differences as [{"path", "from", "to", "delta"}]; a missing side means added/removed"""
+    changes = []
+    for key in list(before) + [k for k in after if k not in before]:
+        path = f"{prefix}{key}"
+        if key not in after:
+            changes.append({"path": path, "from": before[key]})
+        elif key not in before:
+            changes.append({"path": path, "to": after[key]})
+        elif isinstance(before[key], dict) and isinstance(after[key], dict):
+            changes.extend(diff_params(before[key], after[key], path + "."))
+        elif before[key] != after[key]:
+            entry = {"path": path, "from": before[key], "to": after[key]}
+            if isinstance(before[key], (int, float)) and isinstance(after[key], (int, float)) \
+                    and not isinstance(before[key], bool) and not isinstance(after[key], bool):
+                entry["delta"] = after[key] - before[key]
+            changes.append(entry)
+    return changes
+
+
+def _apply(params: Dict, changes: List[Dict], side: str) -> Dict:
+    for change in changes:
+        *parents, leaf = change["path"].split(".")
+        node = params
+        for key in parents:
+            node = node.setdefault(key, {})
+        if side in change:
+            node[leaf] = copy.deepcopy(change[side])
+        else:
+            node.pop(leaf, None)
+    return params
+
+
+def apply_delta(params: Dict, changes: List[Dict]) -> Dict:
+    """Move `params` forward through `changes` (in place; returns it)"""
+    return _apply(params, changes, "to")
+
+
+def revert_delta(params: Dict, changes: List[Dict]) -> Dict:
+    """Move `params` back through `changes` (in place; returns it)"""
+    return _apply(params, list(reversed(changes)), "from")
+
+
+# -------------------------
+# Per-event attribution
+# -------------------------
+def _text(value) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+def record_events(record: Dict) -> List[Dict]:
+    """The feedback events behind a change record (a single-event record is its own event)"""
+    events = record.get("events")
+    if events is None:
+        events = [record]
+    return [{"image_id": _text(event.get("image_id")), "user_id": _text(event.get("user_id")),
+             "feedback_types": list(event.get("feedback_types", []))} for event in events]
+
+
+def shared_value(events: List[Dict], key: str) -> Optional[str]:
+    """events' common value for `key`, or None if they differ"""
+    values = {event[key] for event in events}
+    return values.pop() if len(values) == 1 else None
+
+
+class ParameterHistory:
+    def __init__(self, db_path: str, checkpoint_every: int = CHECKPOINT_EVERY):
+        self.db_path = db_path
+        self.checkpoint_every = max(1, checkpoint_every)
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._local = threading.local()
+        self._latest = (None, None)   # (version, parameters) cache for appends
+        self._latest_lock = threading.Lock()
+        conn = self._conn()
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            self._create_schema(conn)
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread (and per process after fork)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=10.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _create_schema(self, conn: sqlite3.Connection):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for statement in SCHEMA.strip().split(";"):
+                if statement.strip():
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    # -------------------------
+    # Reconstruction
+    # -------------------------
+    def _state_at(self, conn: sqlite3.Connection, version: int) -> Optional[Dict]:
+        """parameters_after of `version`: nearest checkpoint at or before it, then forward deltas"""
+        checkpoint = conn.execute(
+            "SELECT id, checkpoint FROM changes WHERE id <= ? AND checkpoint IS NOT NULL ORDER BY id DESC LIMIT 1",
+            (version,),
+        ).fetchone()
+        if checkpoint is None:
+            return None
+        params = json.loads(checkpoint["checkpoint"])
+        for row in conn.execute("SELECT gap, changes FROM changes WHERE id > ? AND id <= ? ORDER BY id",
+                                (checkpoint["id"], version)):
+            if row["gap"]:
+                apply_delta(params, json.loads(row["gap"]))
+            apply_delta(params, json.loads(row["changes"]))
+        return params
+
+    def _latest_state(self, conn: sqlite3.Connection):
+        """(version, parameters) of the newest row; cached between appends from this process"""
+        version = conn.execute("SELECT MAX(id) FROM changes").fetchone()[0]
+        if version is None:
+            return None, None
+        if self._latest[0] != version:
+            self._latest = (version, self._state_at(conn, version))
+        return version, copy.deepcopy(self._latest[1])
+
+    # -------------------------
+    # Writing
+    # -------------------------
+    def _insert(self, conn: sqlite3.Connection, record: Dict) -> Optional[int]:
+        before, after = record.get("parameters_before", {}), record.get("parameters_after", {})
+        previous_version, previous = self._latest_state(conn)
+        gap = diff_params(previous, before) if previous is not None else []
+        changes = diff_params(before, after)
+
+        checkpoint = previous_version is None
+        if not checkpoint:
+            last = conn.execute("SELECT MAX(id) FROM changes WHERE checkpoint IS NOT NULL").fetchone()[0] or 0
+            checkpoint = previous_version + 1 - last >= self.checkpoint_every
+
+        events = record_events(record)
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO changes (timestamp, image_id, user_id, feedback_types, detection_counts, "
+            "gap, changes, checkpoint) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                record["timestamp"],
+                shared_value(events, "image_id"),
+                shared_value(events, "user_id"),
+                json.dumps(record.get("feedback_types", [])),
+                json.dumps(record.get("detection_counts", {})),
+                json.dumps(gap) if gap else None,
+                json.dumps(changes),
+                json.dumps(after) if checkpoint else None,
+            ),
+        )
+        if not cursor.rowcount:
+            return None  # already stored
+        change_id = cursor.lastrowid
+        conn.executemany(
+            "INSERT INTO change_types (change_id, feedback_type) VALUES (?, ?)",
+            [(change_id, feedback_type) for feedback_type in record.get("feedback_types", [])],
+        )
+        self._insert_events(conn, change_id, events)
+        self._latest = (change_id, copy.deepcopy(after))
+        return change_id
+
+    @staticmethod
+    def _insert_events(conn: sqlite3.Connection, change_id: int, events: List[Dict]):
+        conn.executemany(
+            "INSERT INTO change_events (change_id, image_id, user_id, feedback_types) VALUES (?, ?, ?, ?)",
+            [(change_id, event["image_id"], event["user_id"], json.dumps(event["feedback_types"]))
+             for event in events],
+        )
+
+    def append(self, record: Dict) -> Optional[int]:
+        """Store one change record (with full parameters_before/after); returns its version.
+
+        A record covering several feedback events lists them under "events"
+        ({image_id, user_id, feedback_types} each).
+        """
+        conn = self._conn()
+        with self._latest_lock:
+            # IMMEDIATE: the previous state read and the insert form one step across processes
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = self._insert(conn, record)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                self._latest = (None, None)
+                raise
+        return version
+
+    # -------------------------
+    # Reading
+    # -------------------------
+    @staticmethod
+    def _record(row: sqlite3.Row, events: List[Dict]) -> Dict:
+        return {
+            "version": row["id"],
+            "timestamp": row["timestamp"],
+            "image_id": row["image_id"],
+            "user_id": row["user_id"],
+            "feedback_types": json.loads(row["feedback_types"]),
+            "detection_counts": json.loads(row["detection_counts"]),
+            "changes": json.loads(row["changes"]),
+            "gap": json.loads(row["gap"]) if row["gap"] else [],
+            "checkpoint": row["checkpoint"] is not None,
+            "events": events,
+        }
+
+    @staticmethod
+    def _events_for(conn: sqlite3.Connection, change_ids: List[int]) -> Dict[int, List[Dict]]:
+        events = {change_id: [] for change_id in change_ids}
+        for start in range(0, len(change_ids), 500):
+            chunk = change_ids[start:start + 500]
+            for row in conn.execute(
+                f"SELECT * FROM change_events WHERE change_id IN ({','.join('?' * len(chunk))}) ORDER BY rowid",
+                chunk,
+            ):
+                events[row["change_id"]].append({"image_id": row["image_id"], "user_id": row["user_id"],
+                                                 "feedback_types": json.loads(row["feedback_types"])})
+        return events
+
+    def query(self, start: Optional[str] = None, end: Optional[str] = None, image_id: Optional[str] = None,
+              user_id: Optional[str] = None, feedback_type: Optional[str] = None,
+              limit: Optional[int] = None, newest_first: bool = False,
+              with_parameters: bool = False) -> List[Dict]:
+        """Changes matching all given filters; start/end are ISO timestamps (inclusive)"""
+        return list(self.iter_query(start, end, image_id, user_id, feedback_type, limit, newest_first,
+                                    with_parameters))
+
+    def iter_query(self, start=None, end=None, image_id=None, user_id=None, feedback_type=None,
+                   limit=None, newest_first=False, with_parameters=False) -> Iterator[Dict]:
+        """Like query(); with_parameters adds rebuilt parameters_before/parameters_after"""
+        clauses, args = [], []
+        if start is not None:
+            clauses.append("timestamp >= ?")
+            args.append(start)
+        if end is not None:
+            clauses.append("timestamp <= ?")
+            args.append(end)
+        if image_id is not None:
+            clauses.append("id IN (SELECT change_id FROM change_events WHERE image_id = ?)")
+            args.append(str(image_id))
+        if user_id is not None:
+            clauses.append("id IN (SELECT change_id FROM change_events WHERE user_id = ?)")
+            args.append(str(user_id))
+        if feedback_type is not None:
+            clauses.append("id IN (SELECT change_id FROM change_types WHERE feedback_type = ?)")
+            args.append(feedback_type)
+        sql = "SELECT * FROM changes"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY timestamp DESC, id DESC" if newest_first else " ORDER BY timestamp, id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(int(limit))
+
+        conn = self._conn()
+        state = (None, None)  # consecutive versions are rolled forward instead of rebuilt
+        rows = conn.execute(sql, args).fetchall()
+        events = self._events_for(conn, [row["id"] for row in rows])
+        for row in rows:
+            record = self._record(row, events[row["id"]])
+            if with_parameters:
+                version, params = state
+                if version is not None and row["id"] == version + 1:
+                    params = apply_delta(apply_delta(copy.deepcopy(params), record["gap"]), record["changes"])
+                else:
+                    params = self._state_at(conn, row["id"])
+                state = (row["id"], params)
+                record["parameters_after"] = copy.deepcopy(params)
+                record["parameters_before"] = revert_delta(copy.deepcopy(params), record["changes"])
+            yield record
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM changes").fetchone()[0]
+
+    def latest(self) -> Optional[Dict]:
+        rows = self.query(limit=1, newest_first=True)
+        return rows[0] if rows else None
+
+    def parameters_at_version(self, version: int) -> Optional[Dict]:
+        """Parameters right after change `version` (0 = before the first change)"""
+        conn = self._conn()
+        if version <= 0:
+            first = conn.execute("SELECT id FROM changes ORDER BY id LIMIT 1").fetchone()
+            if first is None:
+                return None
+            row = conn.execute("SELECT changes FROM changes WHERE id = ?", (first["id"],)).fetchone()
+            return revert_delta(self._state_at(conn, first["id"]), json.loads(row["changes"]))
+        return self._state_at(conn, version)
+
+    def parameters_at(self, timestamp: str) -> Optional[Dict]:
+        """Parameters in effect at `timestamp` (after the last change at or before it)"""
+        row = self._conn().execute(
+            "SELECT id FROM changes WHERE timestamp <= ? ORDER BY timestamp DESC, id DESC LIMIT 1", (timestamp,)
+        ).fetchone()
+        return self.parameters_at_version(row["id"] if row is not None else 0)
+
+    # -------------------------
+    # Import of the old logs
+    # -------------------------
+    def _import(self, records: Iterator[Dict]) -> int:
+        conn = self._conn()
+        added = 0
+        with self._latest_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for record in records:
+                    added += self._insert(conn, record) is not None
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                self._latest = (None, None)
+                raise
+        return added
+
+    def import_json(self, json_file: str) -> int:
+        """Import the parameter_changes.json array; returns rows added"""
+        with open(json_file, "r") as f:
+            records = json.load(f)
+        return self._import(record for record in records if "timestamp" in record)
+
+    def import_csv(self, csv_file: str) -> int:
+        """Import the flattened parameter_changes.csv (wide before_/after_ columns); returns rows added"""
+        with open(csv_file, "r", newline="") as f:
+            rows = list(csv.DictReader(f))
+        return self._import({
+            "timestamp": row["timestamp"],
+            "image_id": row.get("image_id"),
+            "user_id": row.get("user_id"),
+            "feedback_types": [t for t in (row.get("feedback_types") or "").split(",") if t],
+            "detection_counts": {
+                "original": _number(row.get("original_detections")),
+                "corrected": _number(row.get("corrected_detections")),
+                "added": _number(row.get("added_detections")),
+            },
+            "parameters_before": _prefixed(row, "before_"),
+            "parameters_after": _prefixed(row, "after_"),
+        } for row in rows)
+
+    def import_legacy(self, json_file: str, csv_file: str) -> int:
+        """Import the JSON log, falling back to the CSV log if the JSON one is missing or unreadable"""
+        if os.path.exists(json_file):
+            try:
+                return self.import_json(json_file)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Warning: Could not import {json_file}: {e}")
+        if os.path.exists(csv_file):
+            return self.import_csv(csv_file)
+        return 0
+
+
+def _number(value):
+    try:
+        return json.loads(value) if value not in (None, "") else 0
+    except ValueError:
+        return value
+
+
+def _prefixed(row: Dict, prefix: str) -> Dict:
+    """CSV columns 'before_x' -> {'x': value}; nested values were written with str()"""
+    params = {}
+    for key, value in row.items():
+        if key and key.startswith(prefix) and value not in (None, ""):
+            try:
+                params[key[len(prefix):]] = ast.literal_eval(value)
+            except (ValueError, SyntaxError):
+                params[key[len(prefix):]] = value
+    return params
@@ -1,8 +1,9 @@
 """
 Parameter Tracker - Logs parameter changes with before/after states
-Provides JSON/CSV logging, visualization, and reset functionality
+Provides delta-encoded history (SQLite), CSV logging, visualization, and reset functionality
 """
 
+import copy
 import json
 import csv
 import os
@@ -10,12 +11,28 @@ from datetime import datetime
 import matplotlib.pyplot as plt
 import pandas as pd
 from typing import Dict, List, Any
+from feedback_stats import empty_summary, add_to_summary
+from file_utils import file_lock, write_json_atomic
+from parameter_history import ParameterHistory, diff_params, record_events, shared_value
 
 class ParameterTracker:
     def __init__(self, base_dir: str = "."):
         self.base_dir = base_dir
         self.tracking_dir = os.path.join(base_dir, "parameter_tracking")
         self.ensure_tracking_directory()
+        self.history = ParameterHistory(os.path.join(self.tracking_dir, "parameter_history.db"))
+        if self.history.count() == 0:
+            self.import_legacy_logs()
+        
+    def import_legacy_logs(self) -> int:
+        """Load parameter_changes.json (or .csv) into the history store; safe to repeat"""
+        added = self.history.import_legacy(
+            os.path.join(self.tracking_dir, "parameter_changes.json"),
+            os.path.join(self.tracking_dir, "parameter_changes.csv")
+        )
+        if added:
+            print(f"✅ Imported {added} parameter changes into {self.history.db_path}")
+        return added
         
     def ensure_tracking_directory(self):
         """Create tracking directory if it doesn't exist"""
@@ -27,100 +44,139 @@ class ParameterTracker:
                            params_before: Dict, 
                            params_after: Dict, 
                            feedback_type: List[str],
-                           detection_counts: Dict):
-        """Log parameter changes in both JSON and CSV formats"""
+                           detection_counts: Dict,
+                           events: List[Dict] = None):
+        """Log parameter changes to the history store and the delta CSV.
+        
+        A change made by a batch of feedback events passes them as `events`
+        ({image_id, user_id, feedback_types} each); image_id/user_id are then
+        recorded only if every event shares them.
+        """
         
         timestamp = datetime.now().isoformat()
+        events = record_events({"image_id": image_id, "user_id": user_id, "feedback_types": feedback_type,
+                                "events": events})
         
         # Create change record
         change_record = {
             "timestamp": timestamp,
-            "image_id": image_id,
-            "user_id": user_id,
+            "image_id": shared_value(events, "image_id"),
+            "user_id": shared_value(events, "user_id"),
+            "events": events,
             "feedback_types": feedback_type,
             "detection_counts": detection_counts,
-            "parameters_before": params_before.copy(),
-            "parameters_after": params_after.copy(),
+            "parameters_before": copy.deepcopy(params_before),
+            "parameters_after": copy.deepcopy(params_after),
             "changes": self._calculate_changes(params_before, params_after)
         }
         
-        # Save as JSON
-        self._save_json_log(change_record)
+        # Save to the history store (one row of nested-path deltas)
+        change_record["version"] = self.history.append(change_record)
         
         # Save to CSV
         self._save_csv_log(change_record)
         
+        # Update running statistics
+        self._update_summary(change_record)
+        
         # Print formatted output
         self._print_parameter_change(change_record)
         
         return change_record
     
-    def _calculate_changes(self, before: Dict, after: Dict) -> Dict:
-        """Calculate parameter changes"""
-        changes = {}
-        for key in before:
-            if key in after and before[key] != after[key]:
-                changes[key] = {
-                    "from": before[key],
-                    "to": after[key],
-                    "delta": after[key] - before[key] if isinstance(before[key], (int, float)) else None
-                }
-        return changes
-    
-    def _save_json_log(self, record: Dict):
-        """Save record to JSON log file"""
-        json_file = os.path.join(self.tracking_dir, "parameter_changes.json")
-        
-        # Load existing records
-        records = []
-        if os.path.exists(json_file):
-            try:
-                with open(json_file, 'r') as f:
-                    records = json.load(f)
-            except:
-                records = []
-        
-        # Add new record
-        records.append(record)
-        
-        # Save updated records
-        with open(json_file, 'w') as f:
-            json.dump(records, f, indent=2)
+    def _calculate_changes(self, before: Dict, after: Dict) -> List[Dict]:
+        """Calculate parameter changes as nested-path deltas"""
+        return diff_params(before, after)
     
     def _save_csv_log(self, record: Dict):
-        """Save record to CSV file"""
-        csv_file = os.path.join(self.tracking_dir, "parameter_changes.csv")
+        """Append one row per changed parameter to the delta CSV"""
+        csv_file = os.path.join(self.tracking_dir, "parameter_deltas.csv")
+        fieldnames = ["timestamp", "version", "image_id", "user_id", "feedback_types",
+                      "path", "from", "to", "delta"]
         
-        # Flatten record for CSV
-        flat_record = {
+        rows = [{
             "timestamp": record["timestamp"],
-            "image_id": record["image_id"], 
+            "version": record.get("version"),
+            "image_id": record["image_id"],
             "user_id": record["user_id"],
             "feedback_types": ",".join(record["feedback_types"]),
-            "original_detections": record["detection_counts"].get("original", 0),
-            "corrected_detections": record["detection_counts"].get("corrected", 0),
-            "added_detections": record["detection_counts"].get("added", 0),
-        }
-        
-        # Add parameter values
-        for param, value in record["parameters_before"].items():
-            flat_record[f"before_{param}"] = value
-            
-        for param, value in record["parameters_after"].items():
-            flat_record[f"after_{param}"] = value
-            
-        # Add changes
-        for param, change_info in record["changes"].items():
-            if change_info["delta"] is not None:
-                flat_record[f"delta_{param}"] = change_info["delta"]
+            "path": change["path"],
+            "from": json.dumps(change["from"]) if "from" in change else "",
+            "to": json.dumps(change["to"]) if "to" in change else "",
+            "delta": change.get("delta", ""),
+        } for change in record["changes"]]
+        if not rows:
+            return
         
-        # Write to CSV
         file_exists = os.path.exists(csv_file)
         with open(csv_file, 'a', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=flat_record.keys())
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
             if not file_exists:
                 writer.writeheader()
-            writer.writerow(flat_record)
+            writer.writerows(rows)
+    
+    def _summary_file(self) -> str:
+        return os.path.join(self.tracking_dir, "parameter_summary.json")
+    
+    def _count_record(self, summary: Dict, record: Dict):
+        """Count one change; users, days and feedback types are counted per event in it"""
+        events = record_events(record)
+        for event in events:
+            add_to_summary(summary, record.get("timestamp"), event["user_id"], event["feedback_types"])
+        summary["changes"] += 1
+        summary["last_image"] = events[-1]["image_id"] if events else record.get("image_id")
+    
+    def rebuild_summary(self) -> Dict:
+        """Recount the summary from the full history"""
+        summary = empty_summary()
+        summary["changes"] = 0
+        summary["last_image"] = None
+        for record in self.history.iter_query():
+            self._count_record(summary, record)
+        write_json_atomic(self._summary_file(), summary)
+        return summary
+    
+    def _update_summary(self, record: Dict):
+        """Add one record to the summary; the first call builds it from the existing log"""
+        summary_file = self._summary_file()
+        try:
+            with file_lock(summary_file + ".lock"):
+                if not os.path.exists(summary_file):
+                    # The history already contains this record
+                    self.rebuild_summary()
+                    return
+                with open(summary_file, 'r') as f:
+                    summary = json.load(f)
+                if "changes" not in summary:
+                    # Written before events were counted separately from changes
+                    self.rebuild_summary()
+                    return
+                self._count_record(summary, record)
+                write_json_atomic(summary_file, summary)
+        except Exception as e:
+            print(f"Warning: Could not update parameter summary: {e}")
+    
+    def get_summary(self) -> Dict:
+        """Counts per feedback type, user and day plus the latest change, without reading the log"""
+        summary_file = self._summary_file()
+        with file_lock(summary_file + ".lock"):
+            try:
+                with open(summary_file, 'r') as f:
+                    summary = json.load(f)
+                if "changes" in summary:
+                    return summary
+            except (OSError, ValueError):
+                pass
+            return self.rebuild_summary()
+    
+    @staticmethod
+    def describe(record: Dict, key: str) -> str:
+        """Display label for a record's image or user: the shared value, or each distinct one with the event count"""
+        events = record.get("events") or []
+        if record.get(key) is not None or len(events) <= 1:
+            return str(record.get(key))
+        values = list(dict.fromkeys(str(event[key]) for event in events))
+        return f"{len(events)} events: {', '.join(values)}"
     
     def _print_parameter_change(self, record: Dict):
         """Print formatted parameter change summary"""
@@ -128,8 +184,8 @@ class ParameterTracker:
         print(" PARAMETER CHANGE TRACKING")
         print("="*60)
         print(f" Timestamp: {record['timestamp']}")
-        print(f"  Image ID: {record['image_id']}")
-        print(f" User ID: {record['user_id']}")
+        print(f"  Image ID: {self.describe(record, 'image_id')}")
+        print(f" User ID: {self.describe(record, 'user_id')}")
         print(f" Feedback Types: {', '.join(record['feedback_types'])}")
         
         print(f"\n Detection Counts:")
@@ -139,23 +195,16 @@ class ParameterTracker:
         print(f"   Added: {counts.get('added', 0)}")
         
         print(f"\n  Parameter Changes:")
-        for param, change in record['changes'].items():
-            delta_str = f" (Δ: {change['delta']:+.4f})" if change['delta'] is not None else ""
-            print(f"   {param}: {change['from']} → {change['to']}{delta_str}")
+        for change in record['changes']:
+            delta_str = f" (Δ: {change['delta']:+.4f})" if change.get('delta') is not None else ""
+            print(f"   {change['path']}: {change.get('from', '—')} → {change.get('to', '—')}{delta_str}")
         
         print("="*60 + "\n")
     
-    def create_visualization(self):
-        """Create parameter change visualization"""
-        json_file = os.path.join(self.tracking_dir, "parameter_changes.json")
-        
-        if not os.path.exists(json_file):
-            print("No parameter changes to visualize yet.")
-            return
-            
+    def create_visualization(self, start: str = None, end: str = None):
+        """Create parameter change visualization (optionally for a time range)"""
         try:
-            with open(json_file, 'r') as f:
-                records = json.load(f)
+            records = self.history.query(start=start, end=end, with_parameters=True)
                 
             if not records:
                 print("No parameter changes to visualize yet.")
@@ -170,6 +219,8 @@ class ParameterTracker:
     def _plot_parameter_trends(self, records: List[Dict]):
         """Plot parameter trends over time"""
         df_list = []
+        # Plot only the numeric parameters that changed in this range
+        changed = sorted({c['path'] for record in records for c in record['changes'] if c.get('delta') is not None})
         
         for record in records:
             row = {
@@ -179,12 +230,15 @@ class ParameterTracker:
             }
             
             # Add parameter values
-            for param, value in record['parameters_after'].items():
-                row[param] = value
+            for path in changed:
+                value = record['parameters_after']
+                for key in path.split('.'):
+                    value = value.get(key) if isinstance(value, dict) else None
+                row[path] = value
                 
             df_list.append(row)
         
-        if not df_list:
+        if not df_list or not changed:
             return
             
         df = pd.DataFrame(df_list)
@@ -225,7 +279,7 @@ class ParameterTracker:
         from adaptive_params import adaptive_params
         
         # Store current params before reset
-        current_params = adaptive_params.current_params.copy()
+        current_params = copy.deepcopy(adaptive_params.current_params)
         
         # Reset to defaults
         adaptive_params.reset_to_defaults()
@@ -235,7 +289,7 @@ class ParameterTracker:
             "timestamp": datetime.now().isoformat(),
             "action": "RESET_TO_DEFAULTS",
             "parameters_before": current_params,
-            "parameters_after": adaptive_params.current_params.copy()
+            "parameters_after": copy.deepcopy(adaptive_params.current_params)
         }
         
         # Save reset log
@@ -0,0 +1,131 @@
+"""
+Reduced-precision execution of the PatchCore feature extractor.
+
+Only the backbone (PatchcoreModel.feature_extractor) changes precision; the
+feature pooling, embedding and memory-bank search stay in float32, so the
+nearest-neighbour distances are not rounded.
+
+    fp32  - unchanged (default)
+    bf16  - backbone under torch.autocast(bfloat16), features cast back to
+            float32. Only enabled where the hardware has native bf16 support
+            (AVX512-BF16/AMX on CPU), otherwise it is slower than fp32.
+    int8  - static post-training quantisation of the backbone (FX graph mode,
+            per-channel int8 weights, activations calibrated on sample frames).
+            CPU only.
+
+apply_precision() falls back to fp32 with a warning when a mode is not
+available, and returns the mode actually in effect.
+"""
+
+import functools
+from typing import Callable, Iterable, Optional
+
+import torch
+
+MODES = ("fp32", "bf16", "int8")
+
+
+def bf16_supported(device: torch.device) -> bool:
+    """True if bfloat16 compute is native on this device"""
+    if device.type == "cuda":
+        return torch.cuda.is_bf16_supported()
+    cpu = getattr(torch, "cpu", None)
+    checks = ("_is_avx512_bf16_supported", "_is_amx_tile_supported")
+    return any(getattr(cpu, name, lambda: False)() for name in checks)
+
+
+def find_feature_extractor(model: torch.nn.Module):
+    """(owner, feature_extractor) for the PatchCore backbone, or (None, None)"""
+    for module in model.modules():
+        extractor = getattr(module, "feature_extractor", None)
+        if isinstance(extractor, torch.nn.Module) and hasattr(module, "memory_bank"):
+            return module, extractor
+    return None, None
+
+
+def _to_float(features):
+    if isinstance(features, torch.Tensor):
+        return features.float()
+    if isinstance(features, dict):
+        return {key: value.float() for key, value in features.items()}
+    return type(features)(value.float() for value in features)
+
+
+def _bf16_forward(original: Callable, device_type: str, inputs):
+    with torch.autocast(device_type=device_type, dtype=torch.bfloat16):
+        features = original(inputs)
+    return _to_float(features)
+
+
+def enable_bf16_autocast(extractor: torch.nn.Module, device: torch.device):
+    """Run the extractor under bf16 autocast; its outputs are returned as float32"""
+    # Instance attribute shadows the class method. A partial of a module-level function
+    # (not a closure) keeps the patched model picklable; state_dict is unchanged
+    extractor.forward = functools.partial(_bf16_forward, extractor.forward, device.type)
+
+
+def quantize_int8(extractor: torch.nn.Module, calibration: Iterable[torch.Tensor]) -> torch.nn.Module:
+    """Statically quantised copy of the backbone inside the extractor.
+
+    anomalib's TimmFeatureExtractor wraps the timm network as
+    `.feature_extractor`; that inner network is traced and quantised, the
+    wrapper (layer-name mapping) is kept.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    engines = torch.backends.quantized.supported_engines
+    engine = next((e for e in ("x86", "fbgemm", "onednn", "qnnpack") if e in engines), None)
+    if engine is None:
+        raise RuntimeError("no quantized engine available")
+    torch.backends.quantized.engine = engine
+
+    calibration = list(calibration)
+    if not calibration:
+        raise RuntimeError("no calibration frames")
+
+    inner = getattr(extractor, "feature_extractor", extractor)
+    prepared = prepare_fx(inner.eval(), get_default_qconfig_mapping(engine), (calibration[0],))
+    with torch.no_grad():
+        for batch in calibration:
+            prepared(batch)
+    return convert_fx(prepared)
+
+
+def apply_precision(model: torch.nn.Module, mode: str, device: torch.device,
+                    calibration: Optional[Callable[[], Iterable[torch.Tensor]]] = None) -> str:
+    """Switch the model's backbone to `mode` in place; returns the mode in effect"""
+    mode = (mode or "fp32").lower()
+    if mode == "fp32":
+        return "fp32"
+    if mode not in MODES:
+        print(f"⚠️ Unknown precision '{mode}' (expected one of {', '.join(MODES)}); using fp32")
+        return "fp32"
+
+    owner, extractor = find_feature_extractor(model)
+    if extractor is None:
+        print(f"⚠️ Precision '{mode}' requested but the model has no PatchCore feature extractor; using fp32")
+        return "fp32"
+
+    if mode == "bf16":
+        if not bf16_supported(device):
+            print("⚠️ bf16 requested but this device has no native bfloat16 support; using fp32")
+            return "fp32"
+        enable_bf16_autocast(extractor, device)
+        print("✅ Precision: bf16 autocast for the feature extractor")
+        return "bf16"
+
+    if device.type != "cpu":
+        print("⚠️ int8 quantisation runs on CPU only; using fp32")
+        return "fp32"
+    try:
+        quantized = quantize_int8(extractor, calibration() if calibration else [])
+    except Exception as e:
+        print(f"⚠️ int8 quantisation failed ({e}); using fp32")
+        return "fp32"
+    if hasattr(extractor, "feature_extractor"):
+        extractor.feature_extractor = quantized
+    else:
+        owner.feature_extractor = quantized
+    print(f"✅ Precision: int8 feature extractor ({torch.backends.quantized.engine} engine)")
+    return "int8"
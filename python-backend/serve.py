@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Pre-fork launcher for multi-worker deployments.
+
+`uvicorn app:app --workers N` starts N independent interpreters, each loading
+its own copy of the model. This launcher loads and warms the model once in
+the parent, freezes the GC so reference counting does not dirty the shared
+pages, binds the listening socket and then forks N workers that serve
+app:app on that socket. The read-only weights stay shared copy-on-write.
+
+Torch intra-op threads are split across workers (cores // workers each, at
+least 1). The parent warms up with a single thread so no OpenMP pool exists
+at fork time.
+
+Usage:
+    python serve.py --workers 4 [--host 0.0.0.0] [--port 5000] [--threads-per-worker N]
+    python serve.py --workers 4 --report-memory 10    (print RSS/PSS per process 10s after start)
+Send SIGUSR1 to the parent for another memory report.
+"""
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+# Add current directory to path for imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+# -------------------------
+# Memory reporting
+# -------------------------
+def process_memory(pid: int):
+    """RSS, PSS, shared and private memory of one process in MB (Linux smaps_rollup)"""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1]) / 1024.0
+    except OSError:
+        return None
+    return {
+        "rss": fields.get("Rss", 0.0),
+        "pss": fields.get("Pss", 0.0),
+        "shared": fields.get("Shared_Clean", 0.0) + fields.get("Shared_Dirty", 0.0),
+        "private": fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0),
+    }
+
+
+def memory_report(pids):
+    """Print per-process memory; PSS sums to the real footprint of the group"""
+    print("📊 Memory per process (MB)")
+    print(f"{'pid':>8}{'rss':>10}{'pss':>10}{'shared':>10}{'private':>10}")
+    total_pss = 0.0
+    for label, pid in pids:
+        usage = process_memory(pid)
+        if usage is None:
+            print(f"{pid:>8}  (unavailable)")
+            continue
+        total_pss += usage["pss"]
+        print(f"{pid:>8}{usage['rss']:>10.0f}{usage['pss']:>10.0f}{usage['shared']:>10.0f}{usage['private']:>10.0f}  {label}")
+    print(f"{'total PSS':>18}{total_pss:>10.0f}")
+
+
+# -------------------------
+# Parent / worker setup
+# -------------------------
+def warm_up(size: int):
+    """Load the model and run one forward pass so lazy state exists before fork"""
+    import numpy as np
+    from model_core import load_model, infer_anomaly_maps, image_to_tensor
+
+    load_model()
+    started = time.perf_counter()
+    infer_anomaly_maps(image_to_tensor(np.zeros((size, size, 3), dtype=np.uint8)))
+    print(f"✅ Warm-up forward pass ({size}x{size}) took {time.perf_counter() - started:.2f}s")
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock: socket.socket, args):
+    """Child process: serve app:app on the inherited socket"""
+    import uvicorn
+    from app import app
+    from execution_profile import execution_profile
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+    # The parent loaded the model single-threaded; /metrics reports this worker's own count
+    execution_profile.intra_op_threads = args.threads_per_worker
+    execution_profile.apply_threads()
+
+    config = uvicorn.Config(app, log_level=args.log_level, timeout_keep_alive=args.keep_alive)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def fork_worker(sock: socket.socket, args) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(sock, args)
+        except BaseException as e:
+            print(f"❌ Worker {os.getpid()} crashed: {e}")
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="FlareNet pre-fork server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=2, help="Worker processes")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="torch intra-op threads per worker (default: execution profile, else cores // workers)")
+    parser.add_argument("--warmup-size", type=int, default=256, help="Side of the warm-up image")
+    parser.add_argument("--report-memory", type=float, default=None, metavar="SECONDS",
+                        help="Print RSS/PSS per process this many seconds after start")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--keep-alive", type=int, default=5, help="HTTP keep-alive timeout (s)")
+    args = parser.parse_args()
+    args.workers = max(1, args.workers)
+
+    import torch
+    from execution_profile import execution_profile
+    args.threads_per_worker = (args.threads_per_worker or execution_profile.intra_op_threads
+                               or max(1, cores // args.workers))
+    # Workers set their own intra-op threads after fork; the parent stays single-threaded
+    execution_profile.intra_op_threads = 1
+    torch.set_num_threads(1)
+    print(f"🔹 Parent {os.getpid()}: loading model for {args.workers} workers "
+          f"({args.threads_per_worker} torch threads each, {cores} cores)")
+    warm_up(args.warmup_size)
+
+    # Import the app (routers, caches, scheduler objects) before fork so workers share it too
+    import app  # noqa: F401
+
+    # Everything allocated so far is long-lived; keep the GC from touching (and copying) it
+    gc.collect()
+    gc.freeze()
+
+    sock = bind_socket(args.host, args.port)
+    workers = {fork_worker(sock, args): i for i in range(args.workers)}
+    print(f"✅ Serving on http://{args.host}:{args.port} with workers {sorted(workers)}")
+
+    stopping = False
+    report_requested = False
+
+    def _stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _request_report(signum, frame):
+        nonlocal report_requested
+        report_requested = True
+
+    signal.signal(signal.SIGINT, _stop)
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGUSR1, _request_report)
+
+    report_at = time.monotonic() + args.report_memory if args.report_memory is not None else None
+    while workers:
+        if report_requested or (report_at is not None and time.monotonic() >= report_at):
+            report_requested, report_at = False, None
+            memory_report([("parent", os.getpid())] + [(f"worker {i}", pid) for pid, i in sorted(workers.items())])
+
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            time.sleep(0.2)
+            continue
+
+        index = workers.pop(pid, None)
+        if index is None:
+            continue
+        if not stopping:
+            print(f"⚠️ Worker {pid} exited with status {status}; restarting")
+            workers[fork_worker(sock, args)] = index
+
+    sock.close()
+    print("👋 All workers stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import json
+import time
+
+import adaptive_params as adaptive_params_module
+from adaptive_params import AdaptiveParams
+
+
+def test_failed_flush_is_retried_without_another_save(tmp_path, monkeypatch):
+    params = AdaptiveParams()
+    params.params_file = str(tmp_path / "params.json")
+    monkeypatch.setattr(adaptive_params_module, "FLUSH_RETRY_INTERVAL", 0.05)
+
+    write = adaptive_params_module.write_json_atomic
+    attempts = []
+
+    def failing_once(path, data):
+        attempts.append(path)
+        if len(attempts) == 1:
+            raise OSError("disk full")
+        write(path, data)
+
+    monkeypatch.setattr(adaptive_params_module, "write_json_atomic", failing_once)
+    params.current_params["percent_threshold"] = 77
+    params.save_params()
+    params.flush()
+    assert params.persistence_stats()["flush_errors"] == 1
+
+    deadline = time.monotonic() + 5
+    while params.persistence_stats()["pending"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    with open(params.params_file) as f:
+        assert json.load(f)["percent_threshold"] == 77
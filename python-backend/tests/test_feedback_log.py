@@ -0,0 +1,67 @@
+import json
+import multiprocessing
+import os
+
+import pytest
+
+from feedback_log import FeedbackLog, MIGRATION_MARKER
+
+
+def _legacy(tmp_path, count=50):
+    path = tmp_path / "user_corrections.json"
+    path.write_text(json.dumps({"feedback_entries": [{"image_id": str(i)} for i in range(count)]}))
+    return str(path)
+
+
+def _migrate(log_dir, legacy_file, barrier):
+    log = FeedbackLog(log_dir)
+    barrier.wait()
+    log.migrate_legacy(legacy_file)
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_concurrent_workers_migrate_once(tmp_path):
+    legacy_file = _legacy(tmp_path, 2000)
+    log_dir = str(tmp_path / "log")
+    context = multiprocessing.get_context("fork")
+    barrier = context.Barrier(8)
+    workers = [context.Process(target=_migrate, args=(log_dir, legacy_file, barrier)) for _ in range(8)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+
+    entries = list(FeedbackLog(log_dir).iter_entries())
+    assert [entry["image_id"] for entry in entries] == [str(i) for i in range(2000)]
+
+
+def test_interrupted_migration_neither_loses_nor_duplicates(tmp_path, monkeypatch):
+    legacy_file = _legacy(tmp_path)
+    log_dir = str(tmp_path / "log")
+
+    # Crash while copying, after 10 of the 50 entries were serialised
+    dumps = json.dumps
+    calls = []
+
+    def crashing_dumps(*args, **kwargs):
+        calls.append(1)
+        if len(calls) > 10:
+            raise KeyboardInterrupt
+        return dumps(*args, **kwargs)
+
+    monkeypatch.setattr(json, "dumps", crashing_dumps)
+    with pytest.raises(KeyboardInterrupt):
+        FeedbackLog(log_dir).migrate_legacy(legacy_file)
+    monkeypatch.setattr(json, "dumps", dumps)
+    assert os.listdir(log_dir) == [MIGRATION_MARKER + ".lock"]
+    assert FeedbackLog(log_dir).migrate_legacy(legacy_file) == 50
+
+    # Crash after the copy but before the marker: the retry must not import again
+    os.remove(os.path.join(log_dir, MIGRATION_MARKER))
+    log = FeedbackLog(log_dir)
+    log.migrate_legacy(legacy_file)
+    log.append({"image_id": "new"})
+
+    entries = [entry["image_id"] for entry in FeedbackLog(log_dir).iter_entries()]
+    assert entries == [str(i) for i in range(50)] + ["new"]
+    assert os.path.exists(os.path.join(log_dir, MIGRATION_MARKER))
@@ -0,0 +1,64 @@
+import copy
+import json
+
+import pytest
+
+pytest.importorskip("matplotlib")
+pytest.importorskip("pandas")
+
+import feedback_replay
+import parameter_tracker
+from adaptive_params import adaptive_params
+from feedback_handler import feedback_handler
+from feedback_log import FeedbackLog
+from feedback_queue import feedback_queue
+from feedback_stats import FeedbackStats
+
+
+@pytest.fixture
+def tracker(tmp_path, monkeypatch):
+    """Replay against throwaway stores instead of feedback_data/ and parameter_tracking/"""
+    log = FeedbackLog(str(tmp_path / "log"))
+    monkeypatch.setattr(feedback_handler, "feedback_log", log)
+    monkeypatch.setattr(feedback_handler, "feedback_stats", FeedbackStats(log, str(tmp_path / "stats.json")))
+    monkeypatch.setattr(feedback_queue, "lock_file", str(tmp_path / "queue.lock"))
+    monkeypatch.setattr(adaptive_params, "params_file", str(tmp_path / "params.json"))
+    monkeypatch.setattr(adaptive_params, "current_params", copy.deepcopy(adaptive_params.current_params))
+    isolated = parameter_tracker.ParameterTracker(str(tmp_path))
+    monkeypatch.setattr(parameter_tracker, "parameter_tracker", isolated)
+    return isolated
+
+
+def _line(image_id, user_id):
+    box = {"x": 10, "y": 10, "width": 20, "height": 20}
+    return json.dumps({
+        "image_id": image_id,
+        "user_id": user_id,
+        "original_detections": {"anomalies": [{"bbox": box, "confidence": 0.8, "category": "Loose Joint"}]},
+        "user_corrections": {"anomalies": [{"bbox": box, "confidence": 0.8, "category": "Loose Joint",
+                                            "isDeleted": True}]},
+    })
+
+
+def test_replayed_batch_is_found_by_each_image_and_user(tracker):
+    lines = [_line(f"img-{i}", ["alice", "bob"][i % 2]) for i in range(6)]
+    report = feedback_replay.replay(lines, workers=1, batch_size=6)
+
+    assert report["applied"] == 6 and report["batches"] == 1
+    assert tracker.history.count() == 1
+    for i in range(6):
+        assert len(tracker.history.query(image_id=f"img-{i}")) == 1
+    assert len(tracker.history.query(user_id="bob")) == 1
+    assert set(tracker.get_summary()["by_user"]) == {"alice", "bob"}
+
+
+def test_record_that_breaks_analysis_is_counted_invalid(tracker):
+    bad = json.loads(_line("img-bad", "alice"))
+    # Parses fine (anomalies are objects) but analysis expects bbox to be an object
+    bad["original_detections"]["anomalies"][0]["bbox"] = [10, 10, 20, 20]
+    lines = [_line("img-0", "alice"), json.dumps(bad), _line("img-1", "bob")]
+    report = feedback_replay.replay(lines, workers=1, batch_size=3)
+
+    assert report["records"] == 3 and report["invalid"] == 1 and report["applied"] == 2
+    assert report["errors"][0]["line"] == 2
+    assert len(tracker.history.query(image_id="img-1")) == 1
@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+import feedback_stats
+from feedback_log import FeedbackLog
+from feedback_stats import FeedbackStats
+
+
+def _entry(i):
+    return {"image_id": str(i), "user_id": "alice", "timestamp": "2026-01-01T00:00:00",
+            "feedback_analysis": [{"type": "false_positive"}]}
+
+
+def test_interrupted_catch_up_resumes_without_double_counting(tmp_path, monkeypatch):
+    log = FeedbackLog(str(tmp_path / "log"))
+    log.append_many([_entry(i) for i in range(25)])
+    summary_file = str(tmp_path / "stats.json")
+    monkeypatch.setattr(feedback_stats, "CHECKPOINT_LINES", 10)
+
+    # Crash while counting line 15: lines 1-10 were checkpointed with their position
+    stats = FeedbackStats(log, summary_file)
+    count = stats._count
+    counted = []
+
+    def crashing_count(entry):
+        if len(counted) == 14:
+            raise KeyboardInterrupt
+        counted.append(entry)
+        count(entry)
+
+    monkeypatch.setattr(stats, "_count", crashing_count)
+    with pytest.raises(KeyboardInterrupt):
+        stats.refresh()
+    with open(summary_file) as f:
+        assert json.load(f)["total"] == 10
+
+    # The interrupted instance resumes from its in-memory position, a fresh one from the checkpoint
+    monkeypatch.setattr(stats, "_count", count)
+    assert stats.summary()["total"] == 25
+    assert FeedbackStats(log, summary_file).summary()["total"] == 25
@@ -0,0 +1,99 @@
+import asyncio
+import io
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+from fastapi import HTTPException, UploadFile
+from PIL import Image
+
+import classifier
+import inference_api
+
+
+def _png(seed: int) -> bytes:
+    pixels = np.random.default_rng(seed).integers(0, 256, size=(32, 32, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _fake_bucketed(images, bucket_step, max_batch_size):
+    return [np.zeros(img.shape[:2], dtype=np.float32) for img in images]
+
+
+def test_batch_larger_than_the_limit_is_admitted_in_chunks(monkeypatch):
+    monkeypatch.setattr(inference_api, "ANALYZE_MAX_PENDING", 2)
+    admitted = []
+
+    def fake_bucketed(images, bucket_step, max_batch_size):
+        admitted.append((len(images), inference_api._analyze_pending))
+        return _fake_bucketed(images, bucket_step, max_batch_size)
+
+    monkeypatch.setattr(inference_api, "infer_anomaly_maps_bucketed", fake_bucketed)
+    uploads = [UploadFile(file=io.BytesIO(_png(100 + seed)), filename=f"{seed}.png") for seed in range(5)]
+
+    response = asyncio.run(inference_api.analyze_batch(uploads, camera_id=None))
+    assert response.status_code == 200
+    assert [size for size, _ in admitted] == [2, 2, 1]
+    assert all(pending <= 2 for _, pending in admitted)
+    assert inference_api._analyze_pending == 0
+
+
+def test_batch_chunk_without_free_slots_gets_503(monkeypatch):
+    monkeypatch.setattr(inference_api, "ANALYZE_MAX_PENDING", 2)
+    monkeypatch.setattr(inference_api, "_analyze_pending", 1)
+    monkeypatch.setattr(inference_api, "infer_anomaly_maps_bucketed", _fake_bucketed)
+    uploads = [UploadFile(file=io.BytesIO(_png(200 + seed)), filename=f"{seed}.png") for seed in range(3)]
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(inference_api.analyze_batch(uploads, camera_id=None))
+    assert error.value.status_code == 503
+    assert error.value.headers["Retry-After"] == str(inference_api.ANALYZE_RETRY_AFTER)
+    assert inference_api._analyze_pending == 1
+
+
+def test_slot_is_released_when_the_request_is_cancelled(monkeypatch):
+    # Inference never finishes, as if the client disconnected while waiting for the model
+    monkeypatch.setattr(inference_api.inference_scheduler, "submit", lambda item: Future())
+
+    async def run():
+        upload = UploadFile(file=io.BytesIO(_png(7)), filename="7.png")
+        task = asyncio.create_task(inference_api.analyze(upload))
+        while inference_api._analyze_pending == 0:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(asyncio.wait_for(run(), timeout=30))
+    assert inference_api._analyze_pending == 0
+
+
+def test_batch_results_do_not_answer_single_image_requests(monkeypatch):
+    monkeypatch.setattr(inference_api, "infer_anomaly_maps_bucketed", _fake_bucketed)
+    data = _png(11)
+    image_hash = inference_api.hashlib.sha256(data).hexdigest()
+
+    upload = UploadFile(file=io.BytesIO(data), filename="11.png")
+    response = asyncio.run(inference_api.analyze_batch([upload], camera_id=None))
+    assert response.status_code == 200
+
+    # Padded batch maps live under their own key; /analyze must still run the model
+    version = inference_api._result_cache_version
+    assert inference_api.map_cache.get(image_hash) is None
+    assert inference_api._cached_result(image_hash, version) is None
+    assert inference_api.map_cache.get(inference_api._batch_key(image_hash)) is not None
+    assert inference_api._cached_result(inference_api._batch_key(image_hash), version) is not None
+
+
+def test_camera_id_reaches_the_sidebar_detector(monkeypatch):
+    monkeypatch.setattr(inference_api, "infer_anomaly_maps_bucketed", _fake_bucketed)
+    seen = []
+    detect = classifier.sidebar_detector.detect
+    monkeypatch.setattr(classifier.sidebar_detector, "detect",
+                        lambda hsv, camera_id=None: seen.append(camera_id) or detect(hsv, camera_id))
+
+    uploads = [UploadFile(file=io.BytesIO(_png(300 + seed)), filename=f"{seed}.png") for seed in range(2)]
+    asyncio.run(inference_api.analyze_batch(uploads, camera_id="flir-7"))
+    assert seen == ["flir-7", "flir-7"]
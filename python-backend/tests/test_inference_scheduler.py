@@ -0,0 +1,34 @@
+from inference_scheduler import InferenceScheduler
+
+
+def _double(items):
+    return [item * 2 for item in items]
+
+
+def test_cancelled_future_is_skipped_and_worker_survives():
+    # A long wait keeps both submissions in the same batch
+    scheduler = InferenceScheduler(_double, max_batch_size=2, max_wait_ms=2000)
+    cancelled = scheduler.submit(1)
+    assert cancelled.cancel()
+    kept = scheduler.submit(2)
+
+    assert kept.result(timeout=5) == 4
+    assert cancelled.cancelled()
+
+    # The worker thread is still serving
+    assert scheduler.infer(3, timeout=5) == 6
+    stats = scheduler.stats()
+    assert stats["cancelled"] == 1
+    assert stats["completed"] == 2
+    assert stats["batch_size_histogram"] == {1: 2}
+
+
+def test_batch_error_reaches_every_caller():
+    def fail(items):
+        raise RuntimeError("boom")
+
+    scheduler = InferenceScheduler(fail, max_batch_size=2, max_wait_ms=2000)
+    futures = [scheduler.submit(1), scheduler.submit(2)]
+    for future in futures:
+        assert isinstance(future.exception(timeout=5), RuntimeError)
+    assert scheduler.stats()["failed"] == 2
@@ -0,0 +1,59 @@
+import io
+
+import torch
+
+from knn_search import ExactSearch, IVFSearch, install_knn_backend
+
+
+def test_ivf_falls_back_to_exact_when_probed_lists_are_short():
+    generator = torch.Generator().manual_seed(0)
+    bank = torch.randn(200, 16, generator=generator)
+    queries = torch.randn(50, 16, generator=generator)
+
+    # ~4 rows per list, so one probed list can never supply 9 neighbours
+    ivf = IVFSearch(bank, n_lists=50, n_probe=1)
+    scores, indices = ivf.search(queries, 9)
+    exact_scores, exact_indices = ExactSearch(bank).search(queries, 9)
+
+    assert torch.isfinite(scores).all()
+    short = [lst for lst in range(50) if ivf.offsets[lst + 1] - ivf.offsets[lst] < 9]
+    assert short
+    probes = ivf._assign(queries, ivf.centroids)
+    for row in range(queries.shape[0]):
+        if probes[row].item() in short:
+            assert torch.equal(indices[row], exact_indices[row])
+            assert torch.allclose(scores[row], exact_scores[row])
+
+
+def test_ivf_probing_every_list_matches_exact_search():
+    generator = torch.Generator().manual_seed(1)
+    bank = torch.randn(300, 8, generator=generator)
+    queries = torch.randn(40, 8, generator=generator)
+
+    scores, _ = IVFSearch(bank, n_lists=10, n_probe=10).search(queries, 3)
+    exact_scores, _ = ExactSearch(bank).search(queries, 3)
+    assert torch.allclose(scores, exact_scores, atol=1e-5)
+
+
+class _PatchcoreLike(torch.nn.Module):
+    def __init__(self, bank):
+        super().__init__()
+        self.register_buffer("memory_bank", bank)
+
+    def nearest_neighbors(self, embedding, n_neighbors):
+        raise AssertionError("native search should be replaced")
+
+
+def test_model_with_installed_backend_survives_pickling():
+    bank = torch.randn(64, 8, generator=torch.Generator().manual_seed(2))
+    model = torch.nn.Sequential(_PatchcoreLike(bank))
+    install_knn_backend(model, "exact")
+
+    buffer = io.BytesIO()
+    torch.save(model, buffer)
+    buffer.seek(0)
+    restored = torch.load(buffer, weights_only=False)
+
+    queries = torch.randn(5, 8)
+    assert set(restored.state_dict()) == set(model.state_dict())
+    assert torch.equal(restored[0].nearest_neighbors(queries, 1)[0], model[0].nearest_neighbors(queries, 1)[0])
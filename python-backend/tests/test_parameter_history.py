@@ -0,0 +1,60 @@
+import pytest
+
+from parameter_history import ParameterHistory
+
+
+def _batch_record(timestamp, events, before, after):
+    return {
+        "timestamp": timestamp,
+        "events": events,
+        "feedback_types": [t for event in events for t in event["feedback_types"]],
+        "detection_counts": {},
+        "parameters_before": before,
+        "parameters_after": after,
+    }
+
+
+def test_batch_record_is_queryable_per_event(tmp_path):
+    history = ParameterHistory(str(tmp_path / "history.db"))
+    events = [
+        {"image_id": "img-1", "user_id": "alice", "feedback_types": ["false_positive"]},
+        {"image_id": "img-2", "user_id": "bob", "feedback_types": ["false_negative"]},
+        {"image_id": "img-3", "user_id": "alice", "feedback_types": ["false_positive"]},
+    ]
+    version = history.append(_batch_record("2026-01-01T00:00:00", events, {"k": 1}, {"k": 2}))
+    history.append(_batch_record("2026-01-02T00:00:00",
+                                 [{"image_id": "img-9", "user_id": "carol", "feedback_types": ["edit"]}],
+                                 {"k": 2}, {"k": 3}))
+
+    assert history.count() == 2
+    for image_id in ("img-1", "img-2", "img-3"):
+        assert [r["version"] for r in history.query(image_id=image_id)] == [version]
+    assert [r["version"] for r in history.query(user_id="bob")] == [version]
+    assert len(history.query(user_id="alice")) == 1
+    assert history.query(image_id="img-1,img-2") == []
+
+    record = history.query(image_id="img-2")[0]
+    assert record["image_id"] is None and record["user_id"] is None
+    assert record["events"] == events
+    single = history.query(user_id="carol")[0]
+    assert (single["image_id"], single["user_id"]) == ("img-9", "carol")
+
+
+def test_tracker_summary_counts_each_event_user(tmp_path):
+    pytest.importorskip("matplotlib")
+    pytest.importorskip("pandas")
+    from parameter_tracker import ParameterTracker
+
+    tracker = ParameterTracker(str(tmp_path))
+    tracker.log_parameter_change(
+        image_id=None, user_id=None, params_before={"k": 1}, params_after={"k": 2},
+        feedback_type=["false_positive", "false_negative"], detection_counts={},
+        events=[{"image_id": "img-1", "user_id": "alice", "feedback_types": ["false_positive"]},
+                {"image_id": "img-2", "user_id": "bob", "feedback_types": ["false_negative"]}],
+    )
+    summary = tracker.get_summary()
+    assert summary["changes"] == 1
+    assert summary["total"] == 2
+    assert set(summary["by_user"]) == {"alice", "bob"}
+    assert summary["last_image"] == "img-2"
+    assert tracker.rebuild_summary()["by_user"] == summary["by_user"]
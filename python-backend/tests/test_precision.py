@@ -0,0 +1,30 @@
+import io
+
+import torch
+
+from precision import enable_bf16_autocast
+
+
+class _Extractor(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.layer = torch.nn.Linear(4, 4)
+
+    def forward(self, inputs):
+        return {"layer": self.layer(inputs)}
+
+
+def test_bf16_patched_extractor_survives_pickling():
+    extractor = _Extractor()
+    enable_bf16_autocast(extractor, torch.device("cpu"))
+
+    buffer = io.BytesIO()
+    torch.save(extractor, buffer)
+    buffer.seek(0)
+    restored = torch.load(buffer, weights_only=False)
+
+    inputs = torch.randn(2, 4)
+    features = restored(inputs)["layer"]
+    assert features.dtype == torch.float32
+    assert torch.allclose(features, extractor(inputs)["layer"])
+    assert set(restored.state_dict()) == set(extractor.state_dict())
@@ -0,0 +1,89 @@
+import copy
+
+import cv2
+import numpy as np
+import pytest
+
+from adaptive_params import ParamSnapshot, adaptive_params
+from benchmark import reference_classify, reference_components, reference_warm_mask
+from classifier import classify_anomalies_adaptive
+from thermal_ops import build_warm_mask, build_warm_mask_cutoffs, find_components, sidebar_detector
+
+SIZES = [(48, 64), (90, 120), (120, 160)]
+SEEDS = [0, 1, 2]
+
+# Thresholds that fall between 8-bit levels, where rounding mistakes would show
+FRACTIONAL = {
+    "min_area_factor": 0.00123,
+    "hsv_warm_thresholds": {"hue_low": 0.1234, "hue_high": 0.9321, "saturation_min": 0.3517, "value_min": 0.4983},
+    "color_classification": {"red_hue_max": 10.5, "red_hue_min": 159.5, "orange_hue_min": 10.5,
+                             "orange_hue_max": 24.7, "yellow_hue_min": 24.7, "yellow_hue_max": 35.2,
+                             "color_sat_min": 99.5, "color_val_min": 119.9},
+}
+
+
+def _params():
+    params = copy.deepcopy(adaptive_params.default_params)
+    for key, value in FRACTIONAL.items():
+        if isinstance(value, dict):
+            params[key].update(value)
+        else:
+            params[key] = value
+    return params
+
+
+def _frame(seed, size, sidebar):
+    """Noise with warm blobs and, optionally, a FLIR-style colour bar on the right edge"""
+    rng = np.random.default_rng(seed)
+    h, w = size
+    frame = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+    for _ in range(6):
+        color = [(255, 0, 0), (255, 110, 0), (255, 230, 0)][int(rng.integers(0, 3))]
+        center = (int(rng.integers(0, w)), int(rng.integers(0, h)))
+        axes = (int(rng.integers(3, max(4, w // 5))), int(rng.integers(3, max(4, h // 5))))
+        cv2.ellipse(frame, center, axes, float(rng.integers(0, 180)), 0, 360, color, -1)
+    if sidebar:
+        frame[:, w - max(2, w // 25):] = (255, 60, 0)
+    return frame
+
+
+FRAMES = [(seed, size, sidebar) for seed in SEEDS for size in SIZES for sidebar in (False, True)]
+
+
+@pytest.mark.parametrize("seed,size,sidebar", FRAMES)
+def test_warm_mask_matches_reference(seed, size, sidebar):
+    params = _params()
+    hsv = cv2.cvtColor(_frame(seed, size, sidebar), cv2.COLOR_RGB2HSV)
+    expected = reference_warm_mask(hsv, params["hsv_warm_thresholds"])
+
+    assert np.array_equal(build_warm_mask(hsv, params["hsv_warm_thresholds"]), expected)
+    assert np.array_equal(build_warm_mask_cutoffs(hsv, ParamSnapshot(-1, params).warm_cutoffs), expected)
+
+
+@pytest.mark.parametrize("seed,size,sidebar", FRAMES)
+def test_components_match_reference(seed, size, sidebar):
+    params = _params()
+    hsv = cv2.cvtColor(_frame(seed, size, sidebar), cv2.COLOR_RGB2HSV)
+    mask = reference_warm_mask(hsv, params["hsv_warm_thresholds"])
+    min_area = max(8, int(size[0] * size[1] * params["min_area_factor"]))
+
+    _, components = find_components(mask, min_area)
+    assert [component["bbox"] for component in components] == reference_components(mask, min_area)
+
+
+@pytest.mark.parametrize("seed,size,sidebar", FRAMES)
+def test_classification_matches_reference(seed, size, sidebar):
+    params = _params()
+    frame = _frame(seed, size, sidebar)
+    # Detected bar widths are cached per resolution; the reference scans every frame
+    sidebar_detector.clear()
+
+    status, boxes, labels, confidences, severities = classify_anomalies_adaptive(frame, params=params)
+    ref_status, ref_boxes, ref_labels, ref_confidences, ref_severities = reference_classify(frame, params)
+
+    assert status == ref_status
+    assert boxes == ref_boxes
+    assert labels == ref_labels
+    assert severities == ref_severities
+    # Mean brightness comes from float64 summed-area tables instead of a float32 mean
+    assert confidences == pytest.approx(ref_confidences, abs=1e-6)
@@ -0,0 +1,270 @@
+"""
+Thermal image operations used by classify_anomalies_adaptive.
+
+Whole-array versions of the per-pixel checks in model_core. Everything here
+works on the uint8 HSV image produced by cv2.cvtColor(..., COLOR_RGB2HSV)
+(H in 0..179, S and V in 0..255) and does not depend on torch.
+"""
+
+import io
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import cv2
+from PIL import Image
+from typing import Dict, Optional
+
+# OpenCV 8-bit HSV ranges
+HUE_LEVELS = 180
+CHANNEL_LEVELS = 256
+
+
+def decode_image_bytes(data) -> np.ndarray:
+    """Decode encoded image bytes (JPEG/PNG/...) into an HxWx3 uint8 RGB array.
+
+    Works on bytes, bytearray or memoryview without touching the disk. PIL is
+    used (rather than cv2.imdecode) so pixels match the previous
+    Image.open(path).convert("RGB") path exactly.
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        return np.array(img.convert("RGB"))
+
+
+def warm_lookup_tables(hsv_params: Dict):
+    """Build per-channel boolean lookup tables for the warm-pixel test.
+
+    Each table is evaluated with exactly the same float expression as the
+    original per-pixel loop (H/180.0, S/255.0, V/255.0 compared against the
+    adaptive thresholds), so indexing with the uint8 channel values gives
+    bit-identical results to the loop.
+    """
+    hue = np.arange(CHANNEL_LEVELS, dtype=np.float64) / 180.0
+    level = np.arange(CHANNEL_LEVELS, dtype=np.float64) / 255.0
+
+    # Hue band wraps around red: warm if below hue_low OR above hue_high
+    hue_lut = (hue <= hsv_params["hue_low"]) | (hue >= hsv_params["hue_high"])
+    sat_lut = level >= hsv_params["saturation_min"]
+    val_lut = level >= hsv_params["value_min"]
+    return hue_lut, sat_lut, val_lut
+
+
+def build_warm_mask(hsv: np.ndarray, hsv_params: Dict) -> np.ndarray:
+    """Return the uint8 (0/1) warm-pixel mask for an HSV image.
+
+    Equivalent to:
+        warm_hue = (H/180 <= hue_low) or (H/180 >= hue_high)
+        warm_sat = S/255 >= saturation_min
+        warm_val = V/255 >= value_min
+    evaluated for every pixel.
+    """
+    hue_lut, sat_lut, val_lut = warm_lookup_tables(hsv_params)
+
+    # Map each channel through its 0/1 table, then AND the three masks
+    hue, sat, val = cv2.split(hsv)
+    hue_mask = cv2.LUT(hue, hue_lut.astype(np.uint8))
+    sat_mask = cv2.LUT(sat, sat_lut.astype(np.uint8))
+    val_mask = cv2.LUT(val, val_lut.astype(np.uint8))
+
+    mask = cv2.bitwise_and(hue_mask, sat_mask)
+    return cv2.bitwise_and(mask, val_mask, dst=mask)
+
+
+def _in_ranges(hsv: np.ndarray, hue_ranges, sat_min: int, val_min: int) -> np.ndarray:
+    """0/255 mask of pixels inside any inclusive hue range and above sat/val minima"""
+    mask = np.zeros(hsv.shape[:2], dtype=np.uint8)
+    if sat_min > 255 or val_min > 255:
+        return mask
+    for lo, hi in hue_ranges:
+        if lo <= hi:
+            cv2.bitwise_or(mask, cv2.inRange(hsv, (lo, sat_min, val_min), (hi, 255, 255)), dst=mask)
+    return mask
+
+
+def build_warm_mask_cutoffs(hsv: np.ndarray, warm_cutoffs: Dict) -> np.ndarray:
+    """Same mask as build_warm_mask, from the integer cut-offs of a ParamSnapshot"""
+    mask = _in_ranges(
+        hsv,
+        [(0, warm_cutoffs["hue_max"]), (warm_cutoffs["hue_min"], 255)],
+        warm_cutoffs["sat_min"],
+        warm_cutoffs["val_min"],
+    )
+    return np.bitwise_and(mask, 1, out=mask)
+
+
+def find_components(mask: np.ndarray, min_area: int):
+    """4-connected components of a 0/1 mask with per-component statistics.
+
+    Runs cv2.connectedComponentsWithStats once and keeps components with at
+    least ``min_area`` pixels. Returns ``(labels, components)`` where labels is
+    the int32 label image and each component is a dict with:
+        label    - label value in ``labels``
+        bbox     - (x, y, width, height)
+        area     - pixel count
+        centroid - (cx, cy)
+
+    Components are ordered by their first pixel in raster order, the same
+    order the old BFS scan discovered them in.
+    """
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(
+        mask.astype(np.uint8, copy=False), connectivity=4, ltype=cv2.CV_32S
+    )
+
+    # Filter on area in one shot; label 0 is background
+    kept = np.flatnonzero(stats[1:count, cv2.CC_STAT_AREA] >= min_area) + 1
+
+    components = []
+    for label in kept.tolist():
+        area = int(stats[label, cv2.CC_STAT_AREA])
+        x = int(stats[label, cv2.CC_STAT_LEFT])
+        y = int(stats[label, cv2.CC_STAT_TOP])
+        bw = int(stats[label, cv2.CC_STAT_WIDTH])
+        bh = int(stats[label, cv2.CC_STAT_HEIGHT])
+        # First pixel of the component sits on its top row
+        first_x = x + int(np.argmax(labels[y, x:x + bw] == label))
+        components.append(((y, first_x), {
+            "label": label,
+            "bbox": (x, y, bw, bh),
+            "area": area,
+            "centroid": (float(centroids[label, 0]), float(centroids[label, 1])),
+        }))
+
+    components.sort(key=lambda item: item[0])
+    return labels, [comp for _, comp in components]
+
+
+class ColorStats:
+    """Constant-time colour statistics for any box of an HSV image.
+
+    The image is classified into the red / orange / yellow bands once (using
+    the integer ``color_bands`` of a ParamSnapshot), and summed-area tables are built for the
+    warm (red|orange|yellow), red|orange and yellow masks and for the V
+    channel. Each box query is then four lookups per table instead of a
+    rescan of the box pixels.
+    """
+
+    def __init__(self, hsv: np.ndarray, color_bands: Dict):
+        # Saturation/value gate shared by all colour bands
+        sat_min, val_min = color_bands["sat_min"], color_bands["val_min"]
+        red_orange = _in_ranges(hsv, color_bands["red"] + color_bands["orange"], sat_min, val_min)
+        yellow = _in_ranges(hsv, color_bands["yellow"], sat_min, val_min)
+        warm = cv2.bitwise_or(red_orange, yellow)
+
+        self.height, self.width = hsv.shape[:2]
+        # inRange masks are 0/255; bring them to 0/1 so the tables hold pixel counts
+        self.warm_sat = cv2.integral(np.bitwise_and(warm, 1, out=warm))
+        self.red_orange_sat = cv2.integral(np.bitwise_and(red_orange, 1, out=red_orange))
+        self.yellow_sat = cv2.integral(np.bitwise_and(yellow, 1, out=yellow))
+        # float64 keeps V sums exact for any realistic image size
+        self.value_sat = cv2.integral(hsv[..., 2], sdepth=cv2.CV_64F)
+
+    @staticmethod
+    def _box_sum(table: np.ndarray, x: int, y: int, bw: int, bh: int):
+        """Sum of the source pixels in [y, y+bh) x [x, x+bw)"""
+        return table[y + bh, x + bw] - table[y, x + bw] - table[y + bh, x] + table[y, x]
+
+    def box_stats(self, x: int, y: int, bw: int, bh: int) -> Dict:
+        """Colour fractions and mean brightness for one box.
+
+        Returns:
+            warm_count        - pixels in any of the red/orange/yellow bands
+            red_orange_frac   - red|orange share of the warm pixels
+            yellow_frac_local - yellow share of the warm pixels
+            v_mean            - mean V of the box in 0..1
+        """
+        # Clip to the image like numpy slicing does
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(self.width, x + bw), min(self.height, y + bh)
+        bw, bh = max(0, x1 - x0), max(0, y1 - y0)
+        if bw == 0 or bh == 0:
+            return {"warm_count": 0, "red_orange_frac": 0.0, "yellow_frac_local": 0.0, "v_mean": 0.0}
+
+        warm_count = int(self._box_sum(self.warm_sat, x0, y0, bw, bh))
+        if warm_count > 0:
+            red_orange_frac = int(self._box_sum(self.red_orange_sat, x0, y0, bw, bh)) / float(warm_count)
+            yellow_frac_local = int(self._box_sum(self.yellow_sat, x0, y0, bw, bh)) / float(warm_count)
+        else:
+            red_orange_frac = 0.0
+            yellow_frac_local = 0.0
+
+        v_mean = float(self._box_sum(self.value_sat, x0, y0, bw, bh)) / (255.0 * bw * bh)
+        return {
+            "warm_count": warm_count,
+            "red_orange_frac": red_orange_frac,
+            "yellow_frac_local": yellow_frac_local,
+            "v_mean": v_mean,
+        }
+
+
+class SidebarDetector:
+    """Detects the FLIR colour-scale bar on the right edge of a frame.
+
+    A candidate strip of width ``cand_w`` (0.5%..6% of the image width) is a
+    bar when its mean saturation > 40, mean value > 120 and the mean of its
+    per-column hue std < 8; the narrowest matching width wins. Per-column
+    sums and hue stds of the widest strip are computed once and accumulated
+    from the right edge, so every candidate width is scored in a single pass.
+
+    Detected widths are cached per (height, width, camera) so repeat frames
+    from the same FLIR unit skip detection.
+    """
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _candidate_range(w: int):
+        return max(1, int(w*0.005)), max(1, int(w*0.06))
+
+    def detect_uncached(self, hsv: np.ndarray) -> int:
+        """Return the detected bar width in pixels, or 0 if there is none"""
+        h, w = hsv.shape[:2]
+        min_check_width, max_check_width = self._candidate_range(w)
+        max_check_width = min(max_check_width, w)
+        if min_check_width > max_check_width:
+            return 0
+
+        # Rightmost columns first, so cumulative sums run from the edge inwards
+        strip = hsv[:, w - max_check_width:, :][:, ::-1, :]
+        hue_std = np.cumsum(strip[..., 0].std(axis=0, dtype=np.float64))
+        sat_sum = np.cumsum(strip[..., 1].sum(axis=0, dtype=np.int64))
+        val_sum = np.cumsum(strip[..., 2].sum(axis=0, dtype=np.int64))
+
+        widths = np.arange(1, max_check_width + 1)
+        hue_var = hue_std / widths
+        sat_mean = sat_sum / (h * widths)
+        val_mean = val_sum / (h * widths)
+
+        is_bar = (sat_mean > 40) & (val_mean > 120) & (hue_var < 8)
+        is_bar[:min_check_width - 1] = False
+        if not is_bar.any():
+            return 0
+        return int(widths[np.argmax(is_bar)])
+
+    def detect(self, hsv: np.ndarray, camera_id: Optional[str] = None) -> int:
+        """Cached bar width for this resolution/camera, detecting on a miss"""
+        key = (hsv.shape[0], hsv.shape[1], camera_id)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        bar_width = self.detect_uncached(hsv)
+        # Only remember positive detections; a frame without a visible bar
+        # should not stop later frames from the same camera being checked
+        if bar_width:
+            with self._lock:
+                self._cache[key] = bar_width
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        return bar_width
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+# Global instance for use across modules
+sidebar_detector = SidebarDetector()
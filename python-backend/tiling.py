@@ -0,0 +1,74 @@
+"""
+Tile layout and seam blending for inference on large frames.
+
+A frame larger than the maximum input side is covered by equally sized,
+overlapping tiles (the last row/column is aligned to the image edge, so every
+tile has the same shape and tiles batch together). Per-tile anomaly maps are
+stitched with weights that ramp down across the overlap, so seams blend
+instead of showing a step. Pure NumPy/OpenCV; no torch needed.
+"""
+
+import math
+from typing import List, Tuple
+
+import numpy as np
+
+
+def tile_starts(length: int, tile: int, overlap: int) -> List[int]:
+    """Start offsets covering [0, length) with tiles of size ``tile``"""
+    if length <= tile:
+        return [0]
+    stride = max(1, tile - overlap)
+    count = math.ceil((length - tile) / stride) + 1
+    starts = [min(i * stride, length - tile) for i in range(count)]
+    return sorted(set(starts))
+
+
+def tile_grid(h: int, w: int, max_side: int, overlap: int) -> Tuple[int, int, List[Tuple[int, int]]]:
+    """(tile_h, tile_w, [(y, x), ...]) for an h x w frame"""
+    tile_h, tile_w = min(h, max_side), min(w, max_side)
+    positions = [(y, x) for y in tile_starts(h, tile_h, overlap) for x in tile_starts(w, tile_w, overlap)]
+    return tile_h, tile_w, positions
+
+
+def fit_scale(h: int, w: int, max_side: int, overlap: int, max_tiles: int) -> float:
+    """Largest downscale factor (<= 1) whose tile grid has at most max_tiles tiles"""
+    scale = 1.0
+    while max_tiles > 0:
+        sh, sw = max(1, int(h * scale)), max(1, int(w * scale))
+        if len(tile_grid(sh, sw, max_side, overlap)[2]) <= max_tiles:
+            break
+        scale *= 0.9
+    return scale
+
+
+def _ramp(length: int, overlap: int) -> np.ndarray:
+    """1-D weights: 1 in the middle, falling linearly over ``overlap`` pixels at both ends (never 0)"""
+    idx = np.arange(length, dtype=np.float32)
+    if overlap <= 0:
+        return np.ones(length, dtype=np.float32)
+    edge = np.minimum(idx + 1, length - idx) / float(overlap + 1)
+    return np.minimum(edge, 1.0)
+
+
+def blend_weights(tile_h: int, tile_w: int, overlap: int) -> np.ndarray:
+    """Separable seam-blending window for one tile"""
+    return np.outer(_ramp(tile_h, overlap), _ramp(tile_w, overlap))
+
+
+class TileStitcher:
+    """Weighted average of overlapping tile maps into one h x w map"""
+
+    def __init__(self, h: int, w: int, tile_h: int, tile_w: int, overlap: int):
+        self.total = np.zeros((h, w), dtype=np.float32)
+        self.weight = np.zeros((h, w), dtype=np.float32)
+        self.window = blend_weights(tile_h, tile_w, overlap)
+
+    def add(self, y: int, x: int, tile_map: np.ndarray):
+        th, tw = tile_map.shape[:2]
+        window = self.window[:th, :tw]
+        self.total[y:y + th, x:x + tw] += tile_map * window
+        self.weight[y:y + th, x:x + tw] += window
+
+    def result(self) -> np.ndarray:
+        return self.total / np.maximum(self.weight, 1e-8)